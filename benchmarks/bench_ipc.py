@@ -0,0 +1,128 @@
+"""Per-move overhead of asking a bot in another process for its move.
+
+Compares sending the `State` over a pipe, pickled or as JSON, with the
+shared-memory board of botbattle.channel. The bot answers at once, so the
+round trip is all overhead.
+
+    python -m benchmarks.bench_ipc --moves 5000
+"""
+
+import argparse
+import multiprocessing
+import random
+import statistics
+import time
+
+from botbattle import GameConfig, PlayerAbstract, Side, State
+from botbattle.channel import BoardChannel
+
+CONFIGS = [
+    GameConfig(),
+    GameConfig(board_width=15, board_height=15, win_length=6),
+]
+
+
+class FirstFreeColumnPlayer(PlayerAbstract):
+    def make_move(self, state: State) -> int:
+        return next(i for i in range(state.len_x()) if not state.column_full(i))
+
+
+def serve_pickle(conn):
+    player = FirstFreeColumnPlayer(Side.RED)
+    while (state := conn.recv()) is not None:
+        conn.send(player.make_move(state))
+
+
+def serve_json(conn):
+    player = FirstFreeColumnPlayer(Side.RED)
+    while data := conn.recv_bytes():
+        conn.send(player.make_move(State.parse_raw(data)))
+
+
+def half_full(config: GameConfig) -> State:
+    state = config.initial_state()
+    for _ in range(config.board_width * config.board_height // 2):
+        state.drop_token(
+            random.choice([i for i in range(state.len_x()) if not state.column_full(i)])
+        )
+    return state
+
+
+def time_moves(request, state: State, moves: int) -> list[float]:
+    times = []
+    for _ in range(moves):
+        start = time.perf_counter()
+        request(state)
+        times.append((time.perf_counter() - start) * 1e6)
+    return times
+
+
+def pipe(target, send, state: State, moves: int) -> list[float]:
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=target, args=(child,))
+    process.start()
+
+    def request(state):
+        send(parent, state)
+        return parent.recv()
+
+    try:
+        request(state)
+        return time_moves(request, state, moves)
+    finally:
+        send(parent, None)
+        process.join()
+
+
+def shared_memory(state: State, moves: int) -> list[float]:
+    channel = BoardChannel(state.len_x(), state.len_y())
+    process = multiprocessing.Process(
+        target=channel.serve, args=(FirstFreeColumnPlayer(Side.RED),)
+    )
+    process.start()
+
+    try:
+        channel.request_move(state, timeout=5)
+        return time_moves(lambda state: channel.request_move(state, 5), state, moves)
+    finally:
+        channel.close()
+        process.join()
+        channel.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--moves", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    modes = {
+        "pickle over pipe": lambda state, moves: pipe(
+            serve_pickle, lambda conn, state: conn.send(state), state, moves
+        ),
+        "json over pipe": lambda state, moves: pipe(
+            serve_json,
+            lambda conn, state: conn.send_bytes(
+                state.json().encode() if state else b""
+            ),
+            state,
+            moves,
+        ),
+        "shared memory": shared_memory,
+    }
+
+    print(f"{'board':>8} {'mode':>18} {'p50 us':>8} {'p99 us':>8} {'mean us':>8}")
+    for config in CONFIGS:
+        state = half_full(config)
+        board = f"{config.board_width}x{config.board_height}"
+
+        for mode, func in modes.items():
+            times = sorted(func(state, args.moves))
+            print(
+                f"{board:>8} {mode:>18} {statistics.median(times):8.1f} "
+                f"{times[int(len(times) * 0.99)]:8.1f} {statistics.mean(times):8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""/leaderboard/ latency as the number of saved results grows.
+
+Seeds bots and their results into a fresh SQLite file (or --database-uri)
+in steps, and at each step compares a leaderboard grouped from `participants`
+with a page of the in-memory leaderboard, which the standings keep up to
+date as results are saved.
+
+    python -m benchmarks.bench_leaderboard --bots 1000 --results 1000000
+"""
+
+import argparse
+import os
+import random
+import time
+from logging import getLogger
+from uuid import uuid4
+
+from .bench_part_info import best_of
+
+RESULTS = ["victory", "loss", "tie", "crashed", "opponent_crashed"]
+
+
+def seed_bots(bots: int) -> list[int]:
+    from common.database import Base, SessionLocal, engine
+    from common.models import Bot, BotStanding
+
+    Base.metadata.create_all(engine)
+
+    with SessionLocal.begin() as db:
+        rows = [Bot(token=str(uuid4()), suspended=False) for _ in range(bots)]
+        db.add_all(rows)
+        db.flush()
+        bot_ids = [bot.id for bot in rows]
+
+        for bot_id in bot_ids:
+            standing = BotStanding(bot_id)
+            standing.rating = random.gauss(1500, 200)
+            db.add(standing)
+
+    return bot_ids
+
+
+def seed_results(bot_ids: list[int], results: int):
+    from common.database import SessionLocal
+    from common.models import Participant
+
+    with SessionLocal.begin() as db:
+        db.bulk_insert_mappings(
+            Participant,
+            [
+                {
+                    "bot_id": random.choice(bot_ids),
+                    "game_id": uuid4(),
+                    "side": i % 2,
+                    "result": random.choice(RESULTS),
+                }
+                for i in range(results)
+            ],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, default=1000)
+    parser.add_argument("--results", type=int, default=1_000_000)
+    parser.add_argument(
+        "--database-uri", default=f"sqlite:///bench-leaderboard-{int(time.time())}.db"
+    )
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URI"] = args.database_uri
+
+    from common.database import SessionLocal
+    from common.leaderboard import load_entries
+    from common.models import Participant
+    from dispatcher.dispatcher import app, leaderboard
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+
+    getLogger().setLevel("WARNING")
+
+    random.seed(0)
+    bot_ids = seed_bots(args.bots)
+    with SessionLocal() as db:
+        leaderboard.replace(load_entries(db))
+    client = TestClient(app)
+
+    def group_by():
+        with SessionLocal() as db:
+            db.query(
+                Participant.bot_id, Participant.result, func.count(Participant.id)
+            ).group_by(Participant.bot_id, Participant.result).all()
+
+    def endpoint():
+        client.get("/leaderboard/", params={"offset": 100}).raise_for_status()
+
+    print(f"{'results':>10} {'group by ms':>12} {'endpoint ms':>12}")
+
+    seeded = 0
+    step = 10_000
+    while seeded < args.results:
+        seed_results(bot_ids, min(step, args.results) - seeded)
+        seeded = min(step, args.results)
+
+        print(
+            f"{seeded:10} {best_of(group_by, 3) * 1000:12.2f} "
+            f"{best_of(endpoint) * 1000:12.2f}"
+        )
+        step *= 10
+
+
+if __name__ == "__main__":
+    main()
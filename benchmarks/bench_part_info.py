@@ -0,0 +1,142 @@
+"""/get_part_info/ latency deep in a bot's history.
+
+Seeds one bot with many results into a fresh SQLite file (or --database-uri)
+and compares keyset pages at growing depth with OFFSET paging, plus the
+endpoint latency and the cost of a revalidated (304) request.
+
+    python -m benchmarks.bench_part_info --results 200000
+"""
+
+import argparse
+import os
+import time
+from logging import getLogger
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+PAGE = 20
+
+
+def seed(results: int, token: str) -> int:
+    from common.database import Base, SessionLocal, engine
+    from common.models import Bot, Participant
+
+    Base.metadata.create_all(engine)
+
+    with SessionLocal.begin() as db:
+        bot = Bot(token=token, suspended=False)
+        db.add(bot)
+        db.flush()
+        bot_id = bot.id
+
+    start = datetime(2024, 1, 1)
+    with SessionLocal.begin() as db:
+        db.bulk_insert_mappings(
+            Participant,
+            [
+                {
+                    "bot_id": bot_id,
+                    "game_id": uuid4(),
+                    # several games per second, like a busy bot
+                    "created_at": start + timedelta(seconds=i // 4),
+                    "side": i % 2,
+                    "result": "victory" if i % 3 else "loss",
+                }
+                for i in range(results)
+            ],
+        )
+
+    return bot_id
+
+
+def best_of(func, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, default=200_000)
+    parser.add_argument(
+        "--database-uri", default=f"sqlite:///bench-part-info-{int(time.time())}.db"
+    )
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URI"] = args.database_uri
+
+    from common.database import SessionLocal
+    from common.models import Participant
+    from dispatcher.dispatcher import app, encode_cursor
+    from fastapi.testclient import TestClient
+    from sqlalchemy import tuple_
+
+    getLogger().setLevel("WARNING")
+
+    token = str(uuid4())
+    bot_id = seed(args.results, token)
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(app)
+
+    print(
+        f"{'depth (rows)':>12} {'keyset ms':>10} {'offset ms':>10} {'endpoint ms':>12}"
+    )
+
+    depth = PAGE
+    while depth < args.results:
+        with SessionLocal() as db:
+            row = (
+                db.query(Participant.created_at, Participant.id)
+                .filter_by(bot_id=bot_id)
+                .order_by(Participant.created_at.desc(), Participant.id.desc())
+                .offset(depth - 1)
+                .first()
+            )
+        cursor = encode_cursor(row.created_at, row.id)
+
+        endpoint = best_of(
+            lambda: client.get(
+                "/get_part_info/", params={"cursor": cursor}, headers=headers
+            ).raise_for_status()
+        )
+
+        def page(keyset: bool):
+            with SessionLocal() as db:
+                query = (
+                    db.query(Participant)
+                    .filter_by(bot_id=bot_id)
+                    .filter(Participant.result != None)
+                    .order_by(Participant.created_at.desc(), Participant.id.desc())
+                )
+                if keyset:
+                    query = query.filter(
+                        tuple_(Participant.created_at, Participant.id)
+                        < tuple_(row.created_at, row.id)
+                    )
+                else:
+                    query = query.offset(depth)
+                query.limit(PAGE).all()
+
+        print(
+            f"{depth:12} {best_of(lambda: page(True)) * 1000:10.2f} "
+            f"{best_of(lambda: page(False)) * 1000:10.2f} {endpoint * 1000:12.2f}"
+        )
+        depth *= 10
+
+    etag = client.get("/get_part_info/", headers=headers).headers["ETag"]
+    not_modified = best_of(
+        lambda: client.get(
+            "/get_part_info/", headers={**headers, "If-None-Match": etag}
+        )
+    )
+    first_page = best_of(lambda: client.get("/get_part_info/", headers=headers))
+    print(
+        f"\nfirst page: {first_page * 1000:.2f} ms, 304: {not_modified * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
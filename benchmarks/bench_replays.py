@@ -0,0 +1,120 @@
+"""Storage size and fetch latency of replays against per-ply state rows.
+
+Plays random games, stores each one both as `states` rows and as a replay
+record in separate SQLite files, then fetches every game both ways.
+
+    python -m benchmarks.bench_replays --games 1000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from uuid import uuid4
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+from botbattle import Replay, Side, State  # noqa: E402
+from common.database import Base  # noqa: E402
+from common.models import ReplayModel, StateModel  # noqa: E402
+
+
+def random_game() -> list[State]:
+    state = State(next_side=Side.BLUE)
+    states = [state.copy(deep=True)]
+    while not state.winners():
+        state.drop_token(
+            random.choice([i for i in range(state.len_x()) if not state.column_full(i)])
+        )
+        states.append(state.copy(deep=True))
+    return states
+
+
+def timed_ms(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    games = {uuid4(): random_game() for _ in range(args.games)}
+    plies = sum(len(states) for states in games.values())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        states_engine = create_engine(f"sqlite:///{tmp}/states.db")
+        replays_engine = create_engine(f"sqlite:///{tmp}/replays.db")
+        for engine in [states_engine, replays_engine]:
+            Base.metadata.create_all(engine)
+
+        with Session(states_engine) as db, db.begin():
+            for game_id, states in games.items():
+                db.add_all(
+                    StateModel(game_id, i, state.board, state.next_side.value)
+                    for i, state in enumerate(states)
+                )
+
+        with Session(replays_engine) as db, db.begin():
+            for game_id, states in games.items():
+                winners = states[-1].winners()
+                replay = Replay.from_states(
+                    game_id, states, winners[0] if len(winners) == 1 else None
+                )
+                db.add(ReplayModel(game_id=game_id, data=replay.to_bytes()))
+
+        sizes = {
+            name: os.path.getsize(f"{tmp}/{name}.db") for name in ["states", "replays"]
+        }
+
+        states_db, replays_db = Session(states_engine), Session(replays_engine)
+
+        def fetch_states(game_id):
+            rows = (
+                states_db.query(StateModel)
+                .filter_by(game_id=game_id)
+                .order_by(StateModel.serial_no_within_game)
+                .all()
+            )
+            return [State(board=row.board, next_side=row.next_side) for row in rows]
+
+        def fetch_replay(game_id):
+            data = (
+                replays_db.query(ReplayModel.data).filter_by(game_id=game_id).scalar()
+            )
+            return Replay.from_bytes(data)
+
+        latencies = {"states rows": [], "replay": [], "replay + boards": []}
+        for game_id in games:
+            latencies["states rows"].append(timed_ms(lambda: fetch_states(game_id)))
+            latencies["replay"].append(timed_ms(lambda: fetch_replay(game_id)))
+            latencies["replay + boards"].append(
+                timed_ms(lambda: list(fetch_replay(game_id).states()))
+            )
+
+        states_db.close()
+        replays_db.close()
+
+    print(f"{args.games} games, {plies / args.games:.1f} states per game")
+    for name, size in sizes.items():
+        print(f"{name:>8}: {size / 1024:9.0f} KiB, {size / args.games:7.0f} B/game")
+
+    print(f"\n{'fetch':>16} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, values in latencies.items():
+        values.sort()
+        print(
+            f"{name:>16} {statistics.median(values):8.3f} "
+            f"{values[int(len(values) * 0.95)]:8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Query latency as the games history grows, with and without states retention.
+
+Simulates `--days` days of games. After each simulated day it runs the
+retention job (in the "retention" mode) and times the queries the services
+run on every game or round.
+
+    python -m benchmarks.bench_retention --games-per-day 5000 --days 30
+    python -m benchmarks.bench_retention --games-per-day 150000 --days 30  # ~100M states
+
+Each mode uses a fresh SQLite file unless --database-uri points elsewhere.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from logging import getLogger
+from uuid import uuid4
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+os.environ.setdefault("RUNNER_URL", "http://localhost:8201/")
+os.environ.setdefault("DISPATCHER_URL", "http://localhost:8200")
+
+from botbattle import Code, Replay, Side, State  # noqa: E402
+from common import retention  # noqa: E402
+from common.database import Base, SessionLocal  # noqa: E402
+from common.models import (  # noqa: E402
+    Bot,
+    CodeVersion,
+    Game,
+    Participant,
+    ReplayModel,
+    StateModel,
+    save_code,
+)
+from common.replays import load_replay  # noqa: E402
+from scheduler.scheduler import bots_with_not_enough_games  # noqa: E402
+from sqlalchemy import create_engine, insert  # noqa: E402
+
+BOTS = 50
+STATES_PER_GAME = 22
+
+
+def sample_boards() -> list[list]:
+    state = State(next_side=Side.BLUE)
+    boards = []
+    for i in range(STATES_PER_GAME):
+        boards.append(state.copy(deep=True).board)
+        state.drop_token(i % state.len_x())
+    return boards
+
+
+def seed_bots(db, start: datetime):
+    code_hash = save_code(db, Code(source="class Player: ...", cls_name="Player"))
+    for bot_id in range(1, BOTS + 1):
+        db.add(Bot(id=bot_id, token=str(uuid4()), suspended=False))
+        version = CodeVersion(bot_id, code_hash)
+        version.created_at = start
+        db.add(version)
+
+
+def add_day(db, day: datetime, games: int, boards: list[list]) -> list:
+    game_rows, part_rows, state_rows, replay_rows = [], [], [], []
+    moves = [i % len(boards[0][0]) for i in range(len(boards) - 1)]
+
+    for _ in range(games):
+        game_id = uuid4()
+        created_at = day + timedelta(seconds=random.randrange(86400))
+        blue, red = random.sample(range(1, BOTS + 1), 2)
+
+        game_rows.append({"id": game_id, "created_at": created_at})
+        # the dispatcher saves a replay next to the states of every new game
+        replay_rows.append(
+            {
+                "game_id": game_id,
+                "created_at": created_at,
+                "data": Replay(game_id=game_id, moves=moves).to_bytes(),
+            }
+        )
+        for bot_id, side, result in [(blue, 1, "victory"), (red, 0, "loss")]:
+            part_rows.append(
+                {
+                    "game_id": game_id,
+                    "bot_id": bot_id,
+                    "side": side,
+                    "result": result,
+                    "created_at": created_at,
+                }
+            )
+        for i, board in enumerate(boards):
+            state_rows.append(
+                {
+                    "game_id": game_id,
+                    "serial_no_within_game": i,
+                    "board": board,
+                    "next_side": i % 2,
+                    "created_at": created_at,
+                }
+            )
+
+    db.execute(insert(Game), game_rows)
+    db.execute(insert(Participant), part_rows)
+    db.execute(insert(StateModel), state_rows)
+    db.execute(insert(ReplayModel), replay_rows)
+
+    return [row["id"] for row in game_rows]
+
+
+def best_of_ms(func, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def run(mode: str, database_uri: str, args):
+    SessionLocal.configure(bind=create_engine(database_uri))
+    Base.metadata.create_all(SessionLocal.kw["bind"])
+
+    random.seed(0)
+    boards = sample_boards()
+    start = datetime(2024, 1, 1)
+
+    with SessionLocal.begin() as db:
+        seed_bots(db, start)
+
+    print(f"\n{mode}")
+    print(
+        f"{'day':>4} {'states':>11} {'compact s':>9} {'result lookup ms':>16} "
+        f"{'schedule ms':>11} {'replay ms':>9} {'first game replay ms':>20}"
+    )
+
+    first_game = None
+    for day in range(args.days):
+        today = start + timedelta(days=day)
+        with SessionLocal.begin() as db:
+            game_ids = add_day(db, today, args.games_per_day, boards)
+        first_game = first_game or game_ids[0]
+
+        compact_time = 0.0
+        if mode == "retention":
+            compact_start = time.perf_counter()
+            retention.compact_states(args.retention_days, now=today + timedelta(days=1))
+            compact_time = time.perf_counter() - compact_start
+
+        with SessionLocal() as db:
+            states = db.query(StateModel).count()
+            game_id = random.choice(game_ids)
+
+            result_lookup = best_of_ms(
+                lambda: db.query(Participant).filter_by(game_id=game_id).all()
+            )
+            schedule = best_of_ms(lambda: bots_with_not_enough_games(db).all())
+            replay = best_of_ms(lambda: load_replay(db, game_id))
+            old_replay = best_of_ms(lambda: load_replay(db, first_game))
+
+        print(
+            f"{day + 1:4} {states:11,} {compact_time:9.2f} {result_lookup:16.2f} "
+            f"{schedule:11.2f} {replay:9.2f} {old_replay:20.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games-per-day", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--retention-days", type=float, default=3)
+    parser.add_argument("--database-uri", help="with {mode} in it, e.g. .../{mode}")
+    args = parser.parse_args()
+
+    getLogger().setLevel("WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ["no retention", "retention"]:
+            uri = (
+                args.database_uri.format(mode=mode.replace(" ", "_"))
+                if args.database_uri
+                else f"sqlite:///{tmp}/{mode.replace(' ', '_')}.db"
+            )
+            run(mode, uri, args)
+
+
+if __name__ == "__main__":
+    main()
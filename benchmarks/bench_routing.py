@@ -0,0 +1,225 @@
+"""Code cache hit rates and throughput of several runners, by how games are routed.
+
+Starts --runners runner processes on this host with caches of --cache-size
+versions, and a stand-in dispatcher that serves --versions bot versions.
+Each version plays --games-per-version games as blue against a small pool
+of --opponents versions, in the order the scheduler's rounds submit them.
+The games go to the runners either by the scheduler's consistent hash of
+the blue code (`hash`) or to any runner, like a load balancer would
+(`random`). Each mode gets fresh runners, and reports the hit rates of
+their code and compiled code caches, read from their /metrics, and the
+games played per second.
+
+    python -m benchmarks.bench_routing --runners 3 --versions 120
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from logging import getLogger
+from uuid import uuid4
+
+import httpx
+from botbattle import Code, RunGameTask
+from runner.benchmark import (
+    JSON_HEADERS,
+    free_port,
+    mock_dispatcher,
+    serve_in_thread,
+    stop_server,
+)
+from scheduler.routing import HashRing
+
+from .loadtest import PLAYER_SOURCE
+
+METRIC = re.compile(
+    r'^botbattle_(code_lookups)_total\{outcome="(hit|miss)"\} (\S+)$'
+    r"|^botbattle_compiled_code_(hits|misses) (\S+)$",
+    re.MULTILINE,
+)
+
+
+def start_runners(count: int, cache_size: int) -> list[tuple[subprocess.Popen, str]]:
+    runners = []
+    for _ in range(count):
+        port = free_port()
+        env = {
+            **os.environ,
+            "LOG_LEVEL": "WARNING",
+            # runners don't start without one, the mock dispatcher doesn't check it
+            "INTERNAL_TOKEN": os.environ.get("INTERNAL_TOKEN") or uuid4().hex,
+            "RUNNER_OUTBOX": os.path.join(tempfile.mkdtemp(), "outbox.db"),
+            "CODE_MEMORY_CACHE_SIZE": str(cache_size),
+            "COMPILED_CODE_CACHE_SIZE": str(cache_size),
+        }
+        env.pop("CODE_CACHE_DIR", None)
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "runner.runner:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            env=env,
+        )
+        runners.append((process, f"http://127.0.0.1:{port}/"))
+
+    for _, url in runners:
+        wait_until_up(url)
+    return runners
+
+
+def wait_until_up(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url + "capacity").raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def cache_stats(urls: list[str]) -> dict[str, float]:
+    totals = {"hit": 0.0, "miss": 0.0, "hits": 0.0, "misses": 0.0}
+    for url in urls:
+        for match in METRIC.finditer(httpx.get(url + "metrics").text):
+            _, outcome, value, compiled, compiled_value = match.groups()
+            if outcome:
+                totals[outcome] += float(value)
+            else:
+                totals[compiled] += float(compiled_value)
+
+    def rate(hits: float, misses: float) -> float:
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    return {
+        "code_hit_rate": rate(totals["hit"], totals["miss"]),
+        "compiled_hit_rate": rate(totals["hits"], totals["misses"]),
+    }
+
+
+def make_tasks(codes: list[Code], args, callback: str, code_url: str):
+    opponents = codes[: args.opponents]
+    return [
+        RunGameTask(
+            game_id=uuid4(),
+            callback=callback,
+            code_url=code_url,
+            blue_code=blue.digest(),
+            red_code=random.choice(
+                [code for code in opponents if code != blue]
+            ).digest(),
+        )
+        for _ in range(args.games_per_version)
+        for blue in codes
+    ]
+
+
+async def submit(tasks: list[RunGameTask], route, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+
+        async def post(task: RunGameTask):
+            async with semaphore:
+                while True:
+                    response = await client.post(
+                        route(task), content=task.json(), headers=JSON_HEADERS
+                    )
+                    if response.status_code != 429:
+                        break
+                    await asyncio.sleep(float(response.headers["Retry-After"]))
+                response.raise_for_status()
+
+        await asyncio.gather(*(post(task) for task in tasks))
+
+
+def run_mode(mode: str, codes: list[Code], args) -> dict:
+    dispatcher = mock_dispatcher(codes)
+    dispatcher_port = free_port()
+    server = serve_in_thread(dispatcher, dispatcher_port)
+    runners = start_runners(args.runners, args.cache_size)
+    urls = [url for _, url in runners]
+
+    ring = HashRing(urls)
+    routes = {
+        "hash": lambda task: ring.lookup(task.blue_code)[0],
+        "random": lambda task: random.choice(urls),
+    }
+
+    tasks = make_tasks(
+        codes,
+        args,
+        f"http://127.0.0.1:{dispatcher_port}/game_result",
+        f"http://127.0.0.1:{dispatcher_port}/code",
+    )
+
+    try:
+        start = time.monotonic()
+        asyncio.run(submit(tasks, routes[mode], args.concurrency))
+        with dispatcher.state.received:
+            dispatcher.state.received.wait_for(
+                lambda: len(dispatcher.state.logs) >= len(tasks), args.timeout
+            )
+        elapsed = time.monotonic() - start
+
+        return {
+            "mode": mode,
+            "games": len(dispatcher.state.logs),
+            "games_per_second": len(dispatcher.state.logs) / elapsed,
+            **cache_stats(urls),
+        }
+
+    finally:
+        for process, _ in runners:
+            process.terminate()
+            process.wait()
+        stop_server(*server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runners", type=int, default=3)
+    parser.add_argument("--versions", type=int, default=120)
+    parser.add_argument("--games-per-version", type=int, default=3)
+    parser.add_argument("--opponents", type=int, default=10)
+    parser.add_argument("--cache-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=["hash", "random"])
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    getLogger().setLevel("WARNING")
+    random.seed(0)
+    codes = [
+        Code(source=PLAYER_SOURCE.format(n=n), cls_name=f"LoadTestPlayer{n}")
+        for n in range(args.versions)
+    ]
+
+    print(
+        f"{'mode':>8} {'games':>6} {'games/s':>8} {'code hits':>10} {'compiled hits':>14}"
+    )
+    for mode in args.modes:
+        row = run_mode(mode, codes, args)
+        print(
+            f"{row['mode']:>8} {row['games']:6} {row['games_per_second']:8.1f} "
+            f"{row['code_hit_rate']:10.1%} {row['compiled_hit_rate']:14.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Games created per second by a scheduling round, bulk versus per game.
+
+"per game" is the way rounds used to save games: ORM adds and a commit per
+game, then Bot.latest_code_hash() for both of its bots. "bulk" is
+scheduler.create_games: one transaction per round, one query for the code of
+all bots and bulk inserts. Both build the runner tasks.
+
+    python -m benchmarks.bench_schedule --bots 200 --games 100 1000 5000
+
+Uses a fresh SQLite file unless --database-uri points elsewhere.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from logging import getLogger
+from uuid import uuid4
+
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+os.environ.setdefault("RUNNER_URL", "http://localhost:8201/")
+os.environ.setdefault("DISPATCHER_URL", "http://localhost:8200")
+
+from botbattle import Code, Side  # noqa: E402
+from common.database import Base, SessionLocal  # noqa: E402
+from common.models import Bot, Game, Participant, save_code  # noqa: E402
+from scheduler.scheduler import build_task, create_games  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+
+
+def seed_bots(count: int) -> list[Bot]:
+    with SessionLocal.begin() as db:
+        bots = [Bot(token=str(uuid4()), suspended=False) for _ in range(count)]
+        db.add_all(bots)
+        db.flush()
+
+        for bot in bots:
+            code = Code(source=f"class Player{bot.id}: ...", cls_name=f"Player{bot.id}")
+            bot.add_version(db, save_code(db, code))
+
+    with SessionLocal() as db:
+        return db.query(Bot).all()
+
+
+def per_game(pairings: list[tuple[Bot, Bot]]):
+    with SessionLocal() as db:
+        for blue, red in pairings:
+            game = Game(id=uuid4())
+            db.add(game)
+            for bot, side in [[blue, Side.BLUE], [red, Side.RED]]:
+                db.add(Participant(game_id=game.id, bot_id=bot.id, side=side.value))
+            db.commit()
+
+            build_task(game.id, blue.latest_code_hash(db), red.latest_code_hash(db))
+
+
+def bulk(pairings: list[tuple[Bot, Bot]]):
+    with SessionLocal.begin() as db:
+        create_games(db, pairings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--games", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--database-uri")
+    args = parser.parse_args()
+
+    getLogger().setLevel("WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(args.database_uri or f"sqlite:///{tmp}/schedule.db")
+        SessionLocal.configure(bind=engine)
+        Base.metadata.create_all(engine)
+
+        queries = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_query(*args):
+            nonlocal queries
+            queries += 1
+
+        random.seed(0)
+        bots = seed_bots(args.bots)
+
+        print(
+            f"{'mode':>8} {'games':>6} {'seconds':>8} {'games/s':>9} {'statements':>10}"
+        )
+        for games in args.games:
+            pairings = [tuple(random.sample(bots, 2)) for _ in range(games)]
+
+            for mode, func in [("per game", per_game), ("bulk", bulk)]:
+                queries = 0
+                start = time.perf_counter()
+                func(pairings)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{mode:>8} {games:6} {elapsed:8.3f} {games / elapsed:9.0f} "
+                    f"{queries:10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Cold import time of each service and of the botbattle SDK.
+
+Every target is imported in a fresh interpreter, as in a container that
+was scaled to zero. Also shows which heavy dependencies each import pulls in.
+
+    python -m benchmarks.bench_startup --runs 10 --top 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+TARGETS = {
+    "game engine": "botbattle",
+    "bot client": "botbattle.client",
+    "runner": "runner.runner",
+    "dispatcher": "dispatcher.dispatcher",
+    "scheduler": "scheduler.scheduler",
+}
+
+HEAVY_MODULES = ["httpx", "fastapi", "sqlalchemy", "sqlparse", "msgpack"]
+
+ENV = {
+    "DATABASE_URI": "sqlite://",
+    "RUNNER_URL": "http://localhost:8201/",
+    "DISPATCHER_URL": "http://localhost:8200",
+    "SCHEDULER_URL": "http://localhost:8202/",
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+
+def import_once(module: str) -> tuple[float, list[str]]:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        env={**os.environ, **ENV},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={**os.environ, **ENV},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    # "import time: self [us] | cumulative | imported package", nested imports
+    # indented by two spaces per level; only what `module` imports directly
+    timings = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        if len(name) - len(name.lstrip()) == 3:
+            timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'target':>12} {'p50 ms':>8} {'min ms':>8}  loads")
+
+    for name, module in TARGETS.items():
+        results = [import_once(module) for _ in range(args.runs)]
+        times = [elapsed * 1000 for elapsed, _ in results]
+        loaded = ", ".join(results[0][1]) or "-"
+        print(f"{name:>12} {statistics.median(times):8.1f} {min(times):8.1f}  {loaded}")
+
+        for cumulative, imported in slowest_imports(module, args.top):
+            print(f"{'':>12} {cumulative / 1000:8.1f} ms  {imported}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Win-check and full-game speed across game variants.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_variants
+"""
+import argparse
+import random
+import timeit
+
+from botbattle import GameConfig, Side, State
+from sample_bots.random_player import RandomPlayer
+
+VARIANTS = [
+    GameConfig(),  # the default 7x7 connect-4
+    GameConfig(board_width=7, board_height=6),
+    GameConfig(board_width=5, board_height=5, win_length=3),
+    GameConfig(board_width=8, board_height=8, win_length=5),
+    GameConfig(board_width=10, board_height=10, win_length=5),
+    GameConfig(board_width=15, board_height=15, win_length=6, first_side=Side.RED),
+]
+
+
+def half_filled_state(config: GameConfig) -> State:
+    # a position without winners, so the whole board has to be scanned
+    state = config.initial_state()
+    for y in range(config.board_height // 2, config.board_height):
+        for x in range(config.board_width):
+            state.board[y][x] = Side.RED if (x // 2 + y) % 2 else Side.BLUE
+    return state
+
+
+def legacy_winners(state: State) -> list[Side]:
+    # the vector-based check the engine used before sides_with_lines()
+    if state.all_cells_filled():
+        return [Side.RED, Side.BLUE]
+    return [side for side in Side if state.find_all_lines(state.win_length, side)]
+
+
+def play_random_game(config: GameConfig) -> int:
+    state = config.initial_state()
+    players = {side: RandomPlayer(side) for side in Side}
+    moves = 0
+    while not state.winners():
+        state.drop_token(players[state.next_side].make_move(state))
+        moves += 1
+    return moves
+
+
+def per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--games", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+
+    print(
+        f"{'variant':>16} {'winners() us':>13} {'legacy us':>10} "
+        f"{'speedup':>8} {'game ms':>8} {'moves':>6}"
+    )
+
+    for config in VARIANTS:
+        state = half_filled_state(config)
+        fast = per_call_us(state.winners, args.number)
+        legacy = per_call_us(lambda: legacy_winners(state), max(args.number // 10, 1))
+
+        moves = 0
+        start = timeit.default_timer()
+        for _ in range(args.games):
+            moves += play_random_game(config)
+        game_time = (timeit.default_timer() - start) / args.games * 1e3
+
+        name = (
+            f"{config.board_width}x{config.board_height}/{config.win_length}"
+            f" {config.first_side.name.lower()}"
+        )
+        print(
+            f"{name:>16} {fast:13.1f} {legacy:10.1f} "
+            f"{legacy / fast:7.0f}x {game_time:8.2f} {moves / args.games:6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
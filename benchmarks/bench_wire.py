@@ -0,0 +1,66 @@
+"""Encode/decode time and size of game logs in each wire format.
+
+Plays random games on a few board sizes and round-trips their logs the way
+a runner sends them and the dispatcher reads them.
+
+    python -m benchmarks.bench_wire --games 200
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from botbattle import GameConfig, GameLog, wire
+from runner.benchmark import bot_pair, play_game
+
+CONFIGS = [
+    GameConfig(),
+    GameConfig(board_width=10, board_height=10, win_length=5),
+    GameConfig(board_width=15, board_height=15, win_length=6),
+]
+
+
+def per_log_us(func, logs: list, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for log in logs:
+            func(log)
+        best = min(best, time.perf_counter() - start)
+    return best / len(logs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    blue, red = bot_pair("random")
+
+    print(
+        f"{'board':>8} {'states':>7} {'format':>20} "
+        f"{'encode us':>10} {'decode us':>10} {'bytes':>8}"
+    )
+
+    for config in CONFIGS:
+        logs: list[GameLog] = [play_game(blue, red, config) for _ in range(args.games)]
+        states = statistics.mean(len(log.states) for log in logs)
+        board = f"{config.board_width}x{config.board_height}"
+
+        for media_type in wire.supported_media_types():
+            encoded = [wire.encode_game_log(log, media_type) for log in logs]
+            encode = per_log_us(lambda log: wire.encode_game_log(log, media_type), logs)
+            decode = per_log_us(
+                lambda data: wire.decode_game_log(data, media_type), encoded
+            )
+            size = statistics.mean(len(data) for data in encoded)
+            print(
+                f"{board:>8} {states:7.1f} {media_type:>20} "
+                f"{encode:10.1f} {decode:10.1f} {size:8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""End-to-end load test of dispatcher, scheduler and runner.
+
+Seeds N bots with tokens into a database, starts the three services in-process,
+uploads code for every bot concurrently while polling stats (or waiting on the
+results stream with --stream), and reports the latency from upload to the first
+game result plus the time spent in each service.
+
+    python -m benchmarks.loadtest --bots 1000
+    python -m benchmarks.loadtest --database-uri postgresql://... --bots 5000
+
+The default database is a fresh SQLite file. The tables are created if missing.
+"""
+
+import argparse
+import asyncio
+import collections
+import functools
+import os
+import tempfile
+import time
+from logging import basicConfig, getLogger
+from uuid import uuid4
+
+import httpx
+
+PLAYER_SOURCE = """
+class LoadTestPlayer{n}(PlayerAbstract):
+    def make_move(self, state):
+        import random
+
+        return random.choice(
+            [i for i in range(state.len_x()) if not state.column_full(i)]
+        )
+"""
+
+# seconds spent in each stage, filled in by the wrappers from timed()
+stage_times: dict[str, list[float]] = collections.defaultdict(list)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def timed(stage: str, func):
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                stage_times[stage].append(time.perf_counter() - start)
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stage_times[stage].append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def start_services(args):
+    from runner.benchmark import free_port, serve_in_thread
+
+    # the services call basicConfig(level="DEBUG"), which is a no-op once configured
+    basicConfig()
+    getLogger().setLevel(args.log_level)
+
+    servers = []
+    ports = {name: free_port() for name in ["dispatcher", "scheduler", "runner"]}
+    urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+
+    # the services read their configuration at import time
+    os.environ["DATABASE_URI"] = args.database_uri
+    os.environ["DISPATCHER_URL"] = urls["dispatcher"]
+    os.environ["SCHEDULER_URL"] = urls["scheduler"]
+    os.environ["RUNNER_URL"] = urls["runner"] + "/"
+    os.environ["RUNNER_OUTBOX"] = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    # the runner fetches code from the dispatcher with it
+    os.environ.setdefault("INTERNAL_TOKEN", uuid4().hex)
+    if args.trace_file:
+        os.environ["TRACE_FILE"] = args.trace_file
+
+    from common.database import Base, engine
+    from dispatcher import dispatcher
+    from runner import runner
+    from scheduler import scheduler
+
+    Base.metadata.create_all(engine)
+
+    for rate_limiter in scheduler.rate_limiters.values():
+        rate_limiter.requests_per_minute = args.games_per_minute
+    scheduler.run_round = timed("scheduler: round", scheduler.run_round)
+    scheduler.create_games = timed("scheduler: create games", scheduler.create_games)
+    runner.get_game_results = timed("runner: play game", runner.get_game_results)
+    runner.try_post_results = timed("runner: post result", runner.try_post_results)
+    dispatcher.save_game_result = timed(
+        "dispatcher: save result", dispatcher.save_game_result
+    )
+
+    for name, app in [
+        ("dispatcher", dispatcher.app),
+        ("scheduler", scheduler.app),
+        ("runner", runner.app),
+    ]:
+        add_request_timer(name, app)
+        servers.append(serve_in_thread(app, ports[name]))
+
+    return urls, servers
+
+
+def add_request_timer(name: str, app):
+    @app.middleware("http")
+    async def time_request(request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        path = route.path if route else request.url.path
+        stage_times[f"{name}: {request.method} {path}"].append(
+            time.perf_counter() - start
+        )
+        return response
+
+
+def seed_bots(count: int) -> list[str]:
+    from common.database import SessionLocal
+    from common.models import Bot
+
+    tokens = [str(uuid4()) for _ in range(count)]
+
+    with SessionLocal.begin() as db:
+        db.add_all(Bot(token=token, suspended=False) for token in tokens)
+
+    return tokens
+
+
+async def run_bot(
+    client: httpx.AsyncClient, token: str, n: int, args, results: dict
+) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    code = {"source": PLAYER_SOURCE.format(n=n), "cls_name": f"LoadTestPlayer{n}"}
+
+    start = time.perf_counter()
+    try:
+        response = await client.post("/update_code", json=code, headers=headers)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        results["upload failed"].append(time.perf_counter() - start)
+        return
+    results["upload"].append(time.perf_counter() - start)
+
+    if args.stream:
+        await wait_for_first_result(client, headers, start, args, results)
+        return
+
+    deadline = start + args.timeout
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(args.poll_interval)
+
+        poll_start = time.perf_counter()
+        try:
+            response = await client.get("/latest_versions_info/", headers=headers)
+        except httpx.HTTPError:
+            results["stats poll failed"].append(time.perf_counter() - poll_start)
+            continue
+        results["stats poll"].append(time.perf_counter() - poll_start)
+
+        if response.is_success and any(
+            version["stats"] and sum(version["stats"].values()) or version["exception"]
+            for version in response.json()
+        ):
+            results["upload to first result"].append(time.perf_counter() - start)
+            return
+
+    results["no result before timeout"].append(args.timeout)
+
+
+async def wait_for_first_result(
+    client: httpx.AsyncClient, headers: dict, start: float, args, results: dict
+) -> None:
+    # results are pushed by the dispatcher, so this costs no database queries
+    try:
+        async with client.stream(
+            "GET", "/results/stream", headers=headers, timeout=args.timeout
+        ) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    results["upload to first result"].append(
+                        time.perf_counter() - start
+                    )
+                    return
+    except httpx.HTTPError:
+        pass
+
+    results["no result before timeout"].append(args.timeout)
+
+
+async def drive(urls: dict, tokens: list[str], args) -> dict:
+    results = collections.defaultdict(list)
+    limits = httpx.Limits(max_connections=args.connections)
+
+    async with httpx.AsyncClient(
+        base_url=urls["dispatcher"], limits=limits, timeout=args.timeout
+    ) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(token: str, n: int):
+            async with semaphore:
+                await run_bot(client, token, n, args, results)
+
+        await asyncio.gather(*(limited(token, n) for n, token in enumerate(tokens)))
+
+    return results
+
+
+def print_table(title: str, rows: dict[str, list[float]]):
+    print(f"\n{title}")
+    print(
+        f"{'':>40} {'count':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+    )
+    for name, values in sorted(rows.items(), key=lambda row: -sum(row[1])):
+        print(
+            f"{name:>40} {len(values):7} {sum(values):9.2f} "
+            f"{percentile(values, 50) * 1000:9.1f} {percentile(values, 95) * 1000:9.1f} "
+            f"{max(values) * 1000:9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument(
+        "--database-uri", default=f"sqlite:///loadtest-{int(time.time())}.db"
+    )
+    parser.add_argument("--concurrency", type=int, default=500, help="bots at a time")
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--games-per-minute",
+        type=float,
+        default=6000,
+        help="initial submission rate, adapted to the runner's feedback",
+    )
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="wait for results on /results/stream instead of polling stats",
+    )
+    parser.add_argument(
+        "--trace-file", help="collect per-game traces and report stages from them"
+    )
+    args = parser.parse_args()
+
+    urls, servers = start_services(args)
+    tokens = seed_bots(args.bots)
+
+    start = time.perf_counter()
+    results = asyncio.run(drive(urls, tokens, args))
+    elapsed = time.perf_counter() - start
+
+    from runner.benchmark import stop_server
+
+    for server in servers:
+        stop_server(*server)
+
+    print(f"{args.bots} bots in {elapsed:.1f}s")
+    print_table("Client side", results)
+    print_table("Service side", stage_times)
+
+    if args.trace_file:
+        from common.tracing import load_traces, report
+
+        print("\nPer-game stages")
+        print(report(load_traces(args.trace_file)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-from .client import BotClient
+from importlib import import_module
+
+from .channel import BoardChannel, ChannelException, StateView
 from .players import (
     IncorrectInheritanceException,
     IncorrectPlayerCodeException,
@@ -9,11 +11,29 @@ from .players import (
 from .protocol import (
     Code,
     ExceptionInfo,
+    GameConfig,
     GameLog,
+    LeaderboardEntry,
     ParticipantInfo,
     RunGameTask,
+    Span,
+    Standing,
     VersionInfo,
     VersionStats,
 )
+from .replay import Replay, ReplayFormatException
 from .side import Side
 from .state import State, StateException, Vector
+
+
+def __getattr__(name):
+    # the clients need httpx, which the game engine and the runner's bots don't,
+    # so they are only imported when used
+    if name in ("client", "AsyncBotClient", "BotClient"):
+        client = import_module(".client", __name__)
+        return client if name == "client" else getattr(client, name)
+    # imported already, `python -m botbattle.book` would warn that it runs twice
+    if name in ("book", "Book", "BookEntry", "BookFormatException", "open_book"):
+        book = import_module(".book", __name__)
+        return book if name == "book" else getattr(book, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
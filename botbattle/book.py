@@ -0,0 +1,396 @@
+"""Opening book and endgame tablebase for bots, precomputed once and shared.
+
+The generator searches every position of the first `plies` moves and solves
+positions sampled near the end of random games exactly. It writes the best
+move of each position to a file of fixed-size entries sorted by position key.
+`Book` memory-maps the file read-only, so every bot and runner process on a
+host shares one copy in the page cache, and looks a position up with a binary
+search, without reading the file into memory.
+
+    python -m botbattle.book book.bbk --plies 6 --depth 8 --endgame-samples 2000
+
+That takes about 7 minutes on one core, nearly all of it searching the
+openings; the endgames take a second or two. Run it when building an image
+or a host, not when a bot starts.
+
+Bots open the file once per process with `open_book()`, which reads the path
+from BOTBATTLE_BOOK unless given one. The images don't ship a book, so bots
+have to do without when it returns None:
+
+    book = open_book()
+    entry = book and book.lookup(state)
+    if entry:
+        return entry.move
+
+Positions are keyed by their bitboard encoding, which is unique for a board
+up to 64 cells including a spare row, so the default 7x7 board fits.
+"""
+
+import argparse
+import functools
+import mmap
+import os
+import random
+import struct
+import time
+import warnings
+from dataclasses import dataclass
+
+from .state import State
+
+# magic, format version, board width, board height, win length, entry count
+HEADER = struct.Struct("<3sBBBBI")
+# position key, best move, flags, score
+ENTRY = struct.Struct("<QBBh")
+MAGIC = b"BBK"
+FORMAT_VERSION = 1
+
+# the score of a position won at once, a win n moves later scores WIN - n
+WIN = 1000
+EXACT = 1
+
+BOOK_PATH = os.environ.get("BOTBATTLE_BOOK", "book.bbk")
+
+
+class BookFormatException(Exception):
+    ...
+
+
+class Position:
+    """A board as two bitboards: the stones of the side to move and all stones.
+
+    Each column takes height + 1 bits from the bottom up, the spare bit makes
+    `key()` unique.
+    """
+
+    def __init__(self, width: int = 7, height: int = 7, win_length: int = 4):
+        if (height + 1) * width > 64:
+            raise ValueError("board does not fit in a 64-bit key")
+
+        self.width = width
+        self.height = height
+        self.win_length = win_length
+        self.current = 0
+        self.mask = 0
+        self.moves = 0
+
+        column = (1 << height) - 1
+        self.bottom = sum(1 << x * (height + 1) for x in range(width))
+        self.board_mask = self.bottom * column
+        self.shifts = (1, height + 1, height, height + 2)
+        # center columns first, they take part in the most lines
+        self.order = sorted(range(width), key=lambda x: abs(2 * x - width + 1))
+
+    @classmethod
+    def from_state(cls, state: State) -> "Position":
+        position = cls(state.len_x(), state.len_y(), state.win_length)
+        for y, row in enumerate(state.board):
+            for x, side in enumerate(row):
+                if side is None:
+                    continue
+                bit = 1 << x * (position.height + 1) + position.height - 1 - y
+                position.mask |= bit
+                if side == state.next_side:
+                    position.current |= bit
+                position.moves += 1
+        return position
+
+    def copy(self) -> "Position":
+        position = object.__new__(Position)
+        position.__dict__.update(self.__dict__)
+        return position
+
+    def key(self) -> int:
+        return self.current + self.mask
+
+    def can_play(self, col: int) -> bool:
+        return not self.mask & self.top_bit(col)
+
+    def top_bit(self, col: int) -> int:
+        return 1 << self.height - 1 + col * (self.height + 1)
+
+    def play(self, col: int):
+        self.current ^= self.mask
+        self.mask |= self.mask + (1 << col * (self.height + 1))
+        self.moves += 1
+
+    def is_full(self) -> bool:
+        return self.moves == self.width * self.height
+
+    def is_winning_move(self, col: int) -> bool:
+        stones = self.current | (self.mask + (1 << col * (self.height + 1))) & (
+            self.column_mask(col)
+        )
+        return self.has_line(stones)
+
+    def column_mask(self, col: int) -> int:
+        return ((1 << self.height) - 1) << col * (self.height + 1)
+
+    def has_line(self, stones: int) -> bool:
+        for shift in self.shifts:
+            line = stones
+            for i in range(1, self.win_length):
+                line &= stones >> shift * i
+            if line:
+                return True
+        return False
+
+    def threats(self, stones: int) -> int:
+        """Empty cells that would complete a line of `stones`."""
+        found = 0
+        length = self.win_length
+        for shift in self.shifts:
+            for before in range(length):
+                cells = self.board_mask
+                for i in range(1, before + 1):
+                    cells &= stones >> shift * i
+                for i in range(1, length - before):
+                    cells &= stones << shift * i
+                found |= cells
+        return found & self.board_mask & ~self.mask
+
+    def evaluate(self) -> int:
+        """Heuristic score for the side to move, far below any win."""
+        opponent = self.current ^ self.mask
+        return (
+            self.threats(self.current).bit_count() - self.threats(opponent).bit_count()
+        )
+
+
+def search(
+    position: Position, depth: int, alpha: int = -WIN, beta: int = WIN, table=None
+) -> int:
+    """Negamax score of the side to move, exact for wins found within `depth`."""
+    if position.is_full():
+        return 0
+
+    for col in position.order:
+        if position.can_play(col) and position.is_winning_move(col):
+            return WIN - position.moves
+
+    if depth == 0:
+        return position.evaluate()
+
+    table = {} if table is None else table
+    key = position.key()
+    cached = table.get(key)
+    if cached and cached[0] >= depth:
+        _, lower, upper = cached
+        if lower >= beta:
+            return lower
+        if upper <= alpha:
+            return upper
+        alpha, beta = max(alpha, lower), min(beta, upper)
+
+    start_alpha, best = alpha, -WIN
+    for col in position.order:
+        if not position.can_play(col):
+            continue
+        child = position.copy()
+        child.play(col)
+        score = -search(child, depth - 1, -beta, -alpha, table)
+        if score > best:
+            best = score
+        if best > alpha:
+            alpha = best
+        if alpha >= beta:
+            break
+
+    lower, upper = -WIN, WIN
+    if best <= start_alpha:
+        upper = best
+    elif best >= beta:
+        lower = best
+    else:
+        lower = upper = best
+    table[key] = (depth, lower, upper)
+    return best
+
+
+def best_move(position: Position, depth: int, table=None) -> tuple[int, int, bool]:
+    """The best column, its score and whether the score is exact."""
+    table = {} if table is None else table
+    best_col, best_score = None, -WIN - 1
+
+    for col in position.order:
+        if not position.can_play(col):
+            continue
+        if position.is_winning_move(col):
+            return col, WIN - position.moves, True
+
+        child = position.copy()
+        child.play(col)
+        score = -search(child, depth - 1, -WIN, -best_score, table)
+        if score > best_score:
+            best_col, best_score = col, score
+
+    empty = position.width * position.height - position.moves
+    exact = depth >= empty or abs(best_score) > WIN - position.width * position.height
+    return best_col, best_score, exact
+
+
+@dataclass
+class BookEntry:
+    move: int
+    score: int
+    exact: bool
+
+
+class Book:
+    """Read-only, memory-mapped lookups in a file written by `generate()`."""
+
+    def __init__(self, path: str = BOOK_PATH):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, width, height, win_length, count = HEADER.unpack_from(
+                self.data
+            )
+        except struct.error as exc:
+            raise BookFormatException(str(exc))
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise BookFormatException(
+                f"{path} is not a book of version {FORMAT_VERSION}"
+            )
+        if len(self.data) < HEADER.size + count * ENTRY.size:
+            raise BookFormatException(f"{path} is truncated")
+
+        self.width, self.height, self.win_length = width, height, win_length
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, state: State) -> BookEntry | None:
+        if (state.len_x(), state.len_y(), state.win_length) != (
+            self.width,
+            self.height,
+            self.win_length,
+        ):
+            return None
+        return self.lookup_key(Position.from_state(state).key())
+
+    def lookup_key(self, key: int) -> BookEntry | None:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found, move, flags, score = ENTRY.unpack_from(
+                self.data, HEADER.size + middle * ENTRY.size
+            )
+            if found == key:
+                return BookEntry(move=move, score=score, exact=bool(flags & EXACT))
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+@functools.cache
+def open_book(path: str = BOOK_PATH) -> Book | None:
+    """The book at `path`, mapped once per process. None if there is no book,
+    or none that can be read, bots play without it then."""
+    try:
+        return Book(path)
+    except FileNotFoundError:
+        return None
+    # empty files can't be mapped, truncated ones aren't books
+    except (OSError, ValueError, BookFormatException) as exc:
+        warnings.warn(f"Not using the book at {path}: {exc}")
+        return None
+
+
+def generate(
+    path: str,
+    plies: int = 6,
+    depth: int = 8,
+    endgame_samples: int = 1000,
+    endgame_cells: int = 12,
+    width: int = 7,
+    height: int = 7,
+    win_length: int = 4,
+    seed: int = 0,
+) -> int:
+    """Writes a book to `path` and returns its number of positions.
+
+    Covers every position of the first `plies` moves, searched `depth` moves
+    deep, and positions with at most `endgame_cells` empty cells reached by
+    `endgame_samples` random games, solved to the end.
+    """
+    entries: dict[int, tuple[int, int, int]] = {}
+    table = {}
+
+    def add(position: Position, search_depth: int):
+        col, score, exact = best_move(position, search_depth, table)
+        if col is not None:
+            entries[position.key()] = (col, EXACT if exact else 0, score)
+
+    # openings: breadth first, transpositions are searched once
+    frontier = {0: Position(width, height, win_length)}
+    for _ in range(plies):
+        next_frontier = {}
+        for key, position in frontier.items():
+            add(position, depth)
+            for col in range(width):
+                if not position.can_play(col) or position.is_winning_move(col):
+                    continue
+                child = position.copy()
+                child.play(col)
+                next_frontier.setdefault(child.key(), child)
+        frontier = next_frontier
+
+    # endgames: solved to the end, so every entry is exact
+    rng = random.Random(seed)
+    for _ in range(endgame_samples):
+        position = Position(width, height, win_length)
+        while width * height - position.moves > endgame_cells:
+            # both sides stay clear of wins, or few games would last that long
+            playable = [
+                col
+                for col in range(width)
+                if position.can_play(col) and not position.is_winning_move(col)
+            ]
+            if not playable:
+                break
+            position.play(rng.choice(playable))
+        else:
+            if position.key() not in entries:
+                add(position, width * height - position.moves)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(
+            HEADER.pack(MAGIC, FORMAT_VERSION, width, height, win_length, len(entries))
+        )
+        for key in sorted(entries):
+            file.write(ENTRY.pack(key, *entries[key]))
+    os.replace(tmp_path, path)
+
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=BOOK_PATH)
+    parser.add_argument("--plies", type=int, default=6)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--endgame-samples", type=int, default=1000)
+    parser.add_argument("--endgame-cells", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate(
+        args.path,
+        plies=args.plies,
+        depth=args.depth,
+        endgame_samples=args.endgame_samples,
+        endgame_cells=args.endgame_cells,
+        seed=args.seed,
+    )
+    print(
+        f"{count} positions, {os.path.getsize(args.path)} bytes "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
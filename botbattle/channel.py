@@ -0,0 +1,352 @@
+"""Moves of a bot running in another process, over a board in shared memory.
+
+The runner writes each board in place into a shared memory block, one byte
+per cell, and the bot's process reads it through `StateView`, which has the
+read-only interface of `State` and copies nothing. Nothing is pickled or
+serialized per move, only two semaphores are signalled:
+
+1. the runner writes the board, its move budget and a new request `seq`, and
+   releases `to_bot`;
+2. the bot's process wakes up, calls `make_move()` with a view of the board,
+   writes the move, its CPU time and the request's `seq`, and releases
+   `to_runner`;
+3. the runner takes the reply if its `seq` matches, a late reply to a move
+   that timed out is skipped.
+
+Each side writes only while the other waits, so the semaphores are all the
+locking there is.
+
+    channel = BoardChannel(7, 7)
+    process = multiprocessing.Process(target=channel.serve, args=(player,))
+    process.start()
+    move, cpu_time = channel.request_move(state, timeout=1)
+    channel.close()
+    channel.unlink()
+"""
+
+import itertools
+import multiprocessing
+import reprlib
+import struct
+import time
+from multiprocessing.shared_memory import SharedMemory
+from traceback import format_exc
+
+from .side import Side
+from .state import State
+
+# seq, width, height, win_length, next_side, stop, budget in CPU seconds or -1
+REQUEST = struct.Struct("<IBBBBBd")
+# seq, status, move, cpu_time, length of the error, or of an invalid move's repr
+REPLY = struct.Struct("<IBhdH")
+BOARD_START = REQUEST.size + REPLY.size
+ERROR_SIZE = 4096
+
+OK, RAISED, INVALID, TIMED_OUT, OUT_OF_MEMORY = range(5)
+
+# how often a runner waiting for a reply checks that the bot is still there
+POLL_INTERVAL = 0.01
+
+# a cell is 0 when empty, otherwise its side's value + 1
+CELLS = (None, *Side)
+ENCODE = {cell: i for i, cell in enumerate(CELLS)}
+
+
+class ChannelException(Exception):
+    ...
+
+
+class BotRaisedException(ChannelException):
+    ...
+
+
+class BotOutOfMemoryException(BotRaisedException):
+    ...
+
+
+class InvalidReplyException(ChannelException):
+    ...
+
+
+class BotTimedOutException(ChannelException, TimeoutError):
+    def __init__(self, cpu_time: float | None = None):
+        super().__init__(cpu_time)
+        self.cpu_time = cpu_time
+
+
+class BotExitedException(ChannelException):
+    ...
+
+
+class RowView:
+    __slots__ = ("buf", "start", "width")
+
+    def __init__(self, buf, start: int, width: int):
+        self.buf, self.start, self.width = buf, start, width
+
+    def __len__(self) -> int:
+        return self.width
+
+    def __getitem__(self, x: int) -> Side | None:
+        if not 0 <= x < self.width:
+            if not -self.width <= x < 0:
+                raise IndexError(x)
+            x += self.width
+        return CELLS[self.buf[self.start + x]]
+
+    def __iter__(self):
+        cells = self.buf[self.start : self.start + self.width].tobytes()
+        return (CELLS[cell] for cell in cells)
+
+
+class BoardView:
+    __slots__ = ("rows",)
+
+    def __init__(self, buf, start: int, width: int, height: int):
+        self.rows = [RowView(buf, start + y * width, width) for y in range(height)]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, y: int) -> RowView:
+        return self.rows[y]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class StateView:
+    """The board in shared memory as a read-only `State`.
+
+    Valid until the bot returns its move, `copy()` makes a `State` to keep
+    or play moves on.
+    """
+
+    def __init__(
+        self, buf, start: int, width: int, height: int, next_side: Side, win_length
+    ):
+        self.board = BoardView(buf, start, width, height)
+        self.next_side = next_side
+        self.win_length = win_length
+
+    def copy(self, **kwargs) -> State:
+        return State(
+            board=[list(row) for row in self.board],
+            next_side=self.next_side,
+            win_length=self.win_length,
+        )
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, (State, StateView))
+            and [list(row) for row in self.board] == [list(row) for row in other.board]
+            and (self.next_side, self.win_length) == (other.next_side, other.win_length)
+        )
+
+
+# everything of State that only reads the board
+for name in (
+    "line",
+    "vector_in_bounds",
+    "line_side",
+    "extend_vector",
+    "winners",
+    "sides_with_lines",
+    "all_cells_filled",
+    "find_all_lines",
+    "len_x",
+    "len_y",
+    "find_all_generic",
+    "column_full",
+):
+    setattr(StateView, name, getattr(State, name))
+
+
+def call_directly(func, budget: float | None) -> tuple[bool, object, str, float]:
+    """Calls `func` and returns whether it returned in time, its result, the
+    traceback if it raised and the CPU time it took."""
+    start = time.thread_time()
+    result, error = None, None
+    try:
+        result = func()
+    except Exception:
+        error = format_exc()
+    cpu_time = time.thread_time() - start
+    return budget is None or cpu_time <= budget, result, error, cpu_time
+
+
+def describe(move) -> str:
+    """The repr of what a bot returned instead of a move, for its error."""
+    try:
+        return reprlib.repr(move)
+    except Exception:
+        return f"<{type(move).__name__} without a repr>"
+
+
+class BoardChannel:
+    def __init__(self, width: int = 7, height: int = 7, context=None):
+        """`context` is the multiprocessing context the bot's process starts in."""
+        context = context or multiprocessing.get_context()
+        self.width, self.height = width, height
+        self.shm = SharedMemory(
+            create=True, size=BOARD_START + width * height + ERROR_SIZE
+        )
+        self.owner = True
+        self.to_bot = context.Semaphore(0)
+        self.to_runner = context.Semaphore(0)
+        self.seq = 0
+        REQUEST.pack_into(self.shm.buf, 0, 0, width, height, 0, 0, 0, 0)
+        REPLY.pack_into(self.shm.buf, REQUEST.size, 0, OK, 0, 0, 0)
+
+    def __getstate__(self):
+        # only while starting a process, like the semaphores
+        return self.shm.name, self.width, self.height, self.to_bot, self.to_runner
+
+    def __setstate__(self, state):
+        name, self.width, self.height, self.to_bot, self.to_runner = state
+        self.shm = SharedMemory(name)
+        self.owner = False
+        self.seq = 0
+
+    @property
+    def error_start(self) -> int:
+        return BOARD_START + self.width * self.height
+
+    # the runner's side
+
+    def request_move(
+        self,
+        state: State,
+        timeout: float | None,
+        budget: float | None = None,
+        alive=None,
+    ) -> tuple[int, float]:
+        """Returns the bot's move and the CPU time it took.
+
+        The bot gets `budget` CPU seconds, the runner waits `timeout` seconds
+        of wall time for its reply.
+        """
+        self.write(state, budget)
+        self.to_bot.release()
+        return self.receive(timeout, alive)
+
+    def write(self, state: State, budget: float | None = None):
+        if (state.len_x(), state.len_y()) != (self.width, self.height):
+            raise ValueError("the board does not fit the channel")
+
+        self.seq += 1
+        buf = self.shm.buf
+        buf[BOARD_START : self.error_start] = bytes(
+            map(ENCODE.__getitem__, itertools.chain.from_iterable(state.board))
+        )
+        REQUEST.pack_into(
+            buf,
+            0,
+            self.seq,
+            self.width,
+            self.height,
+            state.win_length,
+            state.next_side.value,
+            0,
+            -1 if budget is None else budget,
+        )
+
+    def receive(self, timeout: float | None, alive=None) -> tuple[int, float]:
+        """Waits for the reply to the latest request, or to none for the bot's
+        first reply. While waiting, `alive()` is polled to notice a bot that
+        exited.
+
+        Raises BotTimedOutException, BotRaisedException, InvalidReplyException
+        with the repr of what the bot returned, or BotExitedException.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if alive:
+                left = POLL_INTERVAL if left is None else min(left, POLL_INTERVAL)
+
+            if not self.to_runner.acquire(timeout=left):
+                if alive and not alive():
+                    raise BotExitedException
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise BotTimedOutException
+                continue
+
+            seq, status, move, cpu_time, error_length = REPLY.unpack_from(
+                self.shm.buf, REQUEST.size
+            )
+            if seq == self.seq:
+                break
+
+        if status == OK:
+            return move, cpu_time
+
+        error = bytes(
+            self.shm.buf[self.error_start : self.error_start + error_length]
+        ).decode(errors="replace")
+        if status in (RAISED, OUT_OF_MEMORY):
+            raise (
+                BotOutOfMemoryException
+                if status == OUT_OF_MEMORY
+                else BotRaisedException
+            )(error)
+        if status == TIMED_OUT:
+            raise BotTimedOutException(cpu_time)
+        raise InvalidReplyException(error)
+
+    def close(self):
+        """Stops a serving bot and detaches from the shared memory."""
+        if self.owner:
+            # the stop flag
+            self.shm.buf[8] = 1
+            self.to_bot.release()
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    # the bot's side
+
+    def serve(self, player, call=call_directly):
+        """Answers move requests with `player.make_move()` until closed.
+
+        `call(func, budget)` runs each move, see `call_directly()`.
+        """
+        buf = self.shm.buf
+        # the board stays in place, so one view serves every move
+        view = StateView(buf, BOARD_START, self.width, self.height, Side.RED, 4)
+        while True:
+            self.to_bot.acquire()
+            seq, _, _, win_length, next_side, stop, budget = REQUEST.unpack_from(buf)
+            if stop:
+                break
+
+            view.next_side, view.win_length = Side(next_side), win_length
+            in_time, move, error, cpu_time = call(
+                lambda: player.make_move(view), None if budget < 0 else budget
+            )
+
+            if not in_time:
+                self.reply(seq, TIMED_OUT, cpu_time=cpu_time)
+            elif error:
+                self.reply(seq, RAISED, cpu_time=cpu_time, error=error)
+            elif isinstance(move, int) and -(2**15) <= move < 2**15:
+                self.reply(seq, OK, move, cpu_time)
+            else:
+                self.reply(seq, INVALID, cpu_time=cpu_time, error=describe(move))
+
+        self.shm.close()
+
+    def reply(
+        self, seq: int, status: int, move: int = 0, cpu_time: float = 0, error: str = ""
+    ):
+        """Answers request `seq`, 0 answers before the first request."""
+        buf = self.shm.buf
+        if status == RAISED and error.rstrip().splitlines()[-1].startswith(
+            "MemoryError"
+        ):
+            status = OUT_OF_MEMORY
+        data = error.encode()[:ERROR_SIZE]
+        buf[self.error_start : self.error_start + len(data)] = data
+        REPLY.pack_into(buf, REQUEST.size, seq, status, move, cpu_time, len(data))
+        self.to_runner.release()
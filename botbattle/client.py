@@ -1,9 +1,12 @@
+import asyncio
+import importlib.util
 from logging import basicConfig, getLogger
+from typing import AsyncIterator
 
 import httpx
 
 from .players import make_code
-from .protocol import VersionInfo
+from .protocol import ParticipantInfo, VersionInfo
 
 logger = getLogger(__name__)
 info = logger.info
@@ -61,30 +64,123 @@ class BotClient:
         response = self.get("/latest_versions_info/")
         response.raise_for_status()
 
-        versions = [VersionInfo(**row) for row in response.json()]
+        log_versions([VersionInfo(**row) for row in response.json()])
 
-        for version in versions:
-            beginning = f"{version.created_at.strftime('%Y-%m-%d %H:%M:%S')}, {version.loc:3} loc:"
 
-            if version.exception:
-                content = "crashed"
+class AsyncBotClient:
+    """Non-blocking client that receives game results as they are saved.
+
+    Several clients can share one `http_client` (see `make_http_client()`),
+    so thousands of bots can run over a single HTTP/2 connection pool.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        bot_cls,
+        dispatcher_url,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        debug(f"Initializing AsyncBotClient with token: {token}")
+
+        self.bot_token = token
+        self.bot_cls = bot_cls
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+        self.code = make_code(self.bot_cls)
+
+        self.owns_http_client = http_client is None
+        self.http_client = http_client or self.make_http_client(dispatcher_url)
+
+    @staticmethod
+    def make_http_client(dispatcher_url, **kwargs) -> httpx.AsyncClient:
+        # HTTP/2 needs the optional h2 package
+        http2 = importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+            base_url=dispatcher_url, http2=http2, timeout=None, **kwargs
+        )
+
+    async def aclose(self):
+        if self.owns_http_client:
+            await self.http_client.aclose()
+
+    async def run(self, max_results: int | None = None):
+        info("Running")
+        await self.send_code()
+        log_versions(await self.get_latest_versions_info())
+
+        received = 0
+        async for part_info in self.stream_results():
+            info(f"Game result: {part_info.result}")
+            if part_info.exception:
+                info(f"Exception raised:\n{part_info.exception.msg}")
+
+            received += 1
+            if max_results and received >= max_results:
+                break
+
+    async def send_code(self) -> bool:
+        info("Sending code to the server")
+
+        result = await self.http_client.post(
+            "/update_code", json=self.code.dict(), headers=self.headers
+        )
+        result.raise_for_status()
+
+        updated = result.json()["updated"]
+        info("Code updated, new games scheduled" if updated else "Code hasn't changed")
+        return updated
+
+    async def get_latest_versions_info(self) -> list[VersionInfo]:
+        response = await self.http_client.get(
+            "/latest_versions_info/", headers=self.headers
+        )
+        response.raise_for_status()
+        return [VersionInfo(**row) for row in response.json()]
+
+    async def stream_results(
+        self, reconnect_delay: float = 1
+    ) -> AsyncIterator[ParticipantInfo]:
+        """Yields results of this bot's games as the dispatcher saves them."""
+        while True:
+            try:
+                async with self.http_client.stream(
+                    "GET", "/results/stream", headers=self.headers
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.startswith("data:"):
+                            yield ParticipantInfo.parse_raw(line[len("data:") :])
+
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                error(f"Results stream interrupted: {exc!r}")
+
+            await asyncio.sleep(reconnect_delay)
+
+
+def log_versions(versions: list[VersionInfo]):
+    for version in versions:
+        beginning = f"{version.created_at.strftime('%Y-%m-%d %H:%M:%S')}, {version.loc:3} loc:"
+
+        if version.exception:
+            content = "crashed"
+        else:
+            stats = version.stats
+            total = stats.victories + stats.losses + stats.ties
+            if total:
+                content = (
+                    f"wins={stats.victories:3}({stats.victories/total:3.0%}), "
+                    f"losses={stats.losses:3}({stats.losses/total:3.0%}), "
+                    f"ties={stats.ties:3}({stats.ties/total:3.0%})"
+                )
             else:
-                stats = version.stats
-                total = stats.victories + stats.losses + stats.ties
-                if total:
-                    content = (
-                        f"wins={stats.victories:3}({stats.victories/total:3.0%}), "
-                        f"losses={stats.losses:3}({stats.losses/total:3.0%}), "
-                        f"ties={stats.ties:3}({stats.ties/total:3.0%})"
-                    )
-                else:
-                    content = "no games played"
-
-            info(f"{beginning}: {content}")
-
-        if versions[-1].exception:
-            info(
-                f"The latest version raised an exception:\n"
-                f"{versions[-1].exception.msg}\n"
-                f"The move was '{versions[-1].exception.move}'"
-            )
+                content = "no games played"
+
+        info(f"{beginning}: {content}")
+
+    if versions and versions[-1].exception:
+        info(
+            f"The latest version raised an exception:\n"
+            f"{versions[-1].exception.msg}\n"
+            f"The move was '{versions[-1].exception.move}'"
+        )
@@ -1,5 +1,6 @@
 import inspect
 from abc import ABCMeta, abstractmethod
+from types import CodeType
 
 from .protocol import Code
 from .side import Side
@@ -27,15 +28,32 @@ class IncorrectInheritanceException(IncorrectPlayerCodeException):
     ...
 
 
-def make_code(cls: PlayerAbstract, skip_checks=False) -> Code:
-    if not skip_checks and not issubclass(cls, PlayerAbstract):
+def check_inheritance(cls: type):
+    if not (isinstance(cls, type) and issubclass(cls, PlayerAbstract)):
         raise IncorrectInheritanceException(
-            f"{cls.__name__} should inherit from PlayerAbstract"
+            f"{getattr(cls, '__name__', cls)} should inherit from PlayerAbstract"
         )
 
+
+def make_code(cls: PlayerAbstract, skip_checks=False) -> Code:
+    if not skip_checks:
+        check_inheritance(cls)
+
     return Code(source=inspect.getsource(cls), cls_name=cls.__name__)
 
 
-def init_bot(code: Code, side: Side) -> PlayerAbstract:
-    exec(code.source, globals())
-    return globals()[code.cls_name](side)
+def init_bot(
+    code: Code, side: Side, skip_checks=True, compiled: CodeType | None = None
+) -> PlayerAbstract:
+    # a namespace of its own, so bots can't replace this module's names or
+    # each other's classes
+    namespace = {**globals(), "__name__": "bot"}
+    # runners pass the code compiled once, see botbattle/sandbox.py
+    exec(compiled or code.source, namespace)
+    cls = namespace[code.cls_name]
+
+    # runners play code that the dispatcher has already checked
+    if not skip_checks:
+        check_inheritance(cls)
+
+    return cls(side)
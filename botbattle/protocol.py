@@ -1,6 +1,7 @@
+import hashlib
 from datetime import datetime
 from typing import Any
-from pydantic import BaseModel, UUID4, AnyHttpUrl
+from pydantic import BaseModel, UUID4, AnyHttpUrl, Field
 
 from .side import Side
 from .state import State
@@ -10,31 +11,74 @@ class Code(BaseModel):
     source: str
     cls_name: str
 
+    def digest(self) -> str:
+        """Content address of the code, the same for the same class in any bot."""
+        content = f"{self.cls_name}\n{self.source}".encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
+
+class GameConfig(BaseModel):
+    """Rules of a game variant. Defaults are the classic 7x7 connect-4."""
+
+    board_width: int = Field(7, gt=0)
+    board_height: int = Field(7, gt=0)
+    win_length: int = Field(4, gt=1)
+    first_side: Side = Side.BLUE
+    # budgets are CPU seconds used by the bot itself
+    move_timeout: float = Field(0.1, gt=0)
+    init_timeout: float = Field(0.1, gt=0)
+    # chess clock: if set, a total budget per side for the whole game
+    # that replaces the per-move timeout
+    game_budget: float | None = Field(None, gt=0)
+
+    def initial_state(self) -> State:
+        return State(
+            board=[[None] * self.board_width for _ in range(self.board_height)],
+            next_side=self.first_side,
+            win_length=self.win_length,
+        )
+
+
+class Span(BaseModel):
+    """A stage of a game's way through the services, in unix time seconds."""
+
+    name: str
+    start: float
+    end: float
+
 
 class RunGameTask(BaseModel):
     game_id: UUID4
     callback: AnyHttpUrl
-    blue_code: Code
-    red_code: Code
+    # runners fetch the code by its digest from {code_url}/{digest} and cache it
+    code_url: AnyHttpUrl
+    blue_code: str
+    red_code: str
+    config: GameConfig = GameConfig()
+    # stages the game went through so far, see common/tracing.py
+    trace: list[Span] = []
 
 
 class ExceptionInfo(BaseModel):
     msg: str
     caused_by_side: Side
-    move: Any
+    move: Any = None
 
 
 class GameLog(BaseModel):
     game_id: UUID4
     states: list[State]
-    winner: Side | None
-    exception: ExceptionInfo | None
+    # CPU seconds used by the bot for each move, in the order of moves
+    move_times: list[float] = []
+    winner: Side | None = None
+    exception: ExceptionInfo | None = None
+    trace: list[Span] = []
 
 
 class ParticipantInfo(BaseModel):
     created_at: datetime
     result: str
-    exception: ExceptionInfo | None
+    exception: ExceptionInfo | None = None
 
 
 class VersionStats(BaseModel):
@@ -46,5 +90,24 @@ class VersionStats(BaseModel):
 class VersionInfo(BaseModel):
     created_at: datetime
     loc: int
-    exception: ExceptionInfo | None
-    stats: VersionStats | None
+    exception: ExceptionInfo | None = None
+    stats: VersionStats | None = None
+
+
+class Standing(BaseModel):
+    games: int
+    victories: int
+    losses: int
+    ties: int
+    crashes: int
+    crash_rate: float
+    rating: float
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    bot_id: int
+    standing: Standing
+    # the bot's newest version that has played and its own results
+    version_id: int | None = None
+    version_standing: Standing | None = None
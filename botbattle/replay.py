@@ -0,0 +1,121 @@
+import struct
+from dataclasses import dataclass, field
+from typing import Iterator
+from uuid import UUID
+
+from .protocol import GameConfig
+from .side import Side
+from .state import State
+
+# magic, format version, game id, width, height, win length, first side,
+# winner (NO_WINNER for ties and crashes), number of moves
+HEADER = struct.Struct("<3sB16sBBBBBH")
+MAGIC = b"BBR"
+FORMAT_VERSION = 1
+NO_WINNER = 255
+
+
+class ReplayFormatException(Exception):
+    ...
+
+
+@dataclass
+class Replay:
+    """A recorded game: the rules it was played by and the column of every move."""
+
+    game_id: UUID
+    config: GameConfig = field(default_factory=GameConfig)
+    moves: list[int] = field(default_factory=list)
+    winner: Side | None = None
+
+    def to_bytes(self) -> bytes:
+        header = HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            self.game_id.bytes,
+            self.config.board_width,
+            self.config.board_height,
+            self.config.win_length,
+            self.config.first_side.value,
+            NO_WINNER if self.winner is None else self.winner.value,
+            len(self.moves),
+        )
+        return header + bytes(self.moves)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Replay":
+        try:
+            (
+                magic,
+                version,
+                game_id,
+                width,
+                height,
+                win_length,
+                first_side,
+                winner,
+                move_count,
+            ) = HEADER.unpack_from(data)
+        except struct.error as exc:
+            raise ReplayFormatException(str(exc))
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ReplayFormatException(
+                f"Unsupported replay format {magic!r} v{version}"
+            )
+
+        moves = data[HEADER.size : HEADER.size + move_count]
+        if len(moves) != move_count:
+            raise ReplayFormatException("Replay is truncated")
+
+        return Replay(
+            game_id=UUID(bytes=game_id),
+            config=GameConfig(
+                board_width=width,
+                board_height=height,
+                win_length=win_length,
+                first_side=Side(first_side),
+            ),
+            moves=list(moves),
+            winner=None if winner == NO_WINNER else Side(winner),
+        )
+
+    @staticmethod
+    def from_states(
+        game_id: UUID, states: list[State], winner: Side | None = None
+    ) -> "Replay":
+        """Recovers the moves of a game from its consecutive states."""
+        if not states:
+            return Replay(game_id=game_id, winner=winner)
+
+        first = states[0]
+        config = GameConfig(
+            board_width=first.len_x(),
+            board_height=first.len_y(),
+            win_length=first.win_length,
+            first_side=first.next_side,
+        )
+
+        moves = []
+        for before, after in zip(states, states[1:]):
+            moves.append(
+                next(
+                    x
+                    for row_before, row_after in zip(before.board, after.board)
+                    for x, (cell_before, cell_after) in enumerate(
+                        zip(row_before, row_after)
+                    )
+                    if cell_before != cell_after
+                )
+            )
+
+        return Replay(game_id=game_id, config=config, moves=moves, winner=winner)
+
+    def states(self) -> Iterator[State]:
+        """Replays the game, yielding the state before every move and the final one."""
+        state = self.config.initial_state()
+        yield state.copy(deep=True)
+
+        for move in self.moves:
+            state.drop_token(move)
+            yield state.copy(deep=True)
@@ -0,0 +1,394 @@
+"""Where bot code runs: in threads of the runner, or in processes of its own.
+The dispatcher tries uploaded code out the same way, see dispatcher/preflight.py.
+
+With BOT_SANDBOX=process, the default where `resource` is available, each
+bot of a game gets a process forked from a clean fork server. Before the
+bot's code is loaded, the process lowers its limits for good:
+
+- RLIMIT_AS to BOT_MEMORY_MB, past it allocations raise MemoryError;
+- RLIMIT_CPU to BOT_CPU_SECONDS for the whole game, past it SIGXCPU ends it;
+- RLIMIT_NOFILE to BOT_MAX_OPEN_FILES.
+
+It also drops the environment but for BOT_ENVIRONMENT, so secrets such as
+DATABASE_URI or INTERNAL_TOKEN aren't the bot's to read.
+
+With the optional `seccomp` module (libseccomp's bindings) the process also
+can't start programs or processes, or open sockets. No requirements file
+installs it, it comes with the system's libseccomp packages. Without it bots
+are not isolated from the network. Moves are asked for over
+a botbattle.channel.BoardChannel, and the bot's threads die with its process
+at the end of the game, so a bad bot can only hurt its own game.
+
+With BOT_SANDBOX=thread bots share the runner's process, its GIL and its
+environment, as before.
+"""
+
+import errno
+import functools
+import marshal
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import signal
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from dataclasses import dataclass
+from traceback import format_exc
+
+from .channel import (
+    OK,
+    RAISED,
+    TIMED_OUT,
+    BoardChannel,
+    BotExitedException,
+    BotOutOfMemoryException,
+    BotRaisedException,
+    BotTimedOutException,
+    InvalidReplyException,
+)
+from .players import init_bot
+from .protocol import Code, GameConfig
+from .side import Side
+from .state import State
+
+try:
+    import resource
+except ImportError:  # not on Windows, bots run in threads there
+    resource = None
+
+try:
+    import seccomp
+except ImportError:  # optional, limits the system calls bots can make
+    seccomp = None
+
+# hard wall-clock limit for a call, relative to its CPU budget
+WALL_CLOCK_FACTOR = 5
+CPU_POLL_INTERVAL = 0.005
+HAS_THREAD_CPU_CLOCK = hasattr(time, "pthread_getcpuclockid")
+
+BOT_SANDBOX = os.environ.get("BOT_SANDBOX", "process" if resource else "thread")
+BOT_MEMORY_MB = int(os.environ.get("BOT_MEMORY_MB", 512))
+BOT_CPU_SECONDS = int(os.environ.get("BOT_CPU_SECONDS", 60))
+BOT_MAX_OPEN_FILES = int(os.environ.get("BOT_MAX_OPEN_FILES", 64))
+COMPILED_CODE_CACHE_SIZE = int(os.environ.get("COMPILED_CODE_CACHE_SIZE", 256))
+
+# wall time on top of a bot's own limits before the runner gives up on its
+# process: for starting the process and loading the bot
+PROCESS_GRACE_SECONDS = 10
+# and for a move, handing the board over and the reply back. A bot that holds
+# its process's GIL in C code is given up on after this, not after the above.
+MOVE_GRACE_SECONDS = 0.1
+
+# the environment variables bot processes keep
+BOT_ENVIRONMENT = ("PATH", "HOME", "LANG", "LC_ALL", "TZ", "BOTBATTLE_BOOK")
+
+CLONE_THREAD = 0x10000
+
+# bot processes are forked from a server, forking the runner itself would copy
+# its threads' locks
+context = multiprocessing.get_context("forkserver") if resource else None
+if context:
+    context.set_forkserver_preload([__name__])
+
+main_module_lock = threading.Lock()
+
+
+@dataclass
+class CallResult:
+    in_time: bool
+    result: object = None
+    # the traceback if the bot raised
+    error: str | None = None
+    cpu_time: float = 0.0
+    # the limit the bot ran into: "memory", "cpu" or "exited"
+    breach: str | None = None
+
+
+class BotCall:
+    """Runs bot code in a separate thread and accounts for the CPU time it uses.
+
+    Budgets are in CPU seconds of the bot's own thread, so time spent waiting
+    for the GIL while other games run on the same host is not charged to the bot.
+    A wall-clock limit of WALL_CLOCK_FACTOR budgets still catches bots that
+    block without using CPU.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.result = None
+        self.exc: str | None = None
+        self.cpu_time = 0.0
+        self.clock_id: int | None = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        if HAS_THREAD_CPU_CLOCK:
+            self.clock_id = time.pthread_getcpuclockid(threading.get_ident())
+
+        start = time.thread_time()
+        try:
+            self.result = self.func()
+        # SystemExit and the like too, or the bot would look like it timed out
+        except BaseException:
+            self.exc = format_exc()
+        finally:
+            self.cpu_time = time.thread_time() - start
+
+    def wait(self, budget: float) -> bool:
+        """Starts the call and waits for it. Returns False if it ran out of time."""
+        self.thread.start()
+
+        if not HAS_THREAD_CPU_CLOCK:
+            self.thread.join(budget)
+            return not self.thread.is_alive()
+
+        deadline = time.monotonic() + budget * WALL_CLOCK_FACTOR
+
+        while True:
+            timeout = min(CPU_POLL_INTERVAL, deadline - time.monotonic())
+            self.thread.join(max(timeout, 0))
+
+            if not self.thread.is_alive():
+                return self.cpu_time <= budget
+
+            if time.monotonic() >= deadline:
+                return False
+
+            used = self.used_cpu_time()
+            if used is not None and used > budget:
+                self.cpu_time = used
+                return False
+
+    def used_cpu_time(self) -> float | None:
+        # the clock id stays valid only while the thread is running
+        if self.clock_id is None:
+            return None
+        try:
+            return time.clock_gettime(self.clock_id)
+        except OSError:
+            return None
+
+
+def call_in_thread(func, budget: float) -> tuple[bool, object, str | None, float]:
+    call = BotCall(func)
+    in_time = call.wait(budget)
+    return in_time, call.result, call.exc, call.cpu_time
+
+
+class ThreadBot:
+    def __init__(self, code: Code, side: Side, config: GameConfig, skip_checks=True):
+        self.code = code
+        self.side = side
+        self.skip_checks = skip_checks
+        self.player = None
+
+    def init(self, timeout: float) -> CallResult:
+        compiled = compile_code(self.code.source)
+        in_time, self.player, error, cpu_time = call_in_thread(
+            lambda: init_bot(
+                self.code, self.side, self.skip_checks, load_compiled(compiled)
+            ),
+            timeout,
+        )
+        return CallResult(in_time, self.player, error, cpu_time)
+
+    def make_move(self, state: State, budget: float) -> CallResult:
+        return CallResult(*call_in_thread(lambda: self.player.make_move(state), budget))
+
+    def close(self):
+        ...
+
+
+class ProcessBot:
+    def __init__(self, code: Code, side: Side, config: GameConfig, skip_checks=True):
+        self.code = code
+        self.side = side
+        self.skip_checks = skip_checks
+        self.channel = BoardChannel(config.board_width, config.board_height, context)
+        self.process = None
+
+    def init(self, timeout: float) -> CallResult:
+        process = context.Process(
+            target=run_bot,
+            args=(
+                self.channel,
+                self.code,
+                self.side,
+                timeout,
+                BOT_MEMORY_MB,
+                BOT_CPU_SECONDS,
+                BOT_MAX_OPEN_FILES,
+                self.skip_checks,
+                compile_code(self.code.source),
+            ),
+            daemon=True,
+        )
+        with without_main_module():
+            process.start()
+        self.process = process
+        return self.call(
+            lambda: self.channel.receive(
+                self.wall_time(timeout, PROCESS_GRACE_SECONDS), self.alive
+            )
+        )
+
+    def make_move(self, state: State, budget: float) -> CallResult:
+        return self.call(
+            lambda: self.channel.request_move(
+                state, self.wall_time(budget, MOVE_GRACE_SECONDS), budget, self.alive
+            )
+        )
+
+    def call(self, receive) -> CallResult:
+        try:
+            move, cpu_time = receive()
+            return CallResult(True, move, cpu_time=cpu_time)
+
+        except BotTimedOutException as exc:
+            return CallResult(False, cpu_time=exc.cpu_time or 0.0)
+
+        except BotOutOfMemoryException as exc:
+            return CallResult(True, error=exc.args[0], breach="memory")
+
+        except BotRaisedException as exc:
+            return CallResult(True, error=exc.args[0])
+
+        # not a move, the runner reports it by its repr
+        except InvalidReplyException as exc:
+            return CallResult(True, exc.args[0])
+
+        except BotExitedException:
+            self.process.join()
+            breach = "cpu" if self.process.exitcode == -signal.SIGXCPU else "exited"
+            return CallResult(True, breach=breach)
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    @staticmethod
+    def wall_time(budget: float, grace: float) -> float:
+        return budget * WALL_CLOCK_FACTOR + grace
+
+    def close(self):
+        self.channel.close()
+        if self.process:
+            self.process.join(CPU_POLL_INTERVAL)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.channel.unlink()
+
+
+@contextmanager
+def without_main_module():
+    """Bot processes need nothing from the runner's main module, but
+    multiprocessing would run it again in each of them, as with "spawn"."""
+    with main_module_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def warm_up():
+    if BOT_SANDBOX == "process":
+        multiprocessing.forkserver.ensure_running()
+
+
+BOTS = {"thread": ThreadBot, "process": ProcessBot}
+
+
+@functools.lru_cache(COMPILED_CODE_CACHE_SIZE)
+def compile_code(source: str) -> bytes | None:
+    """Bot code compiled once per runner, marshalled for the bots' processes.
+
+    None if it doesn't compile, init_bot() then raises the error in the bot.
+    """
+    try:
+        return marshal.dumps(compile(source, "<string>", "exec"))
+    except (SyntaxError, ValueError):
+        return None
+
+
+def load_compiled(compiled: bytes | None) -> types.CodeType | None:
+    return marshal.loads(compiled) if compiled else None
+
+
+def start_bot(
+    code: Code, side: Side, config: GameConfig, skip_checks=True
+) -> ThreadBot | ProcessBot:
+    return BOTS[BOT_SANDBOX](code, side, config, skip_checks)
+
+
+def run_bot(
+    channel: BoardChannel,
+    code: Code,
+    side: Side,
+    init_timeout: float,
+    memory_mb: int,
+    cpu_seconds: int,
+    max_open_files: int,
+    skip_checks: bool = True,
+    compiled: bytes | None = None,
+):
+    """The bot's process: loads its code, then answers move requests."""
+    clear_environment()
+    limit_resources(memory_mb, cpu_seconds, max_open_files)
+    limit_system_calls()
+
+    in_time, player, error, cpu_time = call_in_thread(
+        lambda: init_bot(code, side, skip_checks, load_compiled(compiled)),
+        init_timeout,
+    )
+    # the reply before any request
+    if not in_time:
+        channel.reply(0, TIMED_OUT, cpu_time=cpu_time)
+    elif error:
+        channel.reply(0, RAISED, cpu_time=cpu_time, error=error)
+    else:
+        channel.reply(0, OK, cpu_time=cpu_time)
+        channel.serve(player, call_in_thread)
+
+
+def clear_environment():
+    for name in list(os.environ):
+        if name not in BOT_ENVIRONMENT:
+            del os.environ[name]
+
+
+def limit_resources(memory_mb: int, cpu_seconds: int, max_open_files: int):
+    # soft and hard limits alike, so the bot can't raise them back.
+    # RLIMIT_CPU sends SIGXCPU at the soft limit and SIGKILL a second later.
+    for limit, soft, hard in [
+        (resource.RLIMIT_AS, memory_mb * 2**20, memory_mb * 2**20),
+        (resource.RLIMIT_CPU, cpu_seconds, cpu_seconds + 1),
+        (resource.RLIMIT_NOFILE, max_open_files, max_open_files),
+    ]:
+        # limits can only go down
+        _, current = resource.getrlimit(limit)
+        if current != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current), min(hard, current)
+        resource.setrlimit(limit, (soft, hard))
+
+
+def limit_system_calls():
+    if not seccomp:
+        return
+
+    rules = seccomp.SyscallFilter(defaction=seccomp.ALLOW)
+    for name in ("execve", "execveat", "fork", "vfork", "socket", "ptrace"):
+        rules.add_rule(seccomp.ERRNO(errno.EPERM), name)
+    # new threads are fine, moves run in them, new processes are not
+    rules.add_rule(
+        seccomp.ERRNO(errno.EPERM),
+        "clone",
+        seccomp.Arg(0, seccomp.MASKED_EQ, CLONE_THREAD, 0),
+    )
+    # its flags can't be checked, so C libraries fall back to clone
+    rules.add_rule(seccomp.ERRNO(errno.ENOSYS), "clone3")
+    rules.load()
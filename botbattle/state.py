@@ -7,6 +7,9 @@ from pydantic import BaseModel
 from .side import Side
 
 
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
 class StateException(Exception):
     pass
 
@@ -83,6 +86,7 @@ class State(BaseModel):
 
     board: list[list[Side | None]] = [[None] * 7 for _ in range(7)]
     next_side: Side
+    win_length: int = 4
 
     @icontract.require(lambda self, vec: self.vector_in_bounds(vec))
     def line(self, vec: Vector) -> tuple[Side | None]:
@@ -106,7 +110,33 @@ class State(BaseModel):
         if self.all_cells_filled():
             return [Side.RED, Side.BLUE]
 
-        return [side for side in Side if self.find_all_lines(4, side)]
+        found = self.sides_with_lines(self.win_length)
+        return [side for side in Side if side in found]
+
+    def sides_with_lines(self, length: int) -> set[Side]:
+        # a plain scan over the board: works for any board size and line length
+        # and is much cheaper than building vectors with find_all_lines()
+        board = self.board
+        len_x, len_y = self.len_x(), self.len_y()
+        last = length - 1
+        found = set()
+
+        for y, row in enumerate(board):
+            for x, side in enumerate(row):
+                if side is None or side in found:
+                    continue
+
+                for dx, dy in DIRECTIONS:
+                    if not (0 <= x + dx * last < len_x and 0 <= y + dy * last < len_y):
+                        continue
+
+                    if all(
+                        board[y + i * dy][x + i * dx] == side for i in range(1, length)
+                    ):
+                        found.add(side)
+                        break
+
+        return found
 
     def all_cells_filled(self) -> bool:
         return all(all(line) for line in self.board)
@@ -116,7 +146,7 @@ class State(BaseModel):
         return tuple(
             itertools.chain.from_iterable(
                 self.find_all_generic(dx, dy, length, side)
-                for dx, dy in [[1, 0], [0, 1], [1, 1], [1, -1]]
+                for dx, dy in DIRECTIONS
             )
         )
 
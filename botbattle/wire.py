@@ -0,0 +1,156 @@
+"""Wire formats for game logs sent from runners to the dispatcher.
+
+JSON is always available. With msgpack installed, logs can also go as
+`application/msgpack`, where each board is packed into one byte per cell
+and decoding builds states without re-validating every cell.
+"""
+
+from uuid import UUID
+
+from .protocol import ExceptionInfo, GameLog, Span
+from .side import Side
+from .state import State
+
+try:
+    import msgpack
+except ImportError:  # the JSON fallback works without it
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# cell bytes of packed boards
+CELLS = (None, Side.RED, Side.BLUE)
+
+# pydantic 1 calls it construct(), pydantic 2 deprecates that name
+construct_state = getattr(State, "model_construct", State.construct)
+construct_game_log = getattr(GameLog, "model_construct", GameLog.construct)
+
+
+class WireFormatException(Exception):
+    ...
+
+
+def supported_media_types() -> list[str]:
+    """Formats this process can read and write, preferred first."""
+    return [MSGPACK, JSON] if msgpack else [JSON]
+
+
+def negotiate(accept: str | None) -> str:
+    """The preferred supported format among those listed in an Accept header."""
+    accepted = {
+        media_type.split(";")[0].strip() for media_type in (accept or "").split(",")
+    }
+    for media_type in supported_media_types():
+        if media_type in accepted:
+            return media_type
+    return JSON
+
+
+def encode_game_log(log: GameLog, media_type: str = JSON) -> bytes:
+    if media_type == JSON:
+        return log.json().encode("utf-8")
+    if media_type == MSGPACK and msgpack:
+        # a move that broke the rules can be any object a bot returned
+        return msgpack.packb(pack_game_log(log), default=repr)
+    raise WireFormatException(f"Unsupported media type {media_type}")
+
+
+def decode_game_log(data: bytes, media_type: str | None = JSON) -> GameLog:
+    media_type = (media_type or JSON).split(";")[0].strip()
+    if media_type == JSON:
+        return GameLog.parse_raw(data)
+    if media_type == MSGPACK and msgpack:
+        try:
+            return unpack_game_log(msgpack.unpackb(data))
+        except (ValueError, KeyError, TypeError, IndexError) as exc:
+            raise WireFormatException(f"Malformed game log: {exc}")
+    raise WireFormatException(f"Unsupported media type {media_type}")
+
+
+def pack_game_log(log: GameLog) -> dict:
+    first = log.states[0] if log.states else None
+    height = len(first.board) if first else 0
+    width = len(first.board[0]) if height else 0
+
+    red = Side.RED
+    boards = bytearray()
+    for state in log.states:
+        for row in state.board:
+            boards.extend(
+                [0 if cell is None else 1 if cell is red else 2 for cell in row]
+            )
+
+    return {
+        "game_id": log.game_id.bytes,
+        "width": width,
+        "height": height,
+        "win_length": first.win_length if first else 0,
+        "boards": bytes(boards),
+        "next_sides": bytes(state.next_side.value for state in log.states),
+        "move_times": log.move_times,
+        "trace": [[span.name, span.start, span.end] for span in log.trace],
+        "winner": None if log.winner is None else log.winner.value,
+        "exception": (
+            {
+                "msg": log.exception.msg,
+                "caused_by_side": log.exception.caused_by_side.value,
+                "move": log.exception.move,
+            }
+            if log.exception
+            else None
+        ),
+    }
+
+
+class DecodedRows(dict):
+    # most rows repeat from state to state, so each is decoded once per log
+    def __missing__(self, packed_row: bytes) -> tuple:
+        row = self[packed_row] = tuple(CELLS[cell] for cell in packed_row)
+        return row
+
+
+def unpack_game_log(packed: dict) -> GameLog:
+    width, height = packed["width"], packed["height"]
+    boards, next_sides = packed["boards"], packed["next_sides"]
+
+    if len(boards) != len(next_sides) * width * height:
+        raise ValueError("boards do not match the number of states")
+
+    # the layout is checked above and every cell maps to a Side, so the
+    # states are built without running the validators on each cell
+    rows = DecodedRows()
+    size = width * height
+    states = []
+    for i, next_side in enumerate(next_sides):
+        board = [
+            list(rows[boards[offset : offset + width]])
+            for offset in range(i * size, (i + 1) * size, width)
+        ]
+        states.append(
+            construct_state(
+                board=board,
+                next_side=Side(next_side),
+                win_length=packed["win_length"],
+            )
+        )
+
+    exception = packed["exception"]
+    if exception:
+        exception = ExceptionInfo(
+            msg=exception["msg"],
+            caused_by_side=Side(exception["caused_by_side"]),
+            move=exception["move"],
+        )
+
+    return construct_game_log(
+        game_id=UUID(bytes=packed["game_id"]),
+        states=states,
+        move_times=packed["move_times"],
+        trace=[
+            Span(name=name, start=start, end=end)
+            for name, start, end in packed.get("trace", [])
+        ],
+        winner=None if packed["winner"] is None else Side(packed["winner"]),
+        exception=exception,
+    )
@@ -1,13 +1,15 @@
+import functools
 import logging
 import os
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.log import InstanceLogger
-from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.orm import declarative_base, sessionmaker
 
-Base = declarative_base()
+from . import metrics
 
-database_uri = os.environ["DATABASE_URI"]
+Base = declarative_base()
 
 
 def pretty_log(self, level, msg, *args, **kwargs):
@@ -19,17 +21,51 @@ def pretty_log(self, level, msg, *args, **kwargs):
         selected_level = self.logger.getEffectiveLevel()
 
     if level >= selected_level:
-
-        import sqlparse
-
         msg = sqlparse.format(msg, reindent=True, keyword_case="upper")
 
         self.logger._log(level, "\n" + msg, args, **kwargs)
 
 
-InstanceLogger.log = pretty_log
+def enable_sql_pretty_print():
+    """Reindents logged SQL. Formatting every statement is slow, so it is opt-in."""
+    global sqlparse
+    import sqlparse
+
+    InstanceLogger.log = pretty_log
+
+
+@functools.cache
+def get_engine() -> Engine:
+    # created on first use, so importing the models needs neither
+    # DATABASE_URI nor a database driver
+    if os.environ.get("SQL_PRETTY_PRINT"):
+        enable_sql_pretty_print()
+
+    engine = create_engine(os.environ["DATABASE_URI"])
+    engine.echo = False
+    metrics.instrument_engine(engine)
+    return engine
+
+
+class LazySessionMaker(sessionmaker):
+    def __call__(self, **local_kw):
+        self.bind_engine()
+        return super().__call__(**local_kw)
+
+    def begin(self):
+        self.bind_engine()
+        return super().begin()
+
+    def bind_engine(self):
+        if self.kw["bind"] is None:
+            self.configure(bind=get_engine())
+
+
+SessionLocal = LazySessionMaker()
 
 
-engine = create_engine(database_uri)
-engine.echo = False
-SessionLocal: Session = sessionmaker(bind=engine)
+def __getattr__(name):
+    # `from common.database import engine` keeps working
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
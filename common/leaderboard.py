@@ -0,0 +1,233 @@
+"""Standings of bots and of their versions, kept up to date as results are saved.
+
+Each game with a result is added to `bot_standings` and `version_standings`
+in the transaction that saves the result, so standings never need a pass
+over `participants`. Ratings are Elo ratings, both a bot's and a version's
+move against the rating of the opponent bot. Crashes count as games and
+towards the crash rate, but as neither victories nor losses, and leave
+ratings as they are.
+
+Reads go to a `Leaderboard`, a snapshot of the standings in memory ranked
+by rating, so they cost the same however many games there are.
+"""
+
+import itertools
+import time
+
+from botbattle import LeaderboardEntry, Standing
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import (
+    VOID,
+    BotStanding,
+    Game,
+    Participant,
+    Tally,
+    VersionStanding,
+)
+
+RATING_K = 32
+SCORES = {"victory": 1.0, "loss": 0.0, "tie": 0.5}
+COUNTERS = {
+    "victory": "victories",
+    "loss": "losses",
+    "tie": "ties",
+    "crashed": "crashes",
+}
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def add_result(tally: Tally, result: str, opponent_rating: float):
+    tally.games += 1
+    if result in COUNTERS:
+        counter = COUNTERS[result]
+        setattr(tally, counter, getattr(tally, counter) + 1)
+    if result in SCORES:
+        tally.rating += RATING_K * (
+            SCORES[result] - expected_score(tally.rating, opponent_rating)
+        )
+
+
+def record_game(db: Session, participants: list[Participant]) -> list[LeaderboardEntry]:
+    """Adds a game's results to the standings of its bots and versions.
+
+    Returns the new standings for `Leaderboard.update()`.
+    """
+    bots = lock_standings(
+        db, BotStanding, {p.bot_id: BotStanding(p.bot_id) for p in participants}
+    )
+    versions = lock_standings(
+        db,
+        VersionStanding,
+        {
+            p.version_id: VersionStanding(p.version_id, p.bot_id)
+            for p in participants
+            if p.version_id
+        },
+    )
+    add_game(bots, versions, participants)
+
+    return [
+        make_entry(bots[p.bot_id], versions.get(p.version_id)) for p in participants
+    ]
+
+
+def lock_standings(db: Session, model: type[Tally], new_rows: dict) -> dict:
+    """Rows of `model` by primary key, locked for the transaction. Keys without
+    a row get theirs from `new_rows`."""
+    rows = {}
+    # in the same order everywhere, so games of the same bots can't deadlock
+    for key in sorted(new_rows):
+        row = db.get(model, key, with_for_update=True)
+        if row is None:
+            # if another dispatcher adds the same row meanwhile, one of the
+            # transactions fails and its runner delivers the result again
+            row = new_rows[key]
+            db.add(row)
+        rows[key] = row
+    return rows
+
+
+def add_game(bots: dict, versions: dict, participants: list[Participant]):
+    # both sides against the ratings from before the game
+    ratings = {p.bot_id: bots[p.bot_id].rating for p in participants}
+    for participant, opponent in zip(participants, reversed(participants)):
+        opponent_rating = ratings[opponent.bot_id]
+        add_result(bots[participant.bot_id], participant.result, opponent_rating)
+        if participant.version_id:
+            add_result(
+                versions[participant.version_id], participant.result, opponent_rating
+            )
+
+
+def backfill_standings(db: Session) -> int:
+    """Builds the standings from all saved results, if there are none yet.
+    Returns the number of games added."""
+    if db.query(BotStanding).first():
+        return 0
+
+    bots, versions = {}, {}
+    games = 0
+    # games in the order they were played, for the ratings
+    rows = (
+        db.query(Participant)
+        .join(Game, Game.id == Participant.game_id)
+        .filter(Participant.result != None, Participant.result != VOID)
+        .order_by(Game.created_at, Game.id, Participant.id)
+        .yield_per(1000)
+    )
+
+    for _, group in itertools.groupby(rows, lambda p: p.game_id):
+        participants = list(group)
+        if len(participants) != 2:
+            continue
+
+        for p in participants:
+            if p.bot_id not in bots:
+                bots[p.bot_id] = BotStanding(p.bot_id)
+            if p.version_id and p.version_id not in versions:
+                versions[p.version_id] = VersionStanding(p.version_id, p.bot_id)
+
+        add_game(bots, versions, participants)
+        games += 1
+
+    db.add_all([*bots.values(), *versions.values()])
+    return games
+
+
+def make_standing(tally: Tally) -> Standing:
+    return Standing(
+        games=tally.games,
+        victories=tally.victories,
+        losses=tally.losses,
+        ties=tally.ties,
+        crashes=tally.crashes,
+        crash_rate=tally.crashes / tally.games if tally.games else 0.0,
+        rating=tally.rating,
+    )
+
+
+def make_entry(bot: BotStanding, version: VersionStanding | None) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        rank=0,
+        bot_id=bot.bot_id,
+        standing=make_standing(bot),
+        version_id=version and version.version_id,
+        version_standing=version and make_standing(version),
+    )
+
+
+def load_entries(db: Session) -> list[LeaderboardEntry]:
+    """Standings of all bots, each with its newest version that has played."""
+    newest = select(func.max(VersionStanding.version_id)).group_by(
+        VersionStanding.bot_id
+    )
+    versions = {
+        version.bot_id: version
+        for version in db.query(VersionStanding).filter(
+            VersionStanding.version_id.in_(newest)
+        )
+    }
+    return [make_entry(bot, versions.get(bot.bot_id)) for bot in db.query(BotStanding)]
+
+
+class Leaderboard:
+    """Standings of all bots in memory, ranked by rating, best first.
+
+    New standings are applied as results are saved, and the ranking is redone
+    when it's read, at most every `min_interval` seconds. `revision` changes
+    with each ranking, so a page can be cached until then.
+    """
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self.entries: dict[int, LeaderboardEntry] = {}
+        # JSON of the entries by rank
+        self.ranked: list[str] = []
+        self.revision = 0
+        self.changed = False
+        self.ranked_at = float("-inf")
+
+    def __len__(self) -> int:
+        return len(self.ranked)
+
+    def replace(self, entries: list[LeaderboardEntry]):
+        self.entries = {entry.bot_id: entry for entry in entries}
+        self.changed = True
+
+    def update(self, entries: list[LeaderboardEntry]):
+        for entry in entries:
+            current = self.entries.get(entry.bot_id)
+            # a late result of an older version doesn't replace the newer one
+            if current and (current.version_id or 0) > (entry.version_id or 0):
+                entry = entry.copy(
+                    update={
+                        "version_id": current.version_id,
+                        "version_standing": current.version_standing,
+                    }
+                )
+            self.entries[entry.bot_id] = entry
+        self.changed = True
+
+    def page(self, offset: int, limit: int) -> list[str]:
+        """JSON of the entries ranked `offset + 1` to `offset + limit`."""
+        if self.changed and time.monotonic() - self.ranked_at >= self.min_interval:
+            self.rank()
+        return self.ranked[offset : offset + limit]
+
+    def rank(self):
+        entries = sorted(
+            self.entries.values(),
+            key=lambda entry: (-entry.standing.rating, entry.bot_id),
+        )
+        self.ranked = [
+            entry.copy(update={"rank": rank}).json()
+            for rank, entry in enumerate(entries, 1)
+        ]
+        self.revision += 1
+        self.changed = False
+        self.ranked_at = time.monotonic()
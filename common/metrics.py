@@ -0,0 +1,289 @@
+"""Prometheus-style metrics shared by the services.
+
+Metrics are module-level objects created with counter(), gauge() and
+histogram(), and served at GET /metrics once a service calls install(app).
+With METRICS=0 the factories return no-op metrics, so instrumented hot
+paths cost a method call and nothing else.
+
+install() also adds GET /debug/profile, a sampling profiler, if
+PROFILER_ENABLED is set.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("METRICS", "1") != "0"
+
+PREFIX = "botbattle_"
+
+# seconds, from a cheap move or win check up to a slow query or request
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+)
+
+registry: list["Metric"] = []
+
+# the scope of the request being served, for the endpoint label of DB queries
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.children: dict[tuple, "Metric"] = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values) -> "Metric":
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def new_child(self) -> "Metric":
+        return type(self)(self.name[len(PREFIX) :], self.help)
+
+    def samples(self):
+        """(suffix, labels, value) for every time series of this metric."""
+        if not self.labelnames:
+            yield from self.own_samples({})
+            return
+
+        for values, child in list(self.children.items()):
+            yield from child.own_samples(dict(zip(self.labelnames, values)))
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def own_samples(self, labels):
+        yield "_total", labels, self.value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        """Reads the value at scrape time, e.g. the size of a queue."""
+        self.function = function
+
+    def own_samples(self, labels):
+        yield "", labels, self.function() if self.function else self.value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def new_child(self) -> "Histogram":
+        return Histogram(self.name[len(PREFIX) :], self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def own_samples(self, labels):
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            cumulative += count
+            yield "_bucket", {**labels, "le": bound}, cumulative
+        yield "_sum", labels, self.sum
+        yield "_count", labels, cumulative
+
+
+class NullMetric:
+    """Stands in for any metric when metrics are disabled."""
+
+    null_context = contextlib.nullcontext()
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def set_function(self, function):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    def time(self):
+        return self.null_context
+
+
+NULL_METRIC = NullMetric()
+
+
+def register(metric: Metric) -> Metric:
+    if not ENABLED:
+        return NULL_METRIC
+    registry.append(metric)
+    return metric
+
+
+def counter(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    return register(Gauge(name, help, labelnames))
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return register(Histogram(name, help, labelnames, buckets=buckets))
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_seconds", "Time to serve a request", ("endpoint",)
+)
+DB_QUERY_SECONDS = histogram(
+    "db_query_seconds", "Time of a database query", ("endpoint",)
+)
+
+
+def current_endpoint() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return "background"
+
+    # the router puts the matched route into the scope
+    route = scope.get("route")
+    return route.path if route else "unmatched"
+
+
+def instrument_engine(engine):
+    """Times every query of `engine` by the endpoint that runs it."""
+    if not ENABLED:
+        return
+
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_SECONDS.labels(current_endpoint()).observe(elapsed)
+
+
+class MetricsMiddleware:
+    """Times requests and labels the queries they run with their endpoint."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = current_scope.set(scope)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUEST_SECONDS.labels(current_endpoint()).observe(elapsed)
+            current_scope.reset(token)
+
+
+def install(app):
+    """Adds GET /metrics and, with PROFILER_ENABLED, GET /debug/profile to `app`."""
+    from fastapi import HTTPException, Response
+
+    if ENABLED:
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics")
+    async def metrics():
+        if not ENABLED:
+            raise HTTPException(404)
+        return Response(render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/debug/profile")
+    async def profile(seconds: float = 5, interval: float = 0.005):
+        # sampling adds load to the process, so it has to be enabled explicitly
+        if not os.environ.get("PROFILER_ENABLED"):
+            raise HTTPException(404)
+
+        from .profiler import sample
+
+        stacks = await asyncio.to_thread(sample, min(seconds, 60), interval)
+        return Response(stacks, media_type="text/plain")
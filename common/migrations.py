@@ -0,0 +1,71 @@
+"""Brings an existing database up to the models: adds missing tables, columns
+and indexes.
+
+`Base.metadata.create_all()` only creates the tables that don't exist, so a
+database from before e.g. `code_versions.code_hash`, `bots.latest_version_id`,
+`games.pending_since` or `participants.version_id` would miss them and fail
+on the first query. Columns added to existing tables are all nullable, and
+rows without them are read as rows from before they existed. Every step
+checks the schema first, so running it again changes nothing.
+
+The dispatcher runs it on startup, before anything else reads the tables.
+Indexes on big tables take a while to build the first time.
+
+    python -m common.migrations
+"""
+
+from logging import basicConfig, getLogger
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn, Table
+
+from .database import get_engine
+from .models import Base  # with the tables of all models
+
+logger = getLogger(__name__)
+info = logger.info
+
+
+def upgrade(engine: Engine | None = None) -> list[str]:
+    """Adds what the database lacks. Returns the tables, columns and indexes added."""
+    added = []
+
+    with (engine or get_engine()).begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                table.create(connection)
+                added.append(table.name)
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    add_column(connection, table, column)
+                    added.append(f"{table.name}.{column.name}")
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    added.append(index.name)
+
+    if added:
+        info(f"Added to the database: {', '.join(added)}")
+    return added
+
+
+def add_column(connection: Connection, table: Table, column):
+    preparer = connection.dialect.identifier_preparer
+    definition = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.execute(
+        text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}")
+    )
+
+
+if __name__ == "__main__":
+    basicConfig(level="INFO")
+    upgrade()
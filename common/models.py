@@ -1,11 +1,26 @@
 import json
+from datetime import datetime
 
 from botbattle import Code, Side
-from sqlalchemy import JSON, Boolean, Column, DateTime, Integer, String, TypeDecorator, func
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    TypeDecorator,
+    func,
+    select,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Session
 
 from .database import Base
+from .utils import LRUCache
 
 
 class JSONBoard(TypeDecorator):
@@ -18,8 +33,10 @@ class JSONBoard(TypeDecorator):
 
     @staticmethod
     def process_result_value(value, dialect):
-        dictified = json.loads(value)
-        return deep_process_list(dictified["board"], int, lambda x: Side(x))
+        # the JSON impl decodes one level of the string from process_bind_param
+        dictified = json.loads(value) if isinstance(value, str) else value
+        board = dictified["board"] if isinstance(dictified, dict) else dictified
+        return deep_process_list(board, int, lambda x: Side(x))
 
 
 def deep_process_list(what, cls, func):
@@ -33,19 +50,48 @@ def deep_process_list(what, cls, func):
     ]
 
 
+class CodeBlob(Base):
+    """Code stored once per content, see Code.digest()."""
+
+    __tablename__ = "code_blobs"
+
+    hash = Column(String(64), primary_key=True)
+    created_at = Column(DateTime, default=func.now())
+    source = Column(String)
+    cls_name = Column(String)
+    loc = Column(Integer)
+
+    def __init__(self, code: Code):
+        self.hash = code.digest()
+        self.source = code.source
+        self.cls_name = code.cls_name
+        self.loc = code.source.count("\n")
+
+    def to_code(self) -> Code:
+        return Code(source=self.source, cls_name=self.cls_name)
+
+
 class CodeVersion(Base):
     __tablename__ = "code_versions"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     created_at = Column(DateTime, default=func.now())
     bot_id = Column(Integer)
+    code_hash = Column(String(64))
+    # versions saved before code_blobs existed keep their code here
     source = Column(String)
     cls_name = Column(String)
 
-    def __init__(self, bot_id, source, cls_name):
+    def __init__(self, bot_id, code_hash):
         self.bot_id = bot_id
-        self.source = source
-        self.cls_name = cls_name
+        self.code_hash = code_hash
+
+
+# versions and code never change, so these caches never go stale
+VERSION_HASH_CACHE_SIZE = 100_000
+CODE_CACHE_SIZE = 256
+version_hashes = LRUCache(VERSION_HASH_CACHE_SIZE)  # CodeVersion.id -> code hash
+codes = LRUCache(CODE_CACHE_SIZE)  # code hash -> Code
 
 
 class Bot(Base):
@@ -54,26 +100,133 @@ class Bot(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     token = Column(String)
     suspended = Column(Boolean)
+    # the CodeVersion in use, set by add_version()
+    latest_version_id = Column(Integer)
 
     def __repr__(self):
         return f"<Bot(id={self.id})>"
 
-    def load_latest_code(self, db: Session) -> Code:
-        latest_version: CodeVersion = (
+    def add_version(self, db: Session, code_hash: str) -> CodeVersion:
+        version = CodeVersion(self.id, code_hash)
+        db.add(version)
+        db.flush()
+        self.latest_version_id = version.id
+        return version
+
+    def latest_version(self, db: Session) -> CodeVersion | None:
+        if self.latest_version_id:
+            return db.get(CodeVersion, self.latest_version_id)
+
+        # versions added without add_version(), see backfill_latest_versions()
+        return (
             db.query(CodeVersion)
             .filter_by(bot_id=self.id)
-            .order_by(CodeVersion.created_at.desc())
+            .order_by(CodeVersion.created_at.desc(), CodeVersion.id.desc())
             .first()
         )
-        return Code(source=latest_version.source, cls_name=latest_version.cls_name)
+
+    def load_latest_code(self, db: Session) -> Code | None:
+        code_hash = self.latest_code_hash(db)
+        if code_hash is None:
+            return None
+
+        code = codes.get(code_hash)
+        if code is None:
+            code = codes[code_hash] = load_code(db, self.latest_version(db))
+        return code
+
+    def latest_code_hash(self, db: Session) -> str | None:
+        code_hash = version_hashes.get(self.latest_version_id)
+        if code_hash:
+            return code_hash
+
+        latest_version = self.latest_version(db)
+        if not latest_version:
+            return None
+        code_hash = version_hashes[latest_version.id] = version_hash(latest_version)
+        return code_hash
+
+
+def version_hash(version: CodeVersion) -> str:
+    return version.code_hash or legacy_code(version).digest()
+
+
+def latest_code_hashes(db: Session, bot_ids) -> dict[int, str]:
+    """Hashes of the latest code of each of the bots.
+
+    Takes a query for the bots' latest versions and one for the versions
+    that are not cached yet.
+    """
+    latest = dict(
+        db.query(Bot.id, Bot.latest_version_id).filter(Bot.id.in_(bot_ids)).all()
+    )
+    hashes = version_code_hashes(db, {id for id in latest.values() if id})
+
+    return {
+        bot_id: hashes[version_id]
+        if version_id
+        else db.get(Bot, bot_id).latest_code_hash(db)
+        for bot_id, version_id in latest.items()
+    }
+
+
+def version_code_hashes(db: Session, version_ids) -> dict[int, str]:
+    """Hashes of the code of the versions, with a query for the ones not cached yet."""
+    uncached = {
+        version_id for version_id in version_ids if version_id not in version_hashes
+    }
+    if uncached:
+        for version in db.query(CodeVersion).filter(CodeVersion.id.in_(uncached)):
+            version_hashes[version.id] = version_hash(version)
+
+    return {version_id: version_hashes[version_id] for version_id in version_ids}
+
+
+def backfill_latest_versions(db: Session):
+    """Points bots without latest_version_id to their newest version."""
+    newest = (
+        select(CodeVersion.id)
+        .where(CodeVersion.bot_id == Bot.id)
+        .order_by(CodeVersion.created_at.desc(), CodeVersion.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    db.query(Bot).filter(Bot.latest_version_id == None).update(
+        {Bot.latest_version_id: newest}, synchronize_session=False
+    )
+
+
+def load_code(db: Session, version: CodeVersion) -> Code:
+    if not version.code_hash:
+        return legacy_code(version)
+    return db.get(CodeBlob, version.code_hash).to_code()
+
+
+def legacy_code(version: CodeVersion) -> Code:
+    return Code(source=version.source, cls_name=version.cls_name)
+
+
+def save_code(db: Session, code: Code) -> str:
+    """Stores the code unless the same code is stored already. Returns its hash."""
+    code_hash = code.digest()
+    if not db.get(CodeBlob, code_hash):
+        db.add(CodeBlob(code))
+    return code_hash
 
 
 class Game(Base):
     __tablename__ = "games"
 
     id = Column(UUID(as_uuid=True), primary_key=True)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
     winner_id = Column(Integer)
+    # set while a runner owes the result, cleared when it is saved or the game
+    # is voided, see scheduler/reaper.py. In UTC by the scheduler's clock like
+    # the reaper's deadlines, func.now() is in the database's time zone.
+    pending_since = Column(DateTime, default=datetime.utcnow, index=True)
+    submissions = Column(Integer, default=1)
+    # of the rules the game was played by, replays rebuilt from states need it
+    win_length = Column(Integer)
 
     def __repr__(self):
         return f"<Game(winner={self.winner_id})>"
@@ -83,11 +236,12 @@ class StateModel(Base):
     __tablename__ = "states"
 
     id = Column(Integer, primary_key=True)
-    game_id = Column(UUID(as_uuid=True))
+    game_id = Column(UUID(as_uuid=True), index=True)
     serial_no_within_game = Column(Integer)
     board = Column(JSONBoard)
     next_side = Column(Integer)
-    created_at = Column(DateTime, default=func.now())
+    # the retention job drops old states by time, see common/retention.py
+    created_at = Column(DateTime, default=func.now(), index=True)
 
     def __init__(self, game_id, serial_no_within_game, board, next_side):
         self.game_id = game_id
@@ -98,11 +252,68 @@ class StateModel(Base):
 
 class Participant(Base):
     __tablename__ = "participants"
+    __table_args__ = (
+        # keyset pagination of a bot's results in /get_part_info/
+        Index("ix_participants_bot_id_created_at_id", "bot_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     created_at = Column(DateTime, default=func.now())
-    game_id = Column(UUID(as_uuid=True))
+    game_id = Column(UUID(as_uuid=True), index=True)
     bot_id = Column(Integer)
+    # the CodeVersion that played, not set for games from before it was kept
+    version_id = Column(Integer)
     side = Column(Integer)
     result = Column(String)
     exception = Column(String)
+
+
+# result of both participants of a game that never reported
+VOID = "void"
+
+INITIAL_RATING = 1500.0
+
+
+class Tally:
+    """Results of games kept up to date as they are saved, see common/leaderboard.py."""
+
+    games = Column(Integer)
+    victories = Column(Integer)
+    losses = Column(Integer)
+    ties = Column(Integer)
+    crashes = Column(Integer)
+    rating = Column(Float)
+
+    def reset(self):
+        self.games = self.victories = self.losses = self.ties = self.crashes = 0
+        self.rating = INITIAL_RATING
+
+
+class BotStanding(Tally, Base):
+    __tablename__ = "bot_standings"
+
+    bot_id = Column(Integer, primary_key=True)
+
+    def __init__(self, bot_id):
+        self.bot_id = bot_id
+        self.reset()
+
+
+class VersionStanding(Tally, Base):
+    __tablename__ = "version_standings"
+
+    version_id = Column(Integer, primary_key=True)
+    bot_id = Column(Integer, index=True)
+
+    def __init__(self, version_id, bot_id):
+        self.version_id = version_id
+        self.bot_id = bot_id
+        self.reset()
+
+
+class ReplayModel(Base):
+    __tablename__ = "replays"
+
+    game_id = Column(UUID(as_uuid=True), primary_key=True)
+    created_at = Column(DateTime, default=func.now())
+    data = Column(LargeBinary)
@@ -0,0 +1,46 @@
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+
+from botbattle import ParticipantInfo
+
+
+class ResultBroker:
+    """Fans out saved game results to clients waiting for them in this process."""
+
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self.subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, bot_id: int):
+        queue = asyncio.Queue(self.max_queue_size)
+        self.subscribers[bot_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self.subscribers[bot_id].discard(queue)
+            if not self.subscribers[bot_id]:
+                del self.subscribers[bot_id]
+
+    def publish(self, bot_id: int, info: ParticipantInfo):
+        for queue in self.subscribers.get(bot_id, ()):
+            # a slow subscriber loses its oldest results, not the newest ones
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(info)
+
+    async def wait(self, bot_id: int, timeout: float) -> list[ParticipantInfo]:
+        """Waits up to `timeout` seconds for results and returns all that arrived."""
+        with self.subscribe(bot_id) as queue:
+            try:
+                infos = [await asyncio.wait_for(queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                return []
+
+            # give results of the same batch a moment to arrive
+            await asyncio.sleep(0)
+            while not queue.empty():
+                infos.append(queue.get_nowait())
+
+            return infos
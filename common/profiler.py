@@ -0,0 +1,31 @@
+import collections
+import sys
+import threading
+import time
+
+
+def sample(seconds: float, interval: float = 0.005) -> str:
+    """Samples the stacks of all other threads for `seconds`.
+
+    Returns them in the collapsed format of flamegraph.pl and speedscope:
+    one line per distinct stack, "outer;...;inner count", most frequent first.
+    """
+    own_thread = threading.get_ident()
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+
+            names = []
+            while frame:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+
+        time.sleep(interval)
+
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+from uuid import UUID
+
+from botbattle import Replay, State
+from sqlalchemy.orm import Session
+
+from .models import Game, ReplayModel, StateModel
+
+# if set, replays are kept as files in this directory instead of the replays table
+REPLAY_DIR = os.environ.get("REPLAY_DIR")
+
+
+def replay_path(game_id: UUID) -> Path:
+    return Path(REPLAY_DIR) / game_id.hex[:2] / f"{game_id}.bbr"
+
+
+def save_replay(db: Session, replay: Replay):
+    store_replay(db, replay.game_id, replay.to_bytes())
+
+
+def store_replay(db: Session, game_id: UUID, data: bytes):
+    if not REPLAY_DIR:
+        db.merge(ReplayModel(game_id=game_id, data=data))
+        return
+
+    path = replay_path(game_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write then rename, so readers never see a partial file
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def stored_replays(db: Session, game_ids: list[UUID]) -> set[UUID]:
+    if REPLAY_DIR:
+        return {game_id for game_id in game_ids if replay_path(game_id).exists()}
+
+    query = db.query(ReplayModel.game_id).filter(ReplayModel.game_id.in_(game_ids))
+    return {game_id for game_id, in query}
+
+
+def load_replay(db: Session, game_id: UUID) -> bytes | None:
+    if REPLAY_DIR:
+        path = replay_path(game_id)
+        if path.exists():
+            return path.read_bytes()
+    else:
+        data = db.query(ReplayModel.data).filter_by(game_id=game_id).scalar()
+        if data is not None:
+            return data
+
+    # games saved before replays existed only have their states
+    return replay_from_states(db, game_id)
+
+
+def replay_from_states(db: Session, game_id: UUID) -> bytes | None:
+    rows: list[StateModel] = (
+        db.query(StateModel)
+        .filter_by(game_id=game_id)
+        .order_by(StateModel.serial_no_within_game)
+        .all()
+    )
+    if not rows:
+        return None
+
+    win_length = db.query(Game.win_length).filter_by(id=game_id).scalar()
+    # games from before it was stored were played to the default
+    rules = {"win_length": win_length} if win_length else {}
+    states = [
+        State(board=row.board, next_side=row.next_side, **rules) for row in rows
+    ]
+    winners = states[-1].winners()
+    winner = winners[0] if len(winners) == 1 else None
+
+    return Replay.from_states(game_id, states, winner).to_bytes()
@@ -0,0 +1,99 @@
+"""Compaction of old games: their states rows are replaced by replay records.
+
+Every game adds a row per ply to `states`, which nothing reads once a replay
+exists. The job walks `states` in day-sized time windows older than the
+retention period, makes sure each game in a window has a replay, and deletes
+the window's rows in batches. Games, participants and replays are kept, so
+stats and replays stay correct.
+
+    python -m common.retention --days 30
+"""
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta
+from logging import basicConfig, getLogger
+
+from sqlalchemy import func
+
+from .database import SessionLocal
+from .models import StateModel
+from .replays import replay_from_states, store_replay, stored_replays
+
+logger = getLogger(__name__)
+info = logger.info
+
+# keep states of games from the last STATES_RETENTION_DAYS days, 0 keeps everything
+STATES_RETENTION_DAYS = float(os.environ.get("STATES_RETENTION_DAYS", 0))
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", 6))
+BATCH_SIZE = 500
+WINDOW = timedelta(days=1)
+
+
+def compact_states(
+    retention_days: float, now: datetime | None = None, batch_size: int = BATCH_SIZE
+) -> int:
+    """Compacts the states of games older than `retention_days`. Returns game count."""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+
+    with SessionLocal() as db:
+        oldest = db.query(func.min(StateModel.created_at)).scalar()
+
+    compacted = 0
+    window_start = oldest
+    while window_start is not None and window_start < cutoff:
+        window_end = min(window_start + WINDOW, cutoff)
+        compacted += compact_window(window_start, window_end, batch_size)
+        window_start = window_end
+
+    info(f"Compacted {compacted} game(s) older than {cutoff}")
+    return compacted
+
+
+def compact_window(start: datetime, end: datetime, batch_size: int) -> int:
+    compacted = 0
+
+    while True:
+        # one short transaction per batch, so the tables are never locked for long
+        with SessionLocal.begin() as db:
+            game_ids = [
+                game_id
+                for game_id, in db.query(StateModel.game_id)
+                .filter(StateModel.created_at >= start, StateModel.created_at < end)
+                .distinct()
+                .limit(batch_size)
+            ]
+            if not game_ids:
+                return compacted
+
+            existing = stored_replays(db, game_ids)
+            for game_id in game_ids:
+                if game_id not in existing:
+                    store_replay(db, game_id, replay_from_states(db, game_id))
+
+            db.query(StateModel).filter(StateModel.game_id.in_(game_ids)).delete(
+                synchronize_session=False
+            )
+
+        compacted += len(game_ids)
+
+
+async def run_retention_loop():
+    """Compacts states periodically if a retention period is configured."""
+    if not STATES_RETENTION_DAYS:
+        return
+
+    while True:
+        await asyncio.to_thread(compact_states, STATES_RETENTION_DAYS)
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=STATES_RETENTION_DAYS or 30)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    basicConfig(level="INFO")
+    compact_states(args.days, batch_size=args.batch_size)
@@ -0,0 +1,125 @@
+"""Per-game traces: where a game spent its time between scheduling and saving.
+
+The scheduler, the runner and the dispatcher each append spans for their
+stages to the trace carried in RunGameTask and GameLog. Once the dispatcher
+has saved a game, it writes the whole trace as a JSON line to TRACE_FILE,
+if that is set. Time between consecutive spans, e.g. network transfer or
+waiting for a background task, is reported as a gap before the next stage.
+
+Spans use each host's wall clock, so gaps between services include any
+clock skew between them.
+
+    python -m common.tracing traces.jsonl
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+from uuid import UUID
+
+from botbattle import Span
+
+
+@contextlib.contextmanager
+def span(trace: list[Span], name: str):
+    start = time.time()
+    try:
+        yield
+    finally:
+        trace.append(Span(name=name, start=start, end=time.time()))
+
+
+class TraceCollector:
+    """Appends traces to a JSON lines file, one game per line."""
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.environ.get("TRACE_FILE")
+        self.lock = threading.Lock()
+
+    def collect(self, game_id: UUID, trace: list[Span]):
+        if not self.path:
+            return
+
+        line = json.dumps(
+            {
+                "game_id": str(game_id),
+                "spans": [[span.name, span.start, span.end] for span in trace],
+            }
+        )
+        with self.lock, open(self.path, "a") as file:
+            file.write(line + "\n")
+
+
+def load_traces(path: str) -> list[list[Span]]:
+    with open(path) as file:
+        return [
+            [
+                Span(name=name, start=start, end=end)
+                for name, start, end in json.loads(line)["spans"]
+            ]
+            for line in file
+            if line.strip()
+        ]
+
+
+def stage_durations(trace: list[Span]) -> dict[str, float]:
+    """Seconds per stage of one game, with gaps between stages and the total."""
+    durations = {}
+    previous = None
+    for span in sorted(trace, key=lambda span: span.start):
+        if previous:
+            gap = span.start - previous.end
+            durations[f"gap before {span.name}"] = max(gap, 0)
+        durations[span.name] = span.end - span.start
+        previous = span
+
+    if trace:
+        durations["total"] = max(span.end for span in trace) - min(
+            span.start for span in trace
+        )
+    return durations
+
+
+def percentile(values: list[float], pct: float) -> float:
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def report(traces: list[list[Span]]) -> str:
+    by_stage = collections.defaultdict(list)
+    order = {}
+    for trace in traces:
+        for i, (stage, duration) in enumerate(stage_durations(trace).items()):
+            by_stage[stage].append(duration)
+            order.setdefault(stage, i)
+
+    total = sum(by_stage.get("total", [])) or 1
+
+    lines = [
+        f"{len(traces)} games",
+        "",
+        f"{'stage':>36} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'max ms':>9} {'share':>6}",
+    ]
+    stages = sorted(by_stage, key=lambda stage: (stage == "total", order[stage]))
+    for stage in stages:
+        values = sorted(by_stage[stage])
+        lines.append(
+            f"{stage:>36} {len(values):7} "
+            + " ".join(
+                f"{percentile(values, pct) * 1000:9.1f}" for pct in (50, 95, 99, 100)
+            )
+            + f" {sum(values) / total:6.1%}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=os.environ.get("TRACE_FILE"))
+    args = parser.parse_args()
+
+    print(report(load_traces(args.path)))
@@ -1,38 +1,68 @@
 import asyncio
 import time
-from collections import deque
-from contextlib import asynccontextmanager
+from collections import OrderedDict
 
 
-class LeakyBucket:
-    def __init__(self, bucket_size: int, requests_per_minute: float):
-        self.bucket_size = bucket_size
-        self.drip_delay = 60 / requests_per_minute
-        self.drips = deque()
+class LRUCache(OrderedDict):
+    """A dict that keeps only the `size` most recently used entries."""
+
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
+
+class AdaptiveRateLimiter:
+    """Paces requests at a rate that follows the feedback of the receiver.
+
+    The rate grows by `increase` requests per minute with every accepted
+    request and is multiplied by `decrease` on every rejected one (AIMD),
+    so it settles just below what the receiver can take.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        min_per_minute: float = 6,
+        max_per_minute: float = 6000,
+        increase: float = 6,
+        decrease: float = 0.5,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.min_per_minute = min_per_minute
+        self.max_per_minute = max_per_minute
+        self.increase = increase
+        self.decrease = decrease
+        self.next_at = 0.0
 
-    @asynccontextmanager
     async def throttle(self):
-        # clean up
-        while (
-            self.drips
-            and self.drips[0] < time.monotonic() - self.drip_delay * self.bucket_size
-        ):
-            self.drips.popleft()
-
-        # if full then wait till the next drip
-        if len(self.drips) >= self.bucket_size:
-            await asyncio.sleep(time.monotonic() - self.drips[-1] + self.drip_delay)
-
-        # register drop and yield
-        self.drips.append(time.monotonic())
-        yield
-
-_already_run = set()
-
-
-async def run_once(func, *args, **kwargs):
-    global _already_run
-    if func in _already_run:
-        return
-    _already_run.add(func)
-    return await func(*args, **kwargs)
+        # the slot is taken before waiting for it, so concurrent callers, e.g.
+        # the scheduler's rounds and its reaper, each wait for one of their own
+        now = time.monotonic()
+        at = max(self.next_at, now)
+        self.next_at = at + 60 / self.requests_per_minute
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def accepted(self):
+        self.requests_per_minute = min(
+            self.requests_per_minute + self.increase, self.max_per_minute
+        )
+
+    def rejected(self, retry_after: float | None = None):
+        self.requests_per_minute = max(
+            self.requests_per_minute * self.decrease, self.min_per_minute
+        )
+        if retry_after:
+            self.next_at = max(self.next_at, time.monotonic() + retry_after)
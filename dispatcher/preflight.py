@@ -0,0 +1,104 @@
+"""Checks uploaded code before it's saved, so that runners don't spend games
+on bots that can't make a move.
+
+The code is compiled here, then loaded the way runners load it, in a bot
+process of botbattle.sandbox with the same limits, where its class has to inherit
+from PlayerAbstract. It then plays PREFLIGHT_MOVES moves against random ones,
+each within the game's move timeout.
+
+With BOT_SANDBOX=thread the code runs in the dispatcher's own process.
+"""
+
+import os
+import random
+from traceback import format_exc
+
+from botbattle import Code, GameConfig, State, StateException
+from botbattle.sandbox import CallResult, start_bot
+from icontract import ViolationError
+
+PREFLIGHT_MOVES = int(os.environ.get("PREFLIGHT_MOVES", 3))
+
+BREACH_MESSAGES = {
+    "memory": "Used more memory than a bot may",
+    "cpu": "Used more CPU time than a bot may",
+    "exited": "Bot's process exited unexpectedly",
+}
+
+
+class PreflightException(Exception):
+    ...
+
+
+def preflight(code: Code, config: GameConfig = GameConfig()):
+    """Raises PreflightException with the reason if the code can't play."""
+    try:
+        compile(code.source, f"<{code.cls_name}>", "exec")
+    except (SyntaxError, ValueError):
+        raise PreflightException(
+            "Code doesn't compile\n" + format_exc(limit=0)
+        ) from None
+
+    state = config.initial_state()
+    bot = start_bot(code, state.next_side, config, skip_checks=False)
+
+    try:
+        check(
+            bot.init(config.init_timeout),
+            "Failed to initialize bot",
+            config.init_timeout,
+        )
+
+        for _ in range(PREFLIGHT_MOVES):
+            call = bot.make_move(state, config.move_timeout)
+            check(call, "make_move() raised an exception", config.move_timeout)
+            drop_token(state, call.result)
+
+            if game_over(state):
+                break
+
+            state.drop_token(
+                random.choice(
+                    [i for i in range(state.len_x()) if not state.column_full(i)]
+                )
+            )
+
+            if game_over(state):
+                break
+
+    finally:
+        bot.close()
+
+
+def check(call: CallResult, failure: str, budget: float):
+    if call.breach:
+        raise PreflightException(
+            BREACH_MESSAGES[call.breach] + ("\n" + call.error if call.error else "")
+        )
+
+    if not call.in_time:
+        raise PreflightException(
+            f"Didn't finish in alloted time ({int(budget * 1000)}ms)"
+        )
+
+    if call.error:
+        raise PreflightException(failure + "\n" + call.error)
+
+
+def drop_token(state: State, move):
+    try:
+        state.drop_token(move)
+
+    except ViolationError:
+        raise PreflightException(
+            "make_move() returned an invalid move\n" + format_exc()
+        ) from None
+
+    except StateException:
+        raise PreflightException(
+            "Made a move that breaks the rules\n" + format_exc()
+        ) from None
+
+
+def game_over(state: State) -> bool:
+    return bool(state.winners()) or state.all_cells_filled()
@@ -0,0 +1,65 @@
+import asyncio
+import contextlib
+import math
+import time
+
+# weight of the latest game in the average game duration
+GAME_SECONDS_SMOOTHING = 0.1
+
+
+class Admission:
+    """Bounds the games a runner plays at once and the games waiting for a slot.
+
+    Tasks are admitted while fewer than `max_queued` wait for one of the
+    `max_games` slots, beyond that the runner asks the scheduler to come back
+    after the time it expects the queue to take.
+    """
+
+    def __init__(self, max_games: int, max_queued: int):
+        self.max_games = max_games
+        self.max_queued = max_queued
+        self.running = 0
+        self.queued = 0
+        self.game_seconds = 0.0
+        self.slots = asyncio.Semaphore(max_games)
+
+    def admit(self) -> bool:
+        if self.queued >= self.max_queued:
+            return False
+        self.queued += 1
+        return True
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Waits for a free slot for an admitted game and holds it while it plays."""
+        try:
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.slots.release()
+            self.game_seconds += GAME_SECONDS_SMOOTHING * (
+                time.monotonic() - start - self.game_seconds
+            )
+
+    def retry_after(self) -> int:
+        """Seconds until the queue is expected to have room again."""
+        waves = (self.queued + self.running) / max(self.max_games, 1)
+        return max(math.ceil(waves * self.game_seconds), 1)
+
+    def capacity(self) -> dict:
+        return {
+            "max_games": self.max_games,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "queued": self.queued,
+            "free": max(self.max_queued - self.queued, 0),
+            "saturation": self.running / self.max_games if self.max_games else 1.0,
+            "game_seconds": self.game_seconds,
+        }
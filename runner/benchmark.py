@@ -0,0 +1,328 @@
+"""Runner throughput benchmark.
+
+Plays games between configurable bot pairs at rising concurrency and reports
+throughput, per-move CPU latency percentiles, timeout rates and memory per game.
+
+    python -m runner.benchmark --bots random cpu_heavy --concurrency 1 2 4 8
+    python -m runner.benchmark --endpoint --games 50
+
+With --endpoint the games are submitted to the runner's "/" endpoint served by
+uvicorn on localhost, and a mock dispatcher records the results, so the whole
+suite runs offline.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import httpx
+from botbattle import (
+    Code,
+    GameConfig,
+    GameLog,
+    PlayerAbstract,
+    RunGameTask,
+    State,
+    make_code,
+    wire,
+)
+
+from .admission import Admission
+from .runner import ERROR_MESSAGES, MoveTookTooLongException, get_game_results
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class FirstFreeColumnPlayer(PlayerAbstract):
+    def make_move(self, state: State) -> int:
+        return next(i for i in range(state.len_x()) if not state.column_full(i))
+
+
+class CpuHeavyPlayer(PlayerAbstract):
+    def make_move(self, state: State) -> int:
+        import random
+        import time
+
+        # burns about half of the default move budget
+        start = time.thread_time()
+        while time.thread_time() - start < 0.05:
+            pass
+
+        free = [i for i in range(state.len_x()) if not state.column_full(i)]
+        return random.choice(free)
+
+
+class RandomMovePlayer(PlayerAbstract):
+    # same as sample_bots.random_player.RandomPlayer, which is not
+    # shipped with the runner image
+    def make_move(self, state: State) -> int:
+        import random
+
+        return random.choice(
+            [i for i in range(state.len_x()) if not state.column_full(i)]
+        )
+
+
+BOT_PAIRS = {
+    "random": (RandomMovePlayer, RandomMovePlayer),
+    "first_free": (FirstFreeColumnPlayer, FirstFreeColumnPlayer),
+    "cpu_heavy": (CpuHeavyPlayer, CpuHeavyPlayer),
+    "mixed": (RandomMovePlayer, CpuHeavyPlayer),
+}
+
+
+def bot_pair(bots: str) -> tuple[Code, Code]:
+    blue, red = BOT_PAIRS[bots]
+    return make_code(blue), make_code(red)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def summarize(logs: list[GameLog], elapsed: float, concurrency: int) -> dict:
+    move_times = [t for log in logs for t in log.move_times]
+    timeout_msg = ERROR_MESSAGES[MoveTookTooLongException]
+    timeouts = sum(
+        1 for log in logs if log.exception and timeout_msg in log.exception.msg
+    )
+    crashes = sum(1 for log in logs if log.exception) - timeouts
+
+    return {
+        "concurrency": concurrency,
+        "games": len(logs),
+        "games_per_second": len(logs) / elapsed if elapsed else 0.0,
+        "moves": len(move_times),
+        "move_ms_p50": percentile(move_times, 50) * 1000,
+        "move_ms_p95": percentile(move_times, 95) * 1000,
+        "move_ms_p99": percentile(move_times, 99) * 1000,
+        "timeout_rate": timeouts / len(logs) if logs else 0.0,
+        "crash_rate": crashes / len(logs) if logs else 0.0,
+    }
+
+
+def play_game(blue: Code, red: Code, config: GameConfig) -> GameLog:
+    log_dict = asyncio.run(get_game_results(blue, red, config))
+    return GameLog(
+        game_id=uuid4(),
+        states=log_dict["states"],
+        move_times=log_dict["move_times"],
+        exception=log_dict.get("exception"),
+    )
+
+
+def run_direct(
+    bots: str, games: int, concurrency: int, config: GameConfig = GameConfig()
+) -> dict:
+    """Plays games by calling get_game_results from `concurrency` threads."""
+    blue, red = bot_pair(bots)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as executor:
+        logs = list(executor.map(lambda _: play_game(blue, red, config), range(games)))
+    elapsed = time.monotonic() - start
+
+    return {"bots": bots, "mode": "direct", **summarize(logs, elapsed, concurrency)}
+
+
+def memory_per_game(bots: str, games: int = 5, config: GameConfig = GameConfig()):
+    """Peak bytes allocated by a single game, averaged over `games` games."""
+    blue, red = bot_pair(bots)
+    peaks = []
+
+    for _ in range(games):
+        tracemalloc.start()
+        play_game(blue, red, config)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return statistics.mean(peaks)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app, port: int):
+    """Serves `app` on localhost from a thread, until stop_server()."""
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    return server, thread
+
+
+def stop_server(server, thread: threading.Thread):
+    # a server left running past interpreter exit fails to schedule its work
+    server.should_exit = True
+    thread.join()
+
+
+def mock_dispatcher(codes: list[Code] = ()):
+    """A stand-in for the dispatcher that serves `codes` and records posted game logs."""
+    from fastapi import FastAPI, HTTPException, Request
+
+    app = FastAPI()
+    app.state.logs = []
+    app.state.received = threading.Condition()
+    app.state.codes = {code.digest(): code for code in codes}
+
+    @app.get("/code/{code_hash}")
+    async def get_code(code_hash: str) -> Code:
+        if code_hash not in app.state.codes:
+            raise HTTPException(404)
+        return app.state.codes[code_hash]
+
+    @app.post("/game_result")
+    async def game_result(request: Request):
+        log = wire.decode_game_log(
+            await request.body(), request.headers.get("Content-Type")
+        )
+        with app.state.received:
+            app.state.logs.append(log)
+            app.state.received.notify_all()
+
+    return app
+
+
+def run_endpoint(
+    bots: str,
+    games: int,
+    concurrency: int,
+    config: GameConfig = GameConfig(),
+    timeout: float = 600,
+) -> dict:
+    """Submits games to the runner's "/" endpoint and waits for the callbacks."""
+    from . import runner
+
+    blue, red = bot_pair(bots)
+    # the runner doesn't start without one, the mock dispatcher doesn't check it
+    os.environ.setdefault("INTERNAL_TOKEN", uuid4().hex)
+
+    # undelivered results of earlier runs would be posted to a closed port
+    runner.outbox.path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    # the runner is served in a new event loop per run, its semaphore can't follow
+    runner.admission = Admission(runner.MAX_GAMES, runner.MAX_QUEUED_GAMES)
+
+    dispatcher = mock_dispatcher([blue, red])
+    dispatcher_port, runner_port = free_port(), free_port()
+    servers = [
+        serve_in_thread(dispatcher, dispatcher_port),
+        serve_in_thread(runner.app, runner_port),
+    ]
+
+    callback = f"http://127.0.0.1:{dispatcher_port}/game_result"
+    code_url = f"http://127.0.0.1:{dispatcher_port}/code"
+    tasks = [
+        RunGameTask(
+            game_id=uuid4(),
+            callback=callback,
+            code_url=code_url,
+            blue_code=blue.digest(),
+            red_code=red.digest(),
+            config=config,
+        )
+        for _ in range(games)
+    ]
+
+    async def submit():
+        semaphore = asyncio.Semaphore(concurrency)
+        url = f"http://127.0.0.1:{runner_port}/"
+
+        async with httpx.AsyncClient(timeout=timeout) as client:
+
+            async def post(task: RunGameTask):
+                async with semaphore:
+                    while True:
+                        response = await client.post(
+                            url, content=task.json(), headers=JSON_HEADERS
+                        )
+                        if response.status_code != 429:
+                            break
+                        await asyncio.sleep(float(response.headers["Retry-After"]))
+                    response.raise_for_status()
+
+            await asyncio.gather(*(post(task) for task in tasks))
+
+    start = time.monotonic()
+    asyncio.run(submit())
+
+    with dispatcher.state.received:
+        dispatcher.state.received.wait_for(
+            lambda: len(dispatcher.state.logs) >= games, timeout
+        )
+    elapsed = time.monotonic() - start
+
+    for server in servers:
+        stop_server(*server)
+
+    logs = dispatcher.state.logs
+    return {"bots": bots, "mode": "endpoint", **summarize(logs, elapsed, concurrency)}
+
+
+def print_report(rows: list[dict]):
+    columns = [
+        ("bots", "{:>10}"),
+        ("mode", "{:>8}"),
+        ("concurrency", "{:>11}"),
+        ("games", "{:>5}"),
+        ("games_per_second", "{:>16.2f}"),
+        ("move_ms_p50", "{:>11.2f}"),
+        ("move_ms_p95", "{:>11.2f}"),
+        ("move_ms_p99", "{:>11.2f}"),
+        ("timeout_rate", "{:>12.1%}"),
+        ("crash_rate", "{:>10.1%}"),
+        ("memory_kb", "{:>9.0f}"),
+    ]
+    print(
+        " ".join(f"{name:>{len(fmt.format(rows[0][name]))}}" for name, fmt in columns)
+    )
+    for row in rows:
+        print(" ".join(fmt.format(row[name]) for name, fmt in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--bots", nargs="+", default=["random", "cpu_heavy"], choices=BOT_PAIRS
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument(
+        "--endpoint", action="store_true", help="go through the / endpoint"
+    )
+    args = parser.parse_args()
+
+    run = run_endpoint if args.endpoint else run_direct
+
+    rows = []
+    for bots in args.bots:
+        memory_kb = memory_per_game(bots) / 1024
+        for concurrency in args.concurrency:
+            rows.append({**run(bots, args.games, concurrency), "memory_kb": memory_kb})
+
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import asyncio
+import collections
+import os
+from logging import getLogger
+from pathlib import Path
+
+import httpx
+from botbattle import Code
+
+logger = getLogger(__name__)
+debug = logger.debug
+
+MEMORY_CACHE_SIZE = int(os.environ.get("CODE_MEMORY_CACHE_SIZE", 256))
+
+
+class CodeNotAvailableException(Exception):
+    ...
+
+
+class CodeForbiddenException(CodeNotAvailableException):
+    ...
+
+
+class CodeCache:
+    """Bot code by its digest: memory LRU, then CODE_CACHE_DIR, then the dispatcher.
+
+    Code is immutable once addressed by its digest, so cached entries never
+    need invalidation. Everything fetched is checked against its digest.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        size: int = MEMORY_CACHE_SIZE,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        cache_dir = cache_dir or os.environ.get("CODE_CACHE_DIR")
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.size = size
+        self.http_client = http_client
+        self.memory: collections.OrderedDict[str, Code] = collections.OrderedDict()
+        # games that start together share a single load of the same code
+        self.loading: dict[str, asyncio.Future] = {}
+        # called for code found in memory or being loaded, and for code to load
+        self.on_hit = lambda: None
+        self.on_miss = lambda: None
+
+    async def get(self, code_url: str, code_hash: str) -> Code:
+        code = self.memory.get(code_hash)
+        if code:
+            self.memory.move_to_end(code_hash)
+            self.on_hit()
+            return code
+
+        loading = self.loading.get(code_hash)
+        if loading:
+            self.on_hit()
+        else:
+            self.on_miss()
+            loading = asyncio.ensure_future(self.load(code_url, code_hash))
+            self.loading[code_hash] = loading
+            loading.add_done_callback(lambda _: self.loading.pop(code_hash, None))
+
+        # shielded, so a cancelled game does not cancel the load for the others
+        return await asyncio.shield(loading)
+
+    async def load(self, code_url: str, code_hash: str) -> Code:
+        code = self.load_from_disk(code_hash)
+        if not code:
+            code = await self.fetch(code_url, code_hash)
+            self.save_to_disk(code_hash, code)
+
+        self.remember(code_hash, code)
+        return code
+
+    def remember(self, code_hash: str, code: Code):
+        self.memory[code_hash] = code
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    async def fetch(self, code_url: str, code_hash: str) -> Code:
+        debug(f"Fetching code {code_hash}")
+
+        headers = {}
+        if os.environ.get("INTERNAL_TOKEN"):
+            headers["Authorization"] = f"Bearer {os.environ['INTERNAL_TOKEN']}"
+
+        client = self.http_client or httpx.AsyncClient(timeout=10)
+        try:
+            resp = await client.get(
+                f"{str(code_url).rstrip('/')}/{code_hash}", headers=headers
+            )
+            if resp.status_code == 403:
+                raise CodeForbiddenException(
+                    f"Dispatcher refused code {code_hash}, is INTERNAL_TOKEN"
+                    " the same as the dispatcher's?"
+                )
+            resp.raise_for_status()
+        except httpx.HTTPError as exc:
+            raise CodeNotAvailableException(f"Failed to fetch code {code_hash}: {exc}")
+        finally:
+            if not self.http_client:
+                await client.aclose()
+
+        code = Code.parse_raw(resp.content)
+        if code.digest() != code_hash:
+            raise CodeNotAvailableException(f"Code {code_hash} does not match its hash")
+
+        return code
+
+    def path(self, code_hash: str) -> Path:
+        return self.cache_dir / code_hash[:2] / f"{code_hash}.json"
+
+    def load_from_disk(self, code_hash: str) -> Code | None:
+        if not self.cache_dir:
+            return None
+
+        try:
+            code = Code.parse_raw(self.path(code_hash).read_bytes())
+        except (OSError, ValueError):
+            return None
+
+        return code if code.digest() == code_hash else None
+
+    def save_to_disk(self, code_hash: str, code: Code):
+        if not self.cache_dir:
+            return
+
+        path = self.path(code_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write to a temporary file first, so other processes never read a partial one
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(code.json())
+        tmp_path.replace(path)
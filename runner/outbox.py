@@ -0,0 +1,265 @@
+"""Durable delivery of game results from the runner to their callbacks.
+
+Every finished game is written to a SQLite outbox before any delivery
+attempt, so results survive dispatcher outages and runner restarts. A worker
+started with the runner delivers up to `max_deliveries` results at once and
+retries failures with exponential backoff. Results that are rejected outright
+(a 4xx other than 408, 425 and 429) or that fail `max_attempts` times go to
+a dead-letter table, from where they can be replayed.
+
+The dispatcher saves each game's result once, so a delivery that is repeated
+after a lost response does no harm.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from logging import getLogger
+
+import httpx
+from botbattle import GameLog, Span, wire
+
+logger = getLogger(__name__)
+debug = logger.debug
+warning = logger.warning
+
+# in the user's data directory by default, not wherever the runner was started
+OUTBOX_PATH = os.environ.get("RUNNER_OUTBOX") or os.path.join(
+    os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"),
+    "botbattle",
+    "runner-outbox.db",
+)
+MAX_DELIVERIES = 8
+MAX_ATTEMPTS = 12
+BASE_DELAY = 1.0
+MAX_DELAY = 300.0
+
+# responses worth retrying, anything else in 4xx will not change on a retry
+RETRIABLE_STATUSES = {408, 425, 429}
+
+COLUMNS = """
+    game_id TEXT PRIMARY KEY,
+    callback TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    first_attempt_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+"""
+
+
+class Outbox:
+    def __init__(
+        self,
+        path: str = OUTBOX_PATH,
+        max_deliveries: int = MAX_DELIVERIES,
+        max_attempts: int = MAX_ATTEMPTS,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        self.path = path
+        self.max_deliveries = max_deliveries
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.wakeup: asyncio.Event | None = None
+        self.on_failure = None
+        self.on_dead_letter = None
+        self._db: sqlite3.Connection | None = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # opened on first use, so importing the runner creates no files
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # writes happen on the event loop, other threads only count rows
+            self._db = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            self._db.row_factory = sqlite3.Row
+            # survives crashes of the process, only a power loss can drop the
+            # latest results
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS outbox ({COLUMNS})")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS dead_letters ({COLUMNS}, failed_at REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_next_attempt_at"
+                " ON outbox (next_attempt_at)"
+            )
+        return self._db
+
+    def put(self, callback: str, log: GameLog):
+        media_type = wire.supported_media_types()[0]
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO outbox"
+            " (game_id, callback, media_type, payload, created_at, next_attempt_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                str(log.game_id),
+                str(callback),
+                media_type,
+                wire.encode_game_log(log, media_type),
+                now,
+                now,
+            ),
+        )
+        self.wake()
+
+    def pending(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letters(self) -> list[dict]:
+        rows = self.db.execute(
+            "SELECT game_id, callback, attempts, last_error, failed_at"
+            " FROM dead_letters ORDER BY failed_at"
+        )
+        return [dict(row) for row in rows]
+
+    def replay(self, game_id: str | None = None) -> int:
+        """Moves dead letters, all or one, back to the outbox for a fresh start."""
+        where, params = ("WHERE game_id = ?", (game_id,)) if game_id else ("", ())
+        with self.db:
+            self.db.execute("BEGIN")
+            count = self.db.execute(
+                "INSERT OR REPLACE INTO outbox"
+                " (game_id, callback, media_type, payload, created_at, next_attempt_at)"
+                " SELECT game_id, callback, media_type, payload, created_at, ?"
+                f" FROM dead_letters {where}",
+                (time.time(), *params),
+            ).rowcount
+            self.db.execute(f"DELETE FROM dead_letters {where}", params)
+        self.wake()
+        return count
+
+    async def run(self, send):
+        """Delivers results forever. `send(callback, log, first_attempt_at)`
+        posts a log and returns the response."""
+        in_flight: dict[str, asyncio.Task] = {}
+        # bound to the loop the worker runs in
+        self.wakeup = asyncio.Event()
+
+        while True:
+            self.wakeup.clear()
+            timeout = None
+
+            try:
+                free = self.max_deliveries - len(in_flight)
+                now = time.time()
+                for row in self.next_rows(free, in_flight) if free else []:
+                    if row["next_attempt_at"] > now:
+                        timeout = row["next_attempt_at"] - now
+                        break
+
+                    game_id = row["game_id"]
+                    in_flight[game_id] = asyncio.create_task(self.deliver(send, row))
+                    in_flight[game_id].add_done_callback(
+                        lambda _, game_id=game_id: self.finished(in_flight, game_id)
+                    )
+
+            except Exception:
+                logger.exception("Result delivery failed, retrying")
+                timeout = self.base_delay
+
+            # wait for a new result, a finished delivery or the next due one
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def wake(self):
+        if self.wakeup:
+            self.wakeup.set()
+
+    def finished(self, in_flight: dict, game_id: str):
+        in_flight.pop(game_id, None)
+        self.wake()
+
+    def next_rows(self, limit: int, exclude) -> list[sqlite3.Row]:
+        rows = self.db.execute(
+            "SELECT * FROM outbox ORDER BY next_attempt_at LIMIT ?",
+            (limit + len(exclude),),
+        ).fetchall()
+        return [row for row in rows if row["game_id"] not in exclude][:limit]
+
+    async def deliver(self, send, row: sqlite3.Row):
+        now = time.time()
+        first_attempt_at = row["first_attempt_at"] or now
+        error, permanent = None, False
+
+        try:
+            log = wire.decode_game_log(row["payload"], row["media_type"])
+            log.trace.append(
+                Span(
+                    name="runner.outbox", start=row["created_at"], end=first_attempt_at
+                )
+            )
+            debug("Posting result for game %s", row["game_id"])
+            response = await send(row["callback"], log, first_attempt_at)
+
+            if not response.is_success:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                permanent = (
+                    400 <= response.status_code < 500
+                    and response.status_code not in RETRIABLE_STATUSES
+                )
+
+        except (httpx.HTTPError, OSError) as exc:
+            error = repr(exc)
+
+        except wire.WireFormatException as exc:
+            error, permanent = repr(exc), True
+
+        # anything else is retried too, an unhandled one would leave the row due
+        # and have it delivered again at once, over and over
+        except Exception as exc:
+            logger.exception(f"Posting result for game {row['game_id']} failed")
+            error = repr(exc)
+
+        if error is None:
+            self.db.execute("DELETE FROM outbox WHERE game_id = ?", (row["game_id"],))
+            return
+
+        attempts = row["attempts"] + 1
+        if self.on_failure:
+            self.on_failure()
+
+        if permanent or attempts >= self.max_attempts:
+            warning(f"Result for game {row['game_id']} dead-lettered: {error}")
+            self.dead_letter(row["game_id"], attempts, error)
+            return
+
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        self.db.execute(
+            "UPDATE outbox SET attempts = ?, first_attempt_at = ?, next_attempt_at = ?,"
+            " last_error = ? WHERE game_id = ?",
+            (
+                attempts,
+                first_attempt_at,
+                now + delay * random.uniform(0.5, 1),
+                error,
+                row["game_id"],
+            ),
+        )
+
+    def dead_letter(self, game_id: str, attempts: int, error: str):
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "INSERT OR REPLACE INTO dead_letters"
+                " SELECT game_id, callback, media_type, payload, created_at,"
+                " first_attempt_at, ?, next_attempt_at, ?, ?"
+                " FROM outbox WHERE game_id = ?",
+                (attempts, error, time.time(), game_id),
+            )
+            self.db.execute("DELETE FROM outbox WHERE game_id = ?", (game_id,))
+
+        if self.on_dead_letter:
+            self.on_dead_letter()
@@ -1,24 +1,35 @@
-import threading
-from asyncio import Queue
+import asyncio
+import os
+import time
 from logging import basicConfig, getLogger
 from traceback import format_exc
 
 import httpx
-import reretry
 from botbattle import (
     Code,
     ExceptionInfo,
+    GameConfig,
     GameLog,
-    PlayerAbstract,
     RunGameTask,
     Side,
-    State,
+    Span,
     StateException,
-    init_bot,
+    wire,
 )
-from common.utils import run_once
-from fastapi import BackgroundTasks, FastAPI
+from botbattle.sandbox import compile_code, start_bot, warm_up
+from common import metrics
+from common.tracing import span
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from icontract import ViolationError
+from pydantic import ValidationError
+
+from .admission import Admission
+from .code_cache import (
+    CodeCache,
+    CodeForbiddenException,
+    CodeNotAvailableException,
+)
+from .outbox import Outbox
 
 
 class RunnerException(Exception):
@@ -49,104 +60,282 @@ class InitializationTookTooLongException(RunnerException):
     ...
 
 
-MOVE_TIMEOUT = 0.1
+class MemoryLimitExceededException(RunnerException):
+    ...
+
+
+class CpuLimitExceededException(RunnerException):
+    ...
+
+
+class BotProcessDiedException(RunnerException):
+    ...
+
+
+# games played at once. With BOT_SANDBOX=thread they share the GIL, so more
+# slots only pay off while bots wait rather than compute.
+MAX_GAMES = int(os.environ.get("RUNNER_MAX_GAMES", 2))
+# admitted games waiting for a slot before new tasks get 429
+MAX_QUEUED_GAMES = int(os.environ.get("RUNNER_MAX_QUEUED_GAMES", MAX_GAMES * 10))
 
 ERROR_MESSAGES = {
     FailedToInitializeException: "Failed to initialize bot due to an exception",
-    InitializationTookTooLongException: f"Failed to initialize bot in alloted time ({int(MOVE_TIMEOUT * 1000)}ms)",
-    MoveTookTooLongException: f"Didn't receive a move in alloted time ({int(MOVE_TIMEOUT * 1000)}ms)",
+    InitializationTookTooLongException: "Failed to initialize bot in alloted time",
+    MoveTookTooLongException: "Didn't receive a move in alloted time",
     InvalidMoveException: "make_move() returned an invalid move",
     RaisesException: "make_move() raised an exception",
     MoveBrakesRulesException: "Made a move that breaks the rules",
+    MemoryLimitExceededException: "Used more memory than a bot may",
+    CpuLimitExceededException: "Used more CPU time in a game than a bot may",
+    BotProcessDiedException: "Bot's process exited unexpectedly",
+}
+
+# limits of bot processes, see botbattle.sandbox
+BREACHES = {
+    "memory": MemoryLimitExceededException,
+    "cpu": CpuLimitExceededException,
+    "exited": BotProcessDiedException,
 }
 
 
 app = FastAPI()
+metrics.install(app)
 
-basicConfig(level="DEBUG")
+basicConfig(level=os.environ.get("LOG_LEVEL", "DEBUG"))
 
 logger = getLogger(__name__)
 info = logger.info
 debug = logger.debug
+warning = logger.warning
+
+outbox = Outbox()
+code_cache = CodeCache()
+admission = Admission(MAX_GAMES, MAX_QUEUED_GAMES)
+
+# wire format for game logs that each callback accepted
+callback_media_types: dict[str, str] = {}
+
+GAMES = metrics.counter("games", "Games played", ("outcome",))
+MOVE_SECONDS = metrics.histogram("move_seconds", "CPU time of a bot's move")
+WIN_CHECK_SECONDS = metrics.histogram("win_check_seconds", "Time of a win check")
+OUTBOX_DEPTH = metrics.gauge("outbox_depth", "Results waiting to be delivered")
+OUTBOX_DEPTH.set_function(lambda: outbox.pending())
+CALLBACK_RETRIES = metrics.counter("callback_retries", "Failed result deliveries")
+DEAD_LETTERS = metrics.counter("dead_letters", "Results given up on")
+outbox.on_failure = CALLBACK_RETRIES.inc
+outbox.on_dead_letter = DEAD_LETTERS.inc
+TASKS_REJECTED = metrics.counter("tasks_rejected", "Tasks turned away with 429")
+GAMES_RUNNING = metrics.gauge("games_running", "Games being played")
+GAMES_RUNNING.set_function(lambda: admission.running)
+GAMES_QUEUED = metrics.gauge("games_queued", "Admitted games waiting for a slot")
+GAMES_QUEUED.set_function(lambda: admission.queued)
+CODE_LOOKUPS = metrics.counter(
+    "code_lookups", "Code of games' bots looked up in the cache", ("outcome",)
+)
+code_cache.on_hit = CODE_LOOKUPS.labels("hit").inc
+code_cache.on_miss = CODE_LOOKUPS.labels("miss").inc
+CODE_REFUSED = metrics.counter(
+    "code_refused", "Games dropped because the dispatcher refused their code"
+)
+COMPILED_CODE_HITS = metrics.gauge(
+    "compiled_code_hits", "Bots started with code compiled before"
+)
+COMPILED_CODE_HITS.set_function(lambda: compile_code.cache_info().hits)
+COMPILED_CODE_MISSES = metrics.gauge("compiled_code_misses", "Bot code compiled")
+COMPILED_CODE_MISSES.set_function(lambda: compile_code.cache_info().misses)
+
+background_tasks = set()
+
+
+@app.on_event("startup")
+def check_internal_token():
+    # the dispatcher only hands out code with it, without it no game is played
+    if not os.environ.get("INTERNAL_TOKEN"):
+        raise RuntimeError("INTERNAL_TOKEN is not set, see README.md")
 
-result_queue = Queue()
+
+@app.on_event("startup")
+async def start_delivery():
+    task = asyncio.create_task(deliver_results())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+@app.on_event("startup")
+async def start_sandbox():
+    # the first game doesn't wait for the fork server of bot processes
+    await asyncio.to_thread(warm_up)
 
 
 @app.post("/")
-async def accept_task(task: RunGameTask, background: BackgroundTasks):
-    info("Starting game")
-    background.add_task(run_game, task)
-    background.add_task(run_once, process_result_queue)
+async def accept_task(task: RunGameTask, background: BackgroundTasks) -> dict:
+    if not admission.admit():
+        TASKS_REJECTED.inc()
+        raise HTTPException(
+            429,
+            "Runner is saturated",
+            headers={"Retry-After": str(admission.retry_after())},
+        )
 
+    debug("Starting game %s", task.game_id)
+    background.add_task(run_game, task, time.time())
+    return capacity()
+
+
+@app.get("/capacity")
+def capacity() -> dict:
+    return {**admission.capacity(), "outbox": outbox.pending()}
+
+
+@app.get("/dead_letters")
+async def dead_letters() -> list[dict]:
+    return outbox.dead_letters()
+
+
+@app.post("/dead_letters/replay")
+async def replay_dead_letters(game_id: str | None = None) -> dict:
+    return {"replayed": outbox.replay(game_id)}
 
-async def run_game(task: RunGameTask):
-    info(
-        f"Starting a game between {task.blue_code.cls_name} and {task.red_code.cls_name}"
-    )
 
-    log_dict = await get_game_results(task.blue_code, task.red_code)
+@app.get("/benchmark")
+async def self_benchmark(bots: str = "random", games: int = 10, concurrency: int = 1):
+    # playing games here takes CPU from real ones, so it has to be enabled explicitly
+    if not os.environ.get("RUNNER_BENCHMARK"):
+        raise HTTPException(404)
 
-    log = GameLog(game_id=task.game_id, states=log_dict["states"])
+    from .benchmark import BOT_PAIRS, run_direct
+
+    if bots not in BOT_PAIRS:
+        raise HTTPException(422, f"bots should be one of {list(BOT_PAIRS)}")
+
+    return await asyncio.to_thread(run_direct, bots, games, concurrency)
+
+
+async def run_game(task: RunGameTask, accepted_at: float | None = None):
+    async with admission.slot():
+        trace = list(task.trace)
+        if accepted_at:
+            trace.append(Span(name="runner.wait", start=accepted_at, end=time.time()))
+
+        try:
+            with span(trace, "runner.fetch_code"):
+                blue_code = await code_cache.get(task.code_url, task.blue_code)
+                red_code = await code_cache.get(task.code_url, task.red_code)
+        # no game can be played until the token is fixed, not only this one
+        except CodeForbiddenException as exc:
+            logger.error(f"Can't play game {task.game_id}: {exc}")
+            CODE_REFUSED.inc()
+            return
+        # the dispatcher answered with something else than code
+        except (CodeNotAvailableException, ValidationError) as exc:
+            warning(f"Skipping game {task.game_id}: {exc}")
+            return
+
+        debug(
+            "Starting a game between %s and %s", blue_code.cls_name, red_code.cls_name
+        )
+
+        with span(trace, "runner.play"):
+            log_dict = await get_game_results(blue_code, red_code, task.config)
+
+    log = GameLog(
+        game_id=task.game_id,
+        states=log_dict["states"],
+        move_times=log_dict["move_times"],
+        trace=trace,
+    )
     if "exception" in log_dict:
         log.exception = log_dict["exception"]
+        GAMES.labels("crash").inc()
     else:
         log.winner = log_dict["winners"][0] if len(log_dict["winners"]) == 1 else None
+        GAMES.labels("victory" if log.winner else "tie").inc()
+
+    outbox.put(task.callback, log)
+
 
-    await result_queue.put((task.callback, log))
+async def get_game_results(
+    blue_code: Code, red_code: Code, config: GameConfig = GameConfig()
+) -> dict:
+    # a game waits on its bots' threads, so it is played off the event loop
+    return await asyncio.to_thread(play_game, blue_code, red_code, config)
+
+
+def play_game(
+    blue_code: Code, red_code: Code, config: GameConfig = GameConfig()
+) -> dict:
+    bots = []
+    try:
+        return play_bots(bots, blue_code, red_code, config)
+    finally:
+        for bot in bots:
+            bot.close()
 
 
-async def get_game_results(blue_code: Code, red_code: Code) -> dict:
+def play_bots(bots: list, blue_code: Code, red_code: Code, config: GameConfig) -> dict:
     # load code
     try:
         code, side = blue_code, Side.BLUE
-        blue = init_bot_timed(code, side)
+        blue = init_bot_timed(bots, code, side, config)
 
         code, side = red_code, Side.RED
-        red = init_bot_timed(code, side)
+        red = init_bot_timed(bots, code, side, config)
 
     except RunnerException as exc:
         return {
             "states": [],
+            "move_times": [],
             "exception": ExceptionInfo(msg=exc.args[0], caused_by_side=side),
         }
 
     # set initial state
-    state = State(next_side=Side.BLUE)
-    cur_bot: PlayerAbstract = blue
+    state = config.initial_state()
+    cur_bot = blue if state.next_side == Side.BLUE else red
     states = []
+    move_times = []
 
-    def make_move():
-        nonlocal move
-        move = cur_bot.make_move(state)
-
-    def handle_exception(*args):
-        nonlocal make_move_exc
-        make_move_exc = format_exc()
-
-    threading.excepthook = handle_exception
+    # chess clock: CPU seconds left for each side for the rest of the game
+    clocks = {side: config.game_budget for side in Side}
 
     # make moves
     while True:
         states.append(state.copy(deep=True))
 
-        winners = state.winners()
+        with WIN_CHECK_SECONDS.time():
+            winners = state.winners()
         if winners:
             break
 
         move = None
         exc_msg = None
-        make_move_exc = None
 
-        th = threading.Thread(target=make_move)
-        th.start()
-        th.join(MOVE_TIMEOUT)
+        budget = (
+            config.move_timeout
+            if config.game_budget is None
+            else max(clocks[cur_bot.side], 0)
+        )
+        call = cur_bot.make_move(state, budget)
+        move = call.result
+        move_times.append(call.cpu_time)
+        MOVE_SECONDS.observe(call.cpu_time)
+
+        if config.game_budget is not None:
+            clocks[cur_bot.side] -= call.cpu_time
 
-        if th.is_alive():
-            exc_msg = ERROR_MESSAGES[MoveTookTooLongException]
+        if call.breach:
+            exc_msg = breach_message(call)
             break
 
-        if make_move_exc:
-            exc_msg = ERROR_MESSAGES[RaisesException] + "\n" + make_move_exc
+        if not call.in_time:
+            move = None
+            exc_msg = (
+                ERROR_MESSAGES[MoveTookTooLongException]
+                + f" ({int(budget * 1000)}ms)"
+            )
+            break
+
+        if call.error:
+            exc_msg = ERROR_MESSAGES[RaisesException] + "\n" + call.error
             break
 
         try:
@@ -163,7 +352,7 @@ async def get_game_results(blue_code: Code, red_code: Code) -> dict:
         # switch to next side
         cur_bot = blue if cur_bot == red else red
 
-    log = {"states": states}
+    log = {"states": states, "move_times": move_times}
 
     if exc_msg:
         log["exception"] = ExceptionInfo(
@@ -176,45 +365,76 @@ async def get_game_results(blue_code: Code, red_code: Code) -> dict:
     return log
 
 
-def init_bot_timed(code, side):
-    bot = None
-    make_move_exc = None
-
-    def init():
-        nonlocal bot
-        bot = init_bot(code, side)
+def init_bot_timed(bots: list, code: Code, side: Side, config: GameConfig):
+    bot = start_bot(code, side, config)
+    bots.append(bot)
+    timeout = config.init_timeout
+    call = bot.init(timeout)
 
-    def handle_exception(*args):
-        nonlocal make_move_exc
-        make_move_exc = format_exc()
+    if call.breach:
+        raise BREACHES[call.breach](breach_message(call))
 
-    threading.excepthook = handle_exception
-
-    th = threading.Thread(target=init)
-    th.start()
-    th.join(MOVE_TIMEOUT)
-
-    if th.is_alive():
+    if not call.in_time:
         raise InitializationTookTooLongException(
             ERROR_MESSAGES[InitializationTookTooLongException]
+            + f" ({int(timeout * 1000)}ms)"
         )
 
-    if make_move_exc:
+    if call.error:
         raise FailedToInitializeException(
-            ERROR_MESSAGES[FailedToInitializeException] + "\n" + make_move_exc
+            ERROR_MESSAGES[FailedToInitializeException] + "\n" + call.error
         )
 
     return bot
 
 
-async def process_result_queue():
+def breach_message(call) -> str:
+    return ERROR_MESSAGES[BREACHES[call.breach]] + (
+        "\n" + call.error if call.error else ""
+    )
+
+
+async def deliver_results():
     async with httpx.AsyncClient(timeout=10) as client:
-        while True:
-            callback, log = await result_queue.get()
-            info(f"Posting result for game {log.game_id}")
-            await try_post_results(client, callback, log)
+        await outbox.run(
+            lambda callback, log, since: try_post_results(client, callback, log, since)
+        )
 
 
-@reretry.retry(ConnectionRefusedError, delay=3, jitter=1, backoff=1.5)
-async def try_post_results(client: httpx.AsyncClient, callback: str, log: GameLog):
-    await client.post(callback, content=log.json().encode("utf-8"))
+async def try_post_results(
+    client: httpx.AsyncClient,
+    callback: str,
+    log: GameLog,
+    posting_since: float | None = None,
+) -> httpx.Response:
+    callback = str(callback)
+    media_type = callback_media_types.get(callback, wire.supported_media_types()[0])
+
+    response = await post_log(client, callback, log, media_type, posting_since)
+
+    # the dispatcher does not read this format, use one it lists instead
+    if response.status_code == 415 and media_type != wire.JSON:
+        media_type = wire.negotiate(response.headers.get("Accept"))
+        callback_media_types[callback] = media_type
+        response = await post_log(client, callback, log, media_type, posting_since)
+
+    return response
+
+
+async def post_log(
+    client: httpx.AsyncClient,
+    callback: str,
+    log: GameLog,
+    media_type: str,
+    posting_since: float | None = None,
+) -> httpx.Response:
+    # the time spent on earlier attempts goes with the log
+    if posting_since:
+        post_span = Span(name="runner.post", start=posting_since, end=time.time())
+        log = log.copy(update={"trace": [*log.trace, post_span]})
+
+    return await client.post(
+        callback,
+        content=wire.encode_game_log(log, media_type),
+        headers={"Content-Type": media_type},
+    )
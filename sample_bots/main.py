@@ -3,7 +3,6 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from logging import basicConfig
 
@@ -55,15 +54,12 @@ def start_clients(no_bots=1):
         for token in tokens[:no_bots]
     ]
 
-    async def run_bots(bot_clients):
-        tasks = [asyncio.create_task(run_bot(client)) for client in bot_clients]
-        await asyncio.wait(tasks)
-        print("All bots shutting down")
+    # BotClient.run() is synchronous, so each client gets its own thread
+    with ThreadPoolExecutor(len(bot_clients)) as executor:
+        for client in bot_clients:
+            executor.submit(client.run)
 
-    async def run_bot(bot_client: BotClient):
-        bot_client.run()
-
-    asyncio.run(run_bots(bot_clients))
+    print("All bots shutting down")
 
 
 if __name__ == "__main__":
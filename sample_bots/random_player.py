@@ -1,9 +1,11 @@
 from botbattle import PlayerAbstract, State
-import random
 
 
 class RandomPlayer(PlayerAbstract):
     def make_move(self, state: State) -> int:
+        # only the class source is uploaded, so imports have to live inside it
+        import random
+
         available = {i for i in range(len(state.board[0])) if not state.column_full(i)}
         while available:
             col = random.randint(0, len(available) - 1)
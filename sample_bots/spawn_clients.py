@@ -1,35 +1,40 @@
 import asyncio
+import sys
+from logging import basicConfig
 
 import botbattle
 
 import random_player
 
-from logging import basicConfig
-
 basicConfig(level="INFO")
 
 # DISPATCHER_URI = "https://dispatcher-q22dvnigiq-uc.a.run.app"
 DISPATCHER_URI = "http://localhost:8200"
 
-def start_clients(no_bots=1):
-    tokens = [
-        "d2b16e4a-c547-4076-be18-5f3699de3dbf",
-        "4aa1e9e5-1979-4a89-94fe-776483cc8a4a",
-        "f99e3af5-fdc7-4abd-b32e-a21cd4c5b851",
-    ]
+TOKENS = [
+    "d2b16e4a-c547-4076-be18-5f3699de3dbf",
+    "4aa1e9e5-1979-4a89-94fe-776483cc8a4a",
+    "f99e3af5-fdc7-4abd-b32e-a21cd4c5b851",
+]
+
+
+async def start_clients(tokens: list[str]):
+    # all bots share one connection pool
+    async with botbattle.AsyncBotClient.make_http_client(DISPATCHER_URI) as http_client:
+        bot_clients = [
+            botbattle.AsyncBotClient(
+                token,
+                random_player.RandomPlayer,
+                DISPATCHER_URI,
+                http_client=http_client,
+            )
+            for token in tokens
+        ]
 
-    bot_clients = [
-        botbattle.client.BotClient(
-            token, random_player.RandomPlayer, dispatcher_url=DISPATCHER_URI
-        )
-        for token in tokens[:no_bots]
-    ]
+        await asyncio.gather(*(client.run() for client in bot_clients))
 
-    async def run_bots(bot_clients):
-        tasks = [asyncio.create_task(client.run()) for client in bot_clients]
-        await asyncio.wait(tasks)
-        print("All bots shutting down")
+    print("All bots shutting down")
 
-    asyncio.run(run_bots(bot_clients))
 
-start_clients(1)
+# tokens can be passed as arguments, for many bots use benchmarks/loadtest.py
+asyncio.run(start_clients(sys.argv[1:] or TOKENS[:1]))
@@ -0,0 +1,82 @@
+"""Games whose result never arrived: resubmitted a few times, then voided.
+
+A game is pending from its creation until the dispatcher saves its result.
+Games still pending RESULT_DEADLINE_SECONDS after their last submission,
+because the runner was down, lost the game or the result never got
+delivered, are submitted again up to MAX_SUBMISSIONS times. After that both
+participants get the VOID result, which scheduling does not count as a game
+played. Neither do the standings nor /get_part_info/, so voiding needs no
+word to the dispatcher.
+
+Stale games are found through the index on `games.pending_since`, which only
+pending games have, so each pass costs the same however many games are done.
+"""
+
+import os
+from datetime import datetime, timedelta
+from logging import getLogger
+from uuid import UUID
+
+from common.database import SessionLocal
+from common.models import VOID, Game, Participant
+
+logger = getLogger(__name__)
+info = logger.info
+
+RESULT_DEADLINE_SECONDS = float(os.environ.get("RESULT_DEADLINE_SECONDS", 600))
+REAPER_INTERVAL_SECONDS = float(os.environ.get("REAPER_INTERVAL_SECONDS", 60))
+MAX_SUBMISSIONS = 3
+BATCH_SIZE = 500
+
+
+def reap_stale_games(
+    deadline_seconds: float = RESULT_DEADLINE_SECONDS,
+    max_submissions: int = MAX_SUBMISSIONS,
+    now: datetime | None = None,
+    batch_size: int = BATCH_SIZE,
+    exclude: set[UUID] = frozenset(),
+) -> tuple[list[UUID], int]:
+    """Returns the stale games to submit again and the number of voided ones.
+
+    Games in `exclude` are left alone, e.g. the ones a round still has to submit.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=deadline_seconds)
+    resubmit, voided = [], 0
+
+    while True:
+        # one short transaction per batch, reaped games leave the index range
+        with SessionLocal.begin() as db:
+            query = db.query(Game.id, Game.submissions).filter(
+                Game.pending_since < cutoff
+            )
+            if exclude:
+                query = query.filter(Game.id.notin_(exclude))
+
+            stale = query.limit(batch_size).all()
+            if not stale:
+                break
+
+            retry = [id for id, submissions in stale if submissions < max_submissions]
+            void = [id for id, submissions in stale if submissions >= max_submissions]
+
+            if retry:
+                db.query(Game).filter(Game.id.in_(retry)).update(
+                    {Game.pending_since: now, Game.submissions: Game.submissions + 1},
+                    synchronize_session=False,
+                )
+
+            if void:
+                db.query(Game).filter(Game.id.in_(void)).update(
+                    {Game.pending_since: None}, synchronize_session=False
+                )
+                db.query(Participant).filter(
+                    Participant.game_id.in_(void), Participant.result == None
+                ).update({Participant.result: VOID}, synchronize_session=False)
+
+        resubmit.extend(retry)
+        voided += len(void)
+
+    if resubmit or voided:
+        info(f"Resubmitting {len(resubmit)} stale game(s), voided {voided}")
+    return resubmit, voided
@@ -0,0 +1,82 @@
+"""Which runner plays a game: a consistent hash of the code of its blue bot.
+
+Runners cache the code they play, fetched and compiled, so a version that
+always goes to the same runner is loaded there once. The bot that a round
+schedules games for plays blue in all of them, so its games go to one runner.
+
+Each runner has VIRTUAL_NODES points on a ring of hashes, and a game goes to
+the first runner clockwise from the hash of its blue code. A runner that
+joins takes over only the games between its points and the ones before
+them, and those of a runner that leaves go to the runners after its points,
+so the caches of the others stay as they are. A runner that is down is
+skipped for RETRY_SECONDS, as if it left.
+"""
+
+import bisect
+import hashlib
+import time
+
+VIRTUAL_NODES = 100
+RETRY_SECONDS = 30
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes=(), virtual_nodes: int = VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self.points: list[int] = []
+        # the node of each point
+        self.nodes: list[str] = []
+        self.node_count = 0
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        for i in range(self.virtual_nodes):
+            point = ring_hash(f"{node}#{i}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.nodes.insert(index, node)
+        self.node_count = len(set(self.nodes))
+
+    def remove(self, node: str):
+        kept = [(p, n) for p, n in zip(self.points, self.nodes) if n != node]
+        self.points = [point for point, _ in kept]
+        self.nodes = [node for _, node in kept]
+        self.node_count = len(set(self.nodes))
+
+    def lookup(self, key: str) -> list[str]:
+        """All nodes, the one for `key` first, then the ones that would follow
+        it if it left, and so on."""
+        start = bisect.bisect(self.points, ring_hash(key))
+        found = []
+        for i in range(len(self.nodes)):
+            if len(found) == self.node_count:
+                break
+            node = self.nodes[(start + i) % len(self.nodes)]
+            if node not in found:
+                found.append(node)
+        return found
+
+
+class RunnerRouter:
+    """Runners in the order they should get a game, the ones that are down last."""
+
+    def __init__(self, urls: list[str], retry_seconds: float = RETRY_SECONDS):
+        self.ring = HashRing(urls)
+        self.retry_seconds = retry_seconds
+        # runner URL -> time.monotonic() until which it is skipped
+        self.down_until: dict[str, float] = {}
+
+    def route(self, code_hash: str) -> list[str]:
+        runners = self.ring.lookup(code_hash)
+        now = time.monotonic()
+        up = [url for url in runners if self.down_until.get(url, 0) <= now]
+        # when all are down, they are tried anyway
+        return up + [url for url in runners if url not in up]
+
+    def mark_down(self, url: str):
+        self.down_until[url] = time.monotonic() + self.retry_seconds
@@ -1,22 +1,40 @@
+import asyncio
+import collections
 import os
 import random
+import time
+from datetime import datetime
 from logging import basicConfig, getLogger
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import httpx
-from botbattle import RunGameTask, Side
+from botbattle import GameConfig, RunGameTask, Side, Span
+from common import metrics
 from common.database import SessionLocal
-from common.models import Bot, CodeVersion, Game, Participant
-from common.utils import LeakyBucket
-from fastapi import FastAPI, BackgroundTasks
+from common.models import (
+    VOID,
+    Bot,
+    CodeVersion,
+    Game,
+    Participant,
+    latest_code_hashes,
+    version_code_hashes,
+)
+from common.retention import run_retention_loop
+from common.utils import AdaptiveRateLimiter
+from fastapi import FastAPI
 from icontract import ensure
 from sqlalchemy import or_
 from sqlalchemy.orm import Query, Session
 from sqlalchemy.sql import func
 
+from .reaper import REAPER_INTERVAL_SECONDS, reap_stale_games
+from .routing import RunnerRouter
+
 app = FastAPI()
+metrics.install(app)
 
-basicConfig(level="DEBUG")
+basicConfig(level=os.environ.get("LOG_LEVEL", "DEBUG"))
 
 logger = getLogger(__name__)
 info = logger.info
@@ -26,57 +44,367 @@ warning = logger.warning
 
 MINIMUM_GAMES_PER_VERSION = 10
 MAX_BOTS_TO_SCHEDULE = 100
+# games a bot gets per round, rounds follow each other until bots have enough,
+# so a version uploaded meanwhile waits for a short round only
+GAMES_PER_ROUND = 2
 MAX_GAMES_TO_SCHEDULE = 100
 
-RUNNER_URL = os.environ["RUNNER_URL"]
+# games go to runners by a consistent hash of their code, see routing.py
+RUNNER_URLS = (os.environ.get("RUNNER_URLS") or os.environ["RUNNER_URL"]).split(",")
 CALLBACK = os.environ["DISPATCHER_URL"] + "/game_result"
+CODE_URL = os.environ["DISPATCHER_URL"] + "/code"
+
+ROUND_INTERVAL_SECONDS = float(os.environ.get("ROUND_INTERVAL_SECONDS", 60))
+ROUND_DEBOUNCE_SECONDS = float(os.environ.get("ROUND_DEBOUNCE_SECONDS", 0.5))
+# how often runners are asked for their capacity, a round starts when one that
+# was full or down has room again
+CAPACITY_POLL_SECONDS = float(os.environ.get("CAPACITY_POLL_SECONDS", 5))
 
-BUCKET_SIZE = 10
+# submitted games whose reaper deadline is restarted in one update
+SUBMITTED_BATCH_SIZE = 100
+
+# submissions to each runner start at this rate and follow its 429s from there
 REQUESTS_PER_MINUTE = 60
 
+# rules for all scheduled games, e.g. GAME_CONFIG='{"board_width": 8, "win_length": 5}'
+GAME_CONFIG = GameConfig.parse_raw(os.environ.get("GAME_CONFIG", "{}"))
+
 
-done = False
+background_tasks = set()
+round_requested = asyncio.Event()
+# games of the running round that are not submitted yet, the reaper skips them
+unsubmitted: set[UUID] = set()
+
+router = RunnerRouter(RUNNER_URLS)
+rate_limiters = {
+    url: AdaptiveRateLimiter(requests_per_minute=REQUESTS_PER_MINUTE)
+    for url in RUNNER_URLS
+}
+
+GAMES_SCHEDULED = metrics.counter("games_scheduled", "Games submitted to runners")
+TASKS_REJECTED = metrics.counter("tasks_rejected", "Submissions a runner turned away")
+SUBMISSION_RATE = metrics.gauge(
+    "submission_rate", "Submissions allowed per minute to all runners"
+)
+SUBMISSION_RATE.set_function(
+    lambda: sum(limiter.requests_per_minute for limiter in rate_limiters.values())
+)
+RATE_LIMITER_WAIT_SECONDS = metrics.histogram(
+    "rate_limiter_wait_seconds", "Time a game waited for the rate limiter"
+)
+ROUND_SECONDS = metrics.histogram("round_seconds", "Time of a scheduling round")
+PAIRINGS = metrics.counter("pairings", "Pairs of bots matched for a game")
+GAMES_RESUBMITTED = metrics.counter(
+    "games_resubmitted", "Games submitted again after no result arrived"
+)
+GAMES_VOIDED = metrics.counter("games_voided", "Games given up on without a result")
+
+
+@app.on_event("startup")
+async def start_retention():
+    task = asyncio.create_task(run_retention_loop())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
 
 
 @app.on_event("startup")
-async def run_games():
-    # in case several schedules have been requested in a row
-    # while the previous was still running
-    global done
-    if done:
+async def start_reaper():
+    task = asyncio.create_task(run_reaper_loop())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def run_reaper_loop():
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+        try:
+            game_ids, voided = await asyncio.to_thread(
+                reap_stale_games, exclude=set(unsubmitted)
+            )
+            GAMES_VOIDED.inc(voided)
+            await resubmit_games(game_ids)
+        except Exception:
+            logger.exception("Reaping stale games failed")
+
+
+async def resubmit_games(game_ids: list):
+    if not game_ids:
         return
 
-    # clear requests for more game scheduling
-    done = True
+    with SessionLocal() as db:
+        participants = (
+            db.query(Participant.game_id, Participant.bot_id, Participant.version_id)
+            .filter(Participant.game_id.in_(game_ids))
+            .order_by(Participant.side.desc())  # blue first
+            .all()
+        )
+        # the versions that were to play, their results are credited to them
+        version_hashes = version_code_hashes(
+            db, {version_id for _, _, version_id in participants if version_id}
+        )
+        # games from before participants kept their version get the latest code
+        latest_hashes = latest_code_hashes(
+            db, {bot_id for _, bot_id, version_id in participants if not version_id}
+        )
+
+    sides = collections.defaultdict(list)
+    for game_id, bot_id, version_id in participants:
+        sides[game_id].append(
+            version_hashes[version_id] if version_id else latest_hashes[bot_id]
+        )
+
+    tasks = [
+        build_task(game_id, blue_code, red_code)
+        for game_id, (blue_code, red_code) in sides.items()
+    ]
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        for task in tasks:
+            if await submit_task(client, task):
+                GAMES_RESUBMITTED.inc()
+
+
+@app.on_event("startup")
+async def start_scheduling():
+    task = asyncio.create_task(run_scheduling_loop())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+    # the first round starts right away
+    round_requested.set()
+
+
+@app.on_event("startup")
+async def start_capacity_watch():
+    task = asyncio.create_task(run_capacity_loop())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def run_capacity_loop():
+    """Requests a round when a runner that was full or down has room again."""
+    full = set()
+
+    async with httpx.AsyncClient(timeout=CAPACITY_POLL_SECONDS) as client:
+        while True:
+            await asyncio.sleep(CAPACITY_POLL_SECONDS)
 
+            for runner_url in RUNNER_URLS:
+                try:
+                    response = await client.get(runner_url.rstrip("/") + "/capacity")
+                    response.raise_for_status()
+                    free = response.json()["free"]
+                except (httpx.HTTPError, ValueError, KeyError):
+                    free = 0
+
+                if not free:
+                    full.add(runner_url)
+                elif runner_url in full:
+                    full.discard(runner_url)
+                    info(f"Runner at {runner_url} has room again")
+                    round_requested.set()
+
+
+async def run_scheduling_loop():
+    """Runs a round on every request for scheduling, or every ROUND_INTERVAL_SECONDS."""
+    while True:
+        try:
+            await asyncio.wait_for(round_requested.wait(), ROUND_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+        # requests in a burst, e.g. many bots uploading at once, share a round,
+        # and requests during a round start the next one
+        await asyncio.sleep(ROUND_DEBOUNCE_SECONDS)
+        round_requested.clear()
+
+        try:
+            with ROUND_SECONDS.time():
+                bots_scheduled = await run_round()
+        except Exception:
+            logger.exception("Scheduling round failed")
+            continue
+
+        # bots may still be short of games. If no runner took a game, the next
+        # round waits for one to have room, see run_capacity_loop()
+        if bots_scheduled:
+            round_requested.set()
+
+
+async def run_round() -> int:
+    """Schedules games for bots short of games. Returns the number of bots,
+    or 0 if no runner took any of the games."""
     info("Starting schedule")
 
-    # start games
-    leaky_bucket = LeakyBucket(
-        bucket_size=BUCKET_SIZE, requests_per_minute=REQUESTS_PER_MINUTE
+    with SessionLocal() as db:
+        pairings = schedule_games(db)
+
+    PAIRINGS.inc(len(pairings))
+    if not pairings:
+        return 0
+
+    # all games of the round in one transaction
+    saving_since = time.time()
+    with SessionLocal.begin() as db:
+        tasks = create_games(db, pairings)
+    save_span = Span(name="scheduler.save_round", start=saving_since, end=time.time())
+
+    unsubmitted.update(task.game_id for task in tasks)
+    submitted = []
+    accepted = 0
+
+    # each runner at its own pace
+    by_runner = collections.defaultdict(list)
+    for task in tasks:
+        task.trace = [save_span]
+        by_runner[router.route(task.blue_code)[0]].append(task)
+
+    async def submit_all(client: httpx.AsyncClient, runner_tasks: list[RunGameTask]):
+        nonlocal submitted, accepted
+        for task in runner_tasks:
+            if await submit_task(client, task):
+                submitted.append(task.game_id)
+                accepted += 1
+            unsubmitted.discard(task.game_id)
+
+            if len(submitted) >= SUBMITTED_BATCH_SIZE:
+                restart_deadlines(submitted)
+                submitted = []
+
+    try:
+        # one runner's failure leaves the others submitting, its games are
+        # voided and rescheduled by the reaper
+        async with httpx.AsyncClient(timeout=10) as client:
+            results = await asyncio.gather(
+                *(submit_all(client, group) for group in by_runner.values()),
+                return_exceptions=True,
+            )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Submitting games failed", exc_info=result)
+
+    finally:
+        unsubmitted.difference_update(task.game_id for task in tasks)
+        restart_deadlines(submitted)
+
+    return len({blue.id for blue, _ in pairings}) if accepted else 0
+
+
+def create_games(db: Session, pairings: list[tuple[Bot, Bot]]) -> list[RunGameTask]:
+    """Adds the games with bulk inserts and returns the tasks to run them."""
+    code_hashes = latest_code_hashes(db, {bot.id for pair in pairings for bot in pair})
+
+    games, participants, tasks = [], [], []
+    for blue, red in pairings:
+        game_id = uuid4()
+        games.append({"id": game_id, "win_length": GAME_CONFIG.win_length})
+        participants.extend(
+            {
+                "game_id": game_id,
+                "bot_id": bot.id,
+                "version_id": bot.latest_version_id,
+                "side": side.value,
+            }
+            for bot, side in [[blue, Side.BLUE], [red, Side.RED]]
+        )
+        tasks.append(build_task(game_id, code_hashes[blue.id], code_hashes[red.id]))
+
+    db.bulk_insert_mappings(Game, games)
+    db.bulk_insert_mappings(Participant, participants)
+    return tasks
+
+
+def build_task(game_id: UUID, blue_code: str, red_code: str) -> RunGameTask:
+    return RunGameTask(
+        blue_code=blue_code,
+        red_code=red_code,
+        code_url=CODE_URL,
+        game_id=game_id,
+        callback=CALLBACK,
+        config=GAME_CONFIG,
     )
 
-    with SessionLocal() as db:
-        for blue, red in schedule_games(db):
-            async with leaky_bucket.throttle():
-                info("Starting a game")
-                game = save_new_game(blue, red, db)
-                db.commit()
-
-                # submit to a runner
-                task = prep_run_game_task(blue, red, game, db)
-                try:
-                    httpx.post(RUNNER_URL, content=task.json().encode("utf-8"))
-                except httpx.ConnectError:
-                    warning(f"Failed to submit to runner at {RUNNER_URL}")
+
+def restart_deadlines(game_ids: list[UUID]):
+    """The reaper's deadline for a game runs from its submission."""
+    if not game_ids:
+        return
+
+    with SessionLocal.begin() as db:
+        db.query(Game).filter(Game.id.in_(game_ids)).update(
+            {Game.pending_since: datetime.utcnow()}, synchronize_session=False
+        )
+
+
+async def submit_task(client: httpx.AsyncClient, task: RunGameTask) -> bool:
+    """Posts the task to its runner, or the next one on the ring if it is down.
+    False if all are down."""
+    trace = list(task.trace)
+
+    for runner_url in router.route(task.blue_code):
+        task.trace = list(trace)
+        if await submit_to_runner(client, runner_url, task):
+            return True
+
+        warning(f"Failed to submit to runner at {runner_url}")
+        router.mark_down(runner_url)
+
+    return False
+
+
+async def submit_to_runner(
+    client: httpx.AsyncClient, runner_url: str, task: RunGameTask
+) -> bool:
+    """Posts the task to the runner, waiting out its 429s. False if it is down
+    or didn't take the task, e.g. answered with a 5xx or timed out."""
+    rate_limiter = rate_limiters[runner_url]
+
+    waiting_since = time.time()
+    await rate_limiter.throttle()
+    rate_limit_span = Span(
+        name="scheduler.rate_limit", start=waiting_since, end=time.time()
+    )
+    RATE_LIMITER_WAIT_SECONDS.observe(rate_limit_span.end - rate_limit_span.start)
+
+    trace = [*task.trace, rate_limit_span]
+    task.trace = trace
+    rejected_at = None
+
+    while True:
+        try:
+            response = await client.post(
+                runner_url,
+                content=task.json().encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+        except httpx.HTTPError as e:
+            warning(f"Runner at {runner_url} failed: {e!r}")
+            return False
+
+        if response.is_success:
+            rate_limiter.accepted()
+            GAMES_SCHEDULED.inc()
+            return True
+
+        if response.status_code != 429:
+            warning(f"Runner at {runner_url} answered {response.status_code}")
+            return False
+
+        # the runner is saturated: slow down and retry when it expects room
+        TASKS_REJECTED.inc()
+        rejected_at = rejected_at or time.time()
+        rate_limiter.rejected(float(response.headers.get("Retry-After", 1)))
+        await rate_limiter.throttle()
+        task.trace = [
+            *trace,
+            Span(name="scheduler.backoff", start=rejected_at, end=time.time()),
+        ]
 
 
 @app.post("/")
-def scheduling_requested(background: BackgroundTasks):
-    global done
-    done = False
+async def scheduling_requested():
     info("Scheduling requested")
-    background.add_task(run_games)
+    round_requested.set()
 
 
 @ensure(
@@ -109,16 +437,20 @@ def schedule_games(db: Session) -> list[tuple[Bot, Bot]]:
 
     info(f"Found {len(bots_to_match)} bot(s) to match")
 
-    random.shuffle(bots_to_run)
     random.shuffle(bots_to_match)
 
-    combinations = []
+    matches = {}
     for bot in bots_to_run:
         self_excluded = list(set(bots_to_match) - {bot})
-        matches = random.choices(self_excluded, k=MINIMUM_GAMES_PER_VERSION)
-        combinations.extend([[bot, match] for match in matches])
+        matches[bot] = random.choices(self_excluded, k=GAMES_PER_ROUND)
 
-    return combinations
+    # one game per bot at a time, so every bot in the round, bots with the fewest
+    # games first, gets its first game after at most len(bots_to_run) games
+    return [
+        [bot, bot_matches[i]]
+        for i in range(GAMES_PER_ROUND)
+        for bot, bot_matches in matches.items()
+    ]
 
 
 def bots_with_not_enough_games(db: Session) -> Query:
@@ -128,6 +460,8 @@ def bots_with_not_enough_games(db: Session) -> Query:
         bots_with_code(db)
         .join(subq, Bot.id == subq.c.gflv_bot_id, isouter=True)
         .filter(or_(subq.c.gflv_games_count == None, subq.c.gflv_games_count < 10))
+        # new versions first, so they are not left out when many bots wait
+        .order_by(func.coalesce(subq.c.gflv_games_count, 0), Bot.id)
         .limit(MAX_BOTS_TO_SCHEDULE)
     )
 
@@ -150,6 +484,8 @@ def bots_with_games_for_last_version(db: Session) -> Query:
             Game.created_at
             > latest_versions.c.latest_version_datetime,  # only games for the last version
         )
+        # voided games were never played
+        .filter(or_(Participant.result == None, Participant.result != VOID))
         .group_by(Bot.id)
         .having(Bot.suspended == False)
     )
@@ -174,28 +510,3 @@ def bots_with_code(db: Session) -> Query:
         .filter(CodeVersion.id != None)
         .filter(Bot.suspended == False)
     )
-
-
-def save_new_game(blue: Bot, red: Bot, db: Session) -> Game:
-    # record the game is running
-    game = Game()
-    game.id = uuid4()
-    db.add(game)
-
-    for bot, side in [[blue, Side.BLUE], [red, Side.RED]]:
-        participant = Participant()
-        participant.game_id = game.id
-        participant.bot_id = bot.id
-        participant.side = side.value
-        db.add(participant)
-
-    return game
-
-
-def prep_run_game_task(blue: Bot, red: Bot, game: Game, db: Session) -> RunGameTask:
-    return RunGameTask(
-        blue_code=blue.load_latest_code(db),
-        red_code=red.load_latest_code(db),
-        game_id=game.id,
-        callback=CALLBACK,
-    )
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# before the runner is imported, its outbox would be in the user's data directory
+os.environ["RUNNER_OUTBOX"] = os.path.join(tempfile.mkdtemp(), "outbox.db")
@@ -0,0 +1,71 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from common.utils import AdaptiveRateLimiter
+from runner import runner
+from runner.admission import Admission
+
+
+async def test_admission():
+    admission = Admission(max_games=1, max_queued=2)
+
+    assert admission.admit()
+    assert admission.admit()
+    assert not admission.admit()
+
+    async def play():
+        async with admission.slot():
+            await asyncio.sleep(0.01)
+
+    first, second = asyncio.create_task(play()), asyncio.create_task(play())
+    await asyncio.sleep(0)
+    assert (admission.running, admission.queued) == (1, 1)
+
+    await asyncio.gather(first, second)
+    assert (admission.running, admission.queued) == (0, 0)
+    assert admission.capacity()["free"] == 2
+    assert admission.game_seconds > 0
+
+
+def test_saturated_runner_returns_429(monkeypatch):
+    monkeypatch.setattr(runner, "admission", Admission(max_games=1, max_queued=0))
+    client = TestClient(runner.app)
+
+    task = {
+        "game_id": "3fa85f64-5717-4562-b3fc-2c963f66afa6",
+        "callback": "https://test.com/",
+        "code_url": "https://test.com/code",
+        "blue_code": "0" * 64,
+        "red_code": "0" * 64,
+    }
+    response = client.post("/", json=task)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert client.get("/capacity").json()["free"] == 0
+
+
+async def test_adaptive_rate_limiter():
+    limiter = AdaptiveRateLimiter(600, min_per_minute=60, increase=60, decrease=0.5)
+
+    limiter.accepted()
+    assert limiter.requests_per_minute == 660
+
+    limiter.rejected()
+    limiter.rejected()
+    limiter.rejected()
+    limiter.rejected()
+    assert limiter.requests_per_minute == 60
+
+    limiter = AdaptiveRateLimiter(6000)
+    start = asyncio.get_running_loop().time()
+    for _ in range(3):
+        await limiter.throttle()
+    assert 0.015 < asyncio.get_running_loop().time() - start < 0.1
+
+    # concurrent callers get slots of their own
+    limiter = AdaptiveRateLimiter(600)
+    start = asyncio.get_running_loop().time()
+    await asyncio.gather(*(limiter.throttle() for _ in range(4)))
+    assert asyncio.get_running_loop().time() - start > 0.25
@@ -0,0 +1,91 @@
+import pytest
+from botbattle import Book, BookFormatException, GameConfig, State, open_book
+from botbattle.book import WIN, Position, best_move, generate
+
+
+def play(moves: list[int], config: GameConfig = GameConfig()) -> State:
+    state = config.initial_state()
+    for move in moves:
+        state.drop_token(move)
+    return state
+
+
+def test_position_matches_state():
+    moves = [3, 3, 4, 2, 6]
+    position = Position()
+    for move in moves:
+        position.play(move)
+
+    assert Position.from_state(play(moves)).key() == position.key()
+    # transpositions share a key
+    assert Position.from_state(play([3, 2, 6, 3, 4])).key() == position.key()
+    assert Position.from_state(play([3, 3, 4, 2])).key() != position.key()
+
+
+def test_best_move_wins_and_blocks():
+    # the side to move completes 2, 3, 4 with 1 or 5
+    col, score, exact = best_move(Position.from_state(play([2, 2, 3, 3, 4, 4])), 2)
+    assert col in (1, 5)
+    assert score == WIN - 6
+    assert exact
+
+    # the opponent wins with 1 next
+    col, _, _ = best_move(Position.from_state(play([2, 2, 3, 3, 0])), 2)
+    assert col == 1
+
+
+def test_generate_and_lookup(tmp_path):
+    path = str(tmp_path / "book.bbk")
+    count = generate(path, plies=2, depth=2, endgame_samples=5, endgame_cells=6)
+
+    book = Book(path)
+    assert len(book) == count
+    assert count >= 8
+
+    entry = book.lookup(play([]))
+    assert entry and 0 <= entry.move < 7
+    assert book.lookup(play([3])) is not None
+    assert book.lookup(play([3, 3, 3, 3])) is None
+    assert book.lookup(play([], GameConfig(board_width=6))) is None
+
+
+def test_endgames_are_exact(tmp_path):
+    path = str(tmp_path / "book.bbk")
+    generate(path, plies=0, endgame_samples=20, endgame_cells=5, seed=1)
+
+    book = Book(path)
+    # random games reach the endgame, they don't stop at the first chance to win
+    assert len(book) > 5
+    entries = [book.lookup_key(key) for key in keys(path, len(book))]
+    assert all(entry.exact for entry in entries)
+
+
+def keys(path: str, count: int) -> list[int]:
+    from botbattle.book import ENTRY, HEADER
+
+    with open(path, "rb") as file:
+        data = file.read()
+    return [
+        ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size)[0] for i in range(count)
+    ]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "book.bbk"
+    path.write_bytes(b"not a book at all")
+
+    with pytest.raises(BookFormatException):
+        Book(str(path))
+
+
+def test_no_book(tmp_path):
+    assert open_book(str(tmp_path / "missing.bbk")) is None
+
+
+@pytest.mark.parametrize("content", [b"", b"BBK", b"not a book at all"])
+def test_unreadable_book(tmp_path, content):
+    path = tmp_path / "broken.bbk"
+    path.write_bytes(content)
+
+    with pytest.warns(UserWarning, match="Not using the book"):
+        assert open_book(str(path)) is None
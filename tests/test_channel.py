@@ -0,0 +1,74 @@
+import multiprocessing
+
+import pytest
+from botbattle import GameConfig, PlayerAbstract, Side, State
+from botbattle.channel import (
+    BoardChannel,
+    BotRaisedException,
+    InvalidReplyException,
+    StateView,
+)
+
+
+class EchoPlayer(PlayerAbstract):
+    """Checks the view against what `State` would answer."""
+
+    def make_move(self, state: StateView) -> int:
+        copy = state.copy()
+        assert isinstance(copy, State)
+        assert state == copy
+        assert state.winners() == copy.winners()
+        assert [state.column_full(i) for i in range(7)] == [
+            copy.column_full(i) for i in range(7)
+        ]
+
+        if state.board[-1][6] is not None:
+            return "not a move"
+        if state.board[-1][0] == Side.RED and state.board[-1][1] is None:
+            raise ValueError("no moves next to red")
+        return next(i for i in range(state.len_x()) if not state.column_full(i))
+
+
+@pytest.fixture
+def channel():
+    channel = BoardChannel()
+    process = multiprocessing.Process(
+        target=channel.serve, args=(EchoPlayer(Side.RED),)
+    )
+    process.start()
+    yield channel
+    channel.close()
+    process.join(5)
+    channel.unlink()
+    assert process.exitcode == 0
+
+
+def test_moves(channel):
+    state = GameConfig().initial_state()
+    for expected in [0, 0, 0]:
+        move, cpu_time = channel.request_move(state, timeout=5)
+        assert move == expected
+        assert cpu_time >= 0
+        state.drop_token(move, Side.BLUE)
+
+
+def test_errors(channel):
+    state = GameConfig().initial_state()
+    state.drop_token(0, Side.RED)
+    with pytest.raises(BotRaisedException, match="no moves next to red"):
+        channel.request_move(state, timeout=5)
+
+    state.drop_token(6)
+    with pytest.raises(InvalidReplyException, match="'not a move'"):
+        channel.request_move(state, timeout=5)
+
+    # the channel still works after errors
+    assert channel.request_move(GameConfig().initial_state(), timeout=5)[0] == 0
+
+
+def test_timeout():
+    channel = BoardChannel()
+    with pytest.raises(TimeoutError):
+        channel.request_move(GameConfig().initial_state(), timeout=0.01)
+    channel.close()
+    channel.unlink()
@@ -1,5 +1,23 @@
-from botbattle import BotClient
+from botbattle import AsyncBotClient, BotClient
 from sample_bots.random_player import RandomPlayer
 
 def test_client():
     BotClient("123123", RandomPlayer, "123123123")
+
+
+async def test_async_client_shares_http_client():
+    http_client = AsyncBotClient.make_http_client("http://localhost:8200")
+
+    clients = [
+        AsyncBotClient(token, RandomPlayer, "http://localhost:8200", http_client)
+        for token in ["123", "456"]
+    ]
+
+    assert all(client.http_client is http_client for client in clients)
+    assert clients[0].headers == {"Authorization": "Bearer 123"}
+
+    for client in clients:
+        await client.aclose()
+    assert not http_client.is_closed
+
+    await http_client.aclose()
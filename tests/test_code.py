@@ -8,3 +8,13 @@ def test_code_correctness():
 
     with pytest.raises(IncorrectInheritanceException):
         code = make_code(TestClass_1)
+
+
+def test_code_digest():
+    from sample_bots.random_player import RandomPlayer
+
+    code = make_code(RandomPlayer)
+
+    assert code.digest() == make_code(RandomPlayer).digest()
+    assert len(code.digest()) == 64
+    assert code.copy(update={"cls_name": "Other"}).digest() != code.digest()
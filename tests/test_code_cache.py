@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+import pytest
+from botbattle import make_code
+
+from runner.code_cache import CodeCache, CodeNotAvailableException
+from sample_bots.random_player import RandomPlayer
+
+CODE_URL = "http://dispatcher/code"
+
+
+def dispatcher_client(codes, requests):
+    def handler(request: httpx.Request):
+        requests.append(request.url.path)
+        code = codes.get(request.url.path.split("/")[-1])
+        if not code:
+            return httpx.Response(404)
+        return httpx.Response(200, content=code.json())
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_code_cache(tmp_path):
+    code = make_code(RandomPlayer)
+    requests = []
+    client = dispatcher_client({code.digest(): code}, requests)
+
+    cache = CodeCache(cache_dir=str(tmp_path), http_client=client)
+    assert await cache.get(CODE_URL, code.digest()) == code
+    assert await cache.get(CODE_URL, code.digest()) == code
+    assert len(requests) == 1
+
+    # another process finds it on disk
+    cache = CodeCache(cache_dir=str(tmp_path), http_client=client)
+    assert await cache.get(CODE_URL, code.digest()) == code
+    assert len(requests) == 1
+
+
+async def test_code_cache_rejects_wrong_code():
+    code = make_code(RandomPlayer)
+    client = dispatcher_client({"0" * 64: code}, [])
+
+    cache = CodeCache(http_client=client)
+    with pytest.raises(CodeNotAvailableException):
+        await cache.get(CODE_URL, "0" * 64)
+    with pytest.raises(CodeNotAvailableException):
+        await cache.get(CODE_URL, "1" * 64)
+
+
+async def test_code_cache_loads_once_for_concurrent_games():
+    code = make_code(RandomPlayer)
+    requests = []
+    client = dispatcher_client({code.digest(): code}, requests)
+
+    cache = CodeCache(http_client=client)
+    codes = await asyncio.gather(
+        *(cache.get(CODE_URL, code.digest()) for _ in range(10))
+    )
+
+    assert codes == [code] * 10
+    assert len(requests) == 1
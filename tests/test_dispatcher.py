@@ -1,8 +1,362 @@
+from datetime import datetime
+from uuid import uuid4
+
 import pytest
-from dispatcher.dispatcher import app
+from botbattle import (
+    Code,
+    GameConfig,
+    GameLog,
+    PlayerAbstract,
+    Replay,
+    Side,
+    State,
+    make_code,
+)
+from common.database import Base, SessionLocal, engine
+from common.models import (
+    VOID,
+    Bot,
+    CodeBlob,
+    CodeVersion,
+    Game,
+    Participant,
+    save_code,
+)
+from dispatcher.dispatcher import (
+    app,
+    decode_cursor,
+    encode_cursor,
+    results_saved,
+    save_game_result,
+)
 from fastapi.testclient import TestClient
 
 
 @pytest.fixture
 def client():
     yield TestClient(app)
+
+
+@pytest.fixture
+def bot_with_results():
+    Base.metadata.create_all(engine)
+    token = str(uuid4())
+
+    with SessionLocal.begin() as db:
+        bot = Bot(token=token, suspended=False)
+        db.add(bot)
+        db.flush()
+
+        # same timestamps for many rows, so paging by time alone would skip some
+        for i in range(45):
+            db.add(
+                Participant(
+                    bot_id=bot.id,
+                    game_id=uuid4(),
+                    created_at=datetime(2024, 1, 1, 0, 0, i // 10),
+                    side=0,
+                    result="victory" if i % 2 else "loss",
+                )
+            )
+
+        # never played, so not a result
+        db.add(
+            Participant(
+                bot_id=bot.id,
+                game_id=uuid4(),
+                created_at=datetime(2024, 1, 1, 0, 1),
+                side=0,
+                result=VOID,
+            )
+        )
+
+        bot_id = bot.id
+
+    yield bot_id, {"Authorization": f"Bearer {token}"}
+
+
+def test_cursor_roundtrip():
+    created_at = datetime(2024, 1, 2, 3, 4, 5, 6)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+def test_part_info_pages(client, bot_with_results):
+    _, headers = bot_with_results
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 20, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/get_part_info/", params=params, headers=headers)
+        assert response.status_code == 200
+
+        page = response.json()
+        seen = page + seen
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == 45
+    assert [row["created_at"] for row in seen] == sorted(
+        row["created_at"] for row in seen
+    )
+    assert all(row["exception"] is None for row in seen)
+
+
+def test_part_info_not_modified(client, bot_with_results):
+    bot_id, headers = bot_with_results
+
+    response = client.get("/get_part_info/", headers=headers)
+    etag = response.headers["ETag"]
+
+    response = client.get("/get_part_info/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    results_saved[bot_id] += 1  # as if a new result was saved
+    response = client.get("/get_part_info/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_part_info_invalid_cursor(client, bot_with_results):
+    _, headers = bot_with_results
+
+    response = client.get("/get_part_info/", params={"cursor": "oops"}, headers=headers)
+    assert response.status_code == 400
+
+
+async def test_replay(client, bot_with_results):
+    bot_id, headers = bot_with_results
+    game_id = uuid4()
+
+    with SessionLocal.begin() as db:
+        db.add(Game(id=game_id))
+        for side in Side:
+            db.add(Participant(game_id=game_id, bot_id=bot_id, side=side.value))
+
+    state = State(next_side=Side.BLUE)
+    states = [state.copy(deep=True)]
+    for move in [0, 1, 0, 1, 0, 1, 0]:
+        state.drop_token(move)
+        states.append(state.copy(deep=True))
+
+    await save_game_result(GameLog(game_id=game_id, states=states, winner=Side.BLUE))
+
+    response = client.get(f"/replays/{game_id}", headers=headers)
+    assert Replay.from_bytes(response.content).moves == [0, 1, 0, 1, 0, 1, 0]
+
+    response = client.get(f"/replays/{game_id}", params={"boards": True}, headers=headers)
+    assert [State(**row) for row in response.json()] == states
+
+    response = client.get(f"/replays/{uuid4()}", headers=headers)
+    assert response.status_code == 404
+
+    # nor to bots that didn't play it
+    with SessionLocal.begin() as db:
+        other = Bot(token=str(uuid4()), suspended=False)
+        db.add(other)
+        db.flush()
+        other_headers = {"Authorization": f"Bearer {other.token}"}
+
+    response = client.get(f"/replays/{game_id}", headers=other_headers)
+    assert response.status_code == 404
+
+
+def test_code_stored_once(client, monkeypatch):
+    from sample_bots.random_player import RandomPlayer
+
+    Base.metadata.create_all(engine)
+    code = make_code(RandomPlayer)
+
+    with SessionLocal.begin() as db:
+        bots = [Bot(token=str(uuid4()), suspended=False) for _ in range(2)]
+        db.add_all(bots)
+        db.flush()
+
+        for bot in bots:
+            db.add(CodeVersion(bot.id, save_code(db, code)))
+            db.flush()
+
+        assert db.query(CodeBlob).filter_by(hash=code.digest()).count() == 1
+        assert all(bot.latest_code_hash(db) == code.digest() for bot in bots)
+        assert bots[0].load_latest_code(db) == code
+
+        token = bots[0].token
+
+    # the same code again is not a new version
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    response = client.post("/update_code", content=code.json(), headers=headers)
+    assert response.json() == {"updated": False}
+
+    # only runners may read code, and nobody without a token set
+    assert client.get(f"/code/{code.digest()}").status_code == 403
+    monkeypatch.setenv("INTERNAL_TOKEN", "internal")
+    assert client.get(f"/code/{code.digest()}").status_code == 403
+
+    internal = {"Authorization": "Bearer internal"}
+    response = client.get(f"/code/{code.digest()}", headers=internal)
+    assert response.status_code == 200
+    assert response.json() == code.dict()
+
+    assert client.get(f"/code/{'0' * 64}", headers=internal).status_code == 404
+
+
+def test_game_result_unsupported_format(client):
+    response = client.post(
+        "/game_result", content=b"x", headers={"Content-Type": "text/plain"}
+    )
+
+    assert response.status_code == 415
+    assert "application/json" in response.headers["Accept"]
+
+
+def test_game_result_saved_once(client, bot_with_results):
+    bot_id, _ = bot_with_results
+    game_id = uuid4()
+
+    with SessionLocal.begin() as db:
+        db.add(Game(id=game_id))
+        for side in Side:
+            db.add(Participant(game_id=game_id, bot_id=bot_id, side=side.value))
+
+    log = GameLog(game_id=game_id, states=[State(next_side=Side.BLUE)])
+    headers = {"Content-Type": "application/json"}
+
+    response = client.post("/game_result", content=log.json(), headers=headers)
+    assert response.json() == {"saved": True}
+
+    # a delivery repeated after a lost response changes nothing
+    log.winner = Side.RED
+    response = client.post("/game_result", content=log.json(), headers=headers)
+    assert response.json() == {"saved": False}
+
+    with SessionLocal() as db:
+        assert {p.result for p in db.query(Participant).filter_by(game_id=game_id)} == {
+            "tie"
+        }
+        assert db.get(Game, game_id).pending_since is None
+
+    unknown = GameLog(game_id=uuid4(), states=[])
+    response = client.post("/game_result", content=unknown.json(), headers=headers)
+    assert response.status_code == 404
+
+
+def test_latest_version_pointer(client, monkeypatch):
+    from common.models import backfill_latest_versions, latest_code_hashes
+
+    Base.metadata.create_all(engine)
+    old, new = [
+        Code(
+            source=f"class Player{i}(PlayerAbstract):\n"
+            "    def make_move(self, state):\n"
+            f"        return {i}\n",
+            cls_name=f"Player{i}",
+        )
+        for i in range(2)
+    ]
+
+    with SessionLocal.begin() as db:
+        bot = Bot(token=str(uuid4()), suspended=False)
+        db.add(bot)
+        db.flush()
+
+        # versions from before the pointer, saved within the same second
+        for code in [old, new]:
+            version = CodeVersion(bot.id, save_code(db, code))
+            version.created_at = datetime(2024, 1, 1)
+            db.add(version)
+        db.flush()
+
+        assert bot.latest_version_id is None
+        backfill_latest_versions(db)
+        db.refresh(bot)
+        assert bot.load_latest_code(db) == new
+
+        bot_id, token = bot.id, bot.token
+
+    # nothing listens there, the dispatcher only logs a warning
+    monkeypatch.setenv("SCHEDULER_URL", "http://127.0.0.1:9")
+
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    response = client.post("/update_code", content=old.json(), headers=headers)
+    assert response.json() == {"updated": True}
+
+    with SessionLocal() as db:
+        bot = db.get(Bot, bot_id)
+        assert db.get(CodeVersion, bot.latest_version_id).code_hash == old.digest()
+        assert bot.load_latest_code(db) == old
+        assert latest_code_hashes(db, [bot_id]) == {bot_id: old.digest()}
+
+
+class NotAPlayer:
+    def make_move(self, state):
+        return 0
+
+
+class RaisesOnFirstMove(PlayerAbstract):
+    def make_move(self, state):
+        raise RuntimeError("oops")
+
+
+@pytest.mark.parametrize(
+    "code, reason",
+    [
+        [Code(source="class Broken(:", cls_name="Broken"), "doesn't compile"],
+        [
+            make_code(NotAPlayer, skip_checks=True),
+            "should inherit from PlayerAbstract",
+        ],
+        [make_code(RaisesOnFirstMove), "RuntimeError: oops"],
+    ],
+)
+def test_update_code_preflight(client, code, reason):
+    Base.metadata.create_all(engine)
+    with SessionLocal.begin() as db:
+        bot = Bot(token=str(uuid4()), suspended=False)
+        db.add(bot)
+        db.flush()
+        bot_id, token = bot.id, bot.token
+
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    response = client.post("/update_code", content=code.json(), headers=headers)
+
+    assert response.status_code == 422
+    assert reason in response.json()["detail"]
+
+    with SessionLocal() as db:
+        assert db.get(Bot, bot_id).latest_code_hash(db) is None
+
+
+def test_preflight_plays_by_game_config(client, monkeypatch):
+    from dispatcher import dispatcher
+    from sample_bots.random_player import RandomPlayer
+
+    Base.metadata.create_all(engine)
+    with SessionLocal.begin() as db:
+        bot = Bot(token=str(uuid4()), suspended=False)
+        db.add(bot)
+        db.flush()
+        token = bot.token
+
+    config = GameConfig(board_width=8, win_length=5)
+    configs = []
+    # nothing listens there, the dispatcher only logs a warning
+    monkeypatch.setenv("SCHEDULER_URL", "http://127.0.0.1:9")
+    monkeypatch.setattr(dispatcher, "GAME_CONFIG", config)
+    monkeypatch.setattr(
+        dispatcher, "preflight", lambda code, config: configs.append(config)
+    )
+
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    response = client.post(
+        "/update_code", content=make_code(RandomPlayer).json(), headers=headers
+    )
+
+    assert response.json() == {"updated": True}
+    assert configs == [config]
+
+
+def test_dispatcher_needs_internal_token(monkeypatch):
+    from dispatcher.dispatcher import check_internal_token
+
+    monkeypatch.delenv("INTERNAL_TOKEN", raising=False)
+    with pytest.raises(RuntimeError, match="INTERNAL_TOKEN"):
+        check_internal_token()
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+
+def run_python(code: str, **env) -> str:
+    environ = {key: value for key, value in os.environ.items() if key != "DATABASE_URI"}
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env={**environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def test_game_engine_imports_without_httpx():
+    code = "import sys, botbattle; print('httpx' in sys.modules)"
+    assert run_python(code) == "False"
+
+    code = "from botbattle import AsyncBotClient; print(AsyncBotClient.__name__)"
+    assert run_python(code) == "AsyncBotClient"
+
+    code = "import botbattle; print(botbattle.client.BotClient.__name__)"
+    assert run_python(code) == "BotClient"
+
+
+def test_models_import_without_database():
+    code = (
+        "import sys, common.models, common.database as db;"
+        "print(db.get_engine.cache_info().currsize, 'sqlparse' in sys.modules)"
+    )
+    assert run_python(code) == "0 False"
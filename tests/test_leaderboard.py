@@ -0,0 +1,164 @@
+from uuid import UUID, uuid4
+
+import pytest
+from botbattle import ExceptionInfo, GameLog, LeaderboardEntry, Side, State, Standing
+from common.database import Base, SessionLocal, engine
+from common.leaderboard import Leaderboard, backfill_standings, load_entries
+from common.models import (
+    Bot,
+    BotStanding,
+    Game,
+    Participant,
+    VersionStanding,
+)
+from dispatcher import dispatcher
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def bots():
+    Base.metadata.create_all(engine)
+
+    with SessionLocal.begin() as db:
+        bots = [Bot(token=str(uuid4()), suspended=False) for _ in range(2)]
+        db.add_all(bots)
+        db.flush()
+        for bot in bots:
+            bot.add_version(db, "0" * 64)
+
+        return [(bot.id, bot.latest_version_id) for bot in bots]
+
+
+def add_game(bots) -> UUID:
+    game_id = uuid4()
+    with SessionLocal.begin() as db:
+        db.add(Game(id=game_id))
+        for (bot_id, version_id), side in zip(bots, [Side.BLUE, Side.RED]):
+            db.add(
+                Participant(
+                    game_id=game_id,
+                    bot_id=bot_id,
+                    version_id=version_id,
+                    side=side.value,
+                )
+            )
+    return game_id
+
+
+async def play(bots, winner: Side | None = None, crashed: Side | None = None):
+    exception = crashed and ExceptionInfo(msg="oops", caused_by_side=crashed)
+    await dispatcher.save_game_result(
+        GameLog(
+            game_id=add_game(bots),
+            states=[State(next_side=Side.BLUE)],
+            winner=winner,
+            exception=exception,
+        )
+    )
+
+
+def standings(bots) -> list[tuple]:
+    with SessionLocal() as db:
+        return [
+            (
+                db.get(BotStanding, bot_id).rating,
+                db.get(VersionStanding, version_id).games,
+            )
+            for bot_id, version_id in bots
+        ]
+
+
+async def test_results_update_standings(bots, monkeypatch):
+    monkeypatch.setattr(dispatcher, "leaderboard", Leaderboard(min_interval=0))
+    blue, red = bots
+
+    await play(bots, winner=Side.BLUE)
+    assert standings(bots) == [(1516, 1), (1484, 1)]
+
+    await play(bots)
+    await play(bots, crashed=Side.RED)
+
+    with SessionLocal() as db:
+        winner = db.get(BotStanding, blue[0])
+        loser = db.get(BotStanding, red[0])
+        assert (winner.games, winner.victories, winner.ties) == (3, 1, 1)
+        assert (loser.games, loser.losses, loser.ties, loser.crashes) == (3, 1, 1, 1)
+        # a tie with a weaker bot costs rating, a crash costs none
+        assert 1484 < loser.rating < 1500 < winner.rating < 1516
+
+    client = TestClient(dispatcher.app)
+    response = client.get("/leaderboard/", params={"limit": 100})
+    entries = [LeaderboardEntry(**entry) for entry in response.json()]
+    ours = [entry for entry in entries if entry.bot_id in (blue[0], red[0])]
+
+    assert [entry.bot_id for entry in ours] == [blue[0], red[0]]
+    assert ours[0].rank < ours[1].rank
+    assert ours[1].version_id == red[1]
+    assert ours[1].standing.crash_rate == pytest.approx(1 / 3)
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/leaderboard/", params={"limit": 100}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    await play(bots, winner=Side.RED)
+    response = client.get(
+        "/leaderboard/", params={"limit": 100}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+
+def test_leaderboard_pages():
+    def entry(bot_id: int, rating: float, version_id: int) -> LeaderboardEntry:
+        standing = Standing(
+            games=1,
+            victories=0,
+            losses=0,
+            ties=1,
+            crashes=0,
+            crash_rate=0,
+            rating=rating,
+        )
+        return LeaderboardEntry(
+            rank=0,
+            bot_id=bot_id,
+            standing=standing,
+            version_id=version_id,
+            version_standing=standing,
+        )
+
+    leaderboard = Leaderboard(min_interval=60)
+    leaderboard.update([entry(i, 1500 + i, 10) for i in range(5)])
+
+    page = [LeaderboardEntry.parse_raw(row) for row in leaderboard.page(1, 2)]
+    assert [(e.rank, e.bot_id) for e in page] == [(2, 3), (3, 2)]
+    assert len(leaderboard) == 5
+
+    # a late result of an older version keeps the newer version
+    leaderboard.update([entry(0, 2000, 9)])
+    # ranked again only after min_interval
+    assert LeaderboardEntry.parse_raw(leaderboard.page(0, 1)[0]).bot_id == 4
+
+    leaderboard.min_interval = 0
+    top = LeaderboardEntry.parse_raw(leaderboard.page(0, 1)[0])
+    assert (top.bot_id, top.version_id) == (0, 10)
+
+
+async def test_backfill_standings(bots):
+    await play(bots, winner=Side.RED)
+    await play(bots, crashed=Side.BLUE)
+    expected = standings(bots)
+
+    with SessionLocal.begin() as db:
+        db.query(BotStanding).delete()
+        db.query(VersionStanding).delete()
+
+    with SessionLocal.begin() as db:
+        assert backfill_standings(db) >= 2
+    assert standings(bots) == expected
+
+    with SessionLocal.begin() as db:
+        assert backfill_standings(db) == 0
+        entries = {entry.bot_id: entry for entry in load_entries(db)}
+    assert entries[bots[1][0]].version_id == bots[1][1]
@@ -0,0 +1,68 @@
+import threading
+
+from common import metrics
+from common.database import Base, engine
+from common.profiler import sample
+from dispatcher.dispatcher import app
+from fastapi.testclient import TestClient
+
+
+def test_render():
+    counter = metrics.Counter("test_things", "Things", ("kind",))
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    histogram = metrics.Histogram("test_seconds", "Seconds", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert 'botbattle_test_things_total{kind="a"} 3' in counter.render()
+
+    rendered = histogram.render()
+    assert "# TYPE botbattle_test_seconds histogram" in rendered
+    assert 'botbattle_test_seconds_bucket{le="0.1"} 1' in rendered
+    assert 'botbattle_test_seconds_bucket{le="1.0"} 2' in rendered
+    assert 'botbattle_test_seconds_bucket{le="+Inf"} 3' in rendered
+    assert "botbattle_test_seconds_count 3" in rendered
+
+
+def test_null_metric():
+    null = metrics.NULL_METRIC
+    null.labels("a").inc()
+    with null.time():
+        null.observe(1)
+
+
+def test_metrics_endpoint(monkeypatch):
+    Base.metadata.create_all(engine)
+    monkeypatch.setenv("INTERNAL_TOKEN", "internal")
+    client = TestClient(app)
+    client.get(f"/code/{'0' * 64}", headers={"Authorization": "Bearer internal"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'botbattle_db_query_seconds_count{endpoint="/code/{code_hash}"}' in (
+        response.text
+    )
+
+
+def test_profiler():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_loop)
+    thread.start()
+    try:
+        stacks = sample(0.1, 0.001)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert "busy_loop" in stacks
+
+
+def test_profiler_disabled():
+    assert TestClient(app).get("/debug/profile?seconds=0").status_code == 404
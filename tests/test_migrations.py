@@ -0,0 +1,74 @@
+from uuid import uuid4
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from common.leaderboard import backfill_standings
+from common.migrations import upgrade
+from common.models import Bot, Game, Participant, backfill_latest_versions
+
+# the tables as they were before any column was added to them
+BASELINE_SCHEMA = [
+    """CREATE TABLE code_versions (
+        id INTEGER PRIMARY KEY, created_at DATETIME, bot_id INTEGER,
+        source VARCHAR, cls_name VARCHAR)""",
+    "CREATE TABLE bots (id INTEGER PRIMARY KEY, token VARCHAR, suspended BOOLEAN)",
+    """CREATE TABLE games (
+        id CHAR(32) PRIMARY KEY, created_at DATETIME, winner_id INTEGER)""",
+    """CREATE TABLE states (
+        id INTEGER PRIMARY KEY, game_id CHAR(32), serial_no_within_game INTEGER,
+        board JSON, next_side INTEGER, created_at DATETIME)""",
+    """CREATE TABLE participants (
+        id INTEGER PRIMARY KEY, created_at DATETIME, game_id CHAR(32),
+        bot_id INTEGER, side INTEGER, result VARCHAR, exception VARCHAR)""",
+]
+
+
+def test_upgrade_baseline_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    game_id = uuid4()
+
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(
+            text(
+                "INSERT INTO code_versions (bot_id, source, cls_name)"
+                " VALUES (1, 'class Old: ...', 'Old')"
+            )
+        )
+        connection.execute(text("INSERT INTO bots VALUES (1, 'token', 0)"))
+        connection.execute(text(f"INSERT INTO games (id) VALUES ('{game_id.hex}')"))
+        for side, result in [(1, "victory"), (0, "loss")]:
+            connection.execute(
+                text(
+                    "INSERT INTO participants (game_id, bot_id, side, result)"
+                    f" VALUES ('{game_id.hex}', 1, {side}, '{result}')"
+                )
+            )
+
+    added = upgrade(engine)
+
+    assert {
+        "code_versions.code_hash",
+        "bots.latest_version_id",
+        "games.pending_since",
+        "games.submissions",
+        "participants.version_id",
+        "code_blobs",
+        "bot_standings",
+    } <= set(added)
+    assert "ix_games_pending_since" in {
+        index["name"] for index in inspect(engine).get_indexes("games")
+    }
+
+    # old rows read as rows from before the columns
+    with Session(engine) as db, db.begin():
+        backfill_latest_versions(db)
+        assert backfill_standings(db) == 1
+        assert db.get(Game, game_id).pending_since is None
+        assert db.query(Participant).filter_by(game_id=game_id).count() == 2
+
+        assert db.get(Bot, 1).latest_version_id == 1
+
+    assert upgrade(engine) == []
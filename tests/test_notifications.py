@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime
+
+from botbattle import ParticipantInfo
+from common.notifications import ResultBroker
+
+
+def make_info(result="victory"):
+    return ParticipantInfo(created_at=datetime.now(), result=result)
+
+
+async def test_publish_to_subscribers():
+    broker = ResultBroker()
+
+    with broker.subscribe(1) as first, broker.subscribe(1) as second:
+        with broker.subscribe(2) as other:
+            broker.publish(1, make_info())
+
+            assert (await first.get()).result == "victory"
+            assert (await second.get()).result == "victory"
+            assert other.empty()
+
+    assert not broker.subscribers
+
+
+async def test_slow_subscriber_keeps_newest():
+    broker = ResultBroker(max_queue_size=2)
+
+    with broker.subscribe(1) as queue:
+        for result in ["victory", "loss", "tie"]:
+            broker.publish(1, make_info(result))
+
+        assert [queue.get_nowait().result for _ in range(2)] == ["loss", "tie"]
+
+
+async def test_wait():
+    broker = ResultBroker()
+
+    assert await broker.wait(1, timeout=0.01) == []
+
+    async def publish_later():
+        await asyncio.sleep(0.01)
+        broker.publish(1, make_info("victory"))
+        broker.publish(1, make_info("loss"))
+
+    task = asyncio.create_task(publish_later())
+    infos = await broker.wait(1, timeout=1)
+    await task
+
+    assert [info.result for info in infos] == ["victory", "loss"]
@@ -0,0 +1,92 @@
+import asyncio
+from uuid import uuid4
+
+import httpx
+from botbattle import GameLog, Side, State
+
+from runner.outbox import Outbox
+
+CALLBACK = "http://dispatcher/game_result"
+
+
+async def deliver_until(outbox: Outbox, send, done, timeout: float = 5):
+    worker = asyncio.create_task(outbox.run(send))
+    try:
+        async with asyncio.timeout(timeout):
+            while not done():
+                await asyncio.sleep(0.01)
+    finally:
+        worker.cancel()
+
+
+async def test_outbox_delivers(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    logs = []
+
+    async def send(callback, log, first_attempt_at):
+        logs.append(log)
+        return httpx.Response(200)
+
+    game_ids = [uuid4() for _ in range(20)]
+    for game_id in game_ids:
+        outbox.put(CALLBACK, GameLog(game_id=game_id, states=[State(next_side=Side.BLUE)]))
+
+    await deliver_until(outbox, send, lambda: not outbox.pending())
+
+    assert sorted(log.game_id for log in logs) == sorted(game_ids)
+    assert all(log.trace[-1].name == "runner.outbox" for log in logs)
+
+
+async def test_outbox_retries(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), base_delay=0.01)
+    responses = [
+        httpx.ConnectError("refused"),
+        httpx.Response(503),
+        ValueError("unexpected"),
+        httpx.Response(200),
+    ]
+    attempts = []
+
+    async def send(callback, log, first_attempt_at):
+        attempts.append(first_attempt_at)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    outbox.put(CALLBACK, GameLog(game_id=uuid4(), states=[]))
+    await deliver_until(outbox, send, lambda: not outbox.pending())
+
+    # the first attempt's time is kept for the trace
+    assert len(attempts) == 4 and len(set(attempts)) == 1
+    assert not outbox.dead_letters()
+
+
+async def test_outbox_dead_letters(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, max_attempts=2, base_delay=0.01)
+    statuses = {}
+
+    async def send(callback, log, first_attempt_at):
+        return httpx.Response(statuses[log.game_id])
+
+    rejected, failing = uuid4(), uuid4()
+    statuses = {rejected: 422, failing: 500}
+    for game_id in statuses:
+        outbox.put(CALLBACK, GameLog(game_id=game_id, states=[]))
+
+    await deliver_until(outbox, send, lambda: not outbox.pending())
+
+    dead = {letter["game_id"]: letter for letter in outbox.dead_letters()}
+    assert dead[str(rejected)]["attempts"] == 1
+    assert dead[str(failing)]["attempts"] == 2
+    assert dead[str(failing)]["last_error"].startswith("HTTP 500")
+
+    # dead letters outlive the process and can be sent again
+    outbox = Outbox(path)
+    assert outbox.replay(str(failing)) == 1
+    assert outbox.pending() == 1
+    assert [letter["game_id"] for letter in outbox.dead_letters()] == [str(rejected)]
+
+    statuses[failing] = 200
+    await deliver_until(outbox, send, lambda: not outbox.pending())
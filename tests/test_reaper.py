@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from botbattle import Side
+from common.database import Base, SessionLocal, engine
+from common.models import VOID, Game, Participant
+from scheduler.reaper import reap_stale_games
+
+NOW = datetime(2024, 6, 1)
+
+
+def add_game(db, pending_since: datetime, submissions: int = 1):
+    game = Game(id=uuid4(), pending_since=pending_since, submissions=submissions)
+    db.add(game)
+    for side in Side:
+        db.add(Participant(game_id=game.id, bot_id=1, side=side.value))
+    return game.id
+
+
+def test_reap_stale_games():
+    Base.metadata.create_all(engine)
+
+    with SessionLocal.begin() as db:
+        # games of other tests are pending as of now, so they are not stale
+        stale = [add_game(db, NOW - timedelta(hours=1)) for _ in range(3)]
+        given_up = add_game(db, NOW - timedelta(hours=1), submissions=3)
+        recent = add_game(db, NOW - timedelta(seconds=10))
+
+    resubmit, voided = reap_stale_games(600, now=NOW, batch_size=2)
+
+    assert sorted(resubmit) == sorted(stale)
+    assert voided == 1
+
+    with SessionLocal() as db:
+        for game_id in stale:
+            game = db.get(Game, game_id)
+            assert game.pending_since == NOW and game.submissions == 2
+
+        assert db.get(Game, given_up).pending_since is None
+        results = db.query(Participant.result).filter_by(game_id=given_up)
+        assert {result for result, in results} == {VOID}
+
+        assert db.get(Game, recent).pending_since is not None
+
+    # resubmitted games get a new deadline
+    assert reap_stale_games(600, now=NOW) == ([], 0)
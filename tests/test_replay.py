@@ -0,0 +1,56 @@
+from uuid import uuid4
+
+import pytest
+from botbattle import GameConfig, Replay, ReplayFormatException, Side
+
+
+def play(config: GameConfig, moves: list[int]):
+    state = config.initial_state()
+    states = [state.copy(deep=True)]
+    for move in moves:
+        state.drop_token(move)
+        states.append(state.copy(deep=True))
+    return states
+
+
+def test_roundtrip():
+    replay = Replay(
+        game_id=uuid4(),
+        config=GameConfig(board_width=9, board_height=6, win_length=5),
+        moves=[0, 8, 3, 3],
+        winner=Side.RED,
+    )
+
+    data = replay.to_bytes()
+
+    assert len(data) < 40
+    assert Replay.from_bytes(data) == replay
+
+
+def test_from_states():
+    config = GameConfig(first_side=Side.RED)
+    moves = [3, 3, 4, 2, 6, 6, 5]
+    states = play(config, moves)
+
+    replay = Replay.from_states(uuid4(), states, Side.RED)
+
+    assert replay.moves == moves
+    assert replay.config.first_side == Side.RED
+    assert list(replay.states()) == states
+
+
+def test_empty_game():
+    replay = Replay.from_states(uuid4(), [])
+    assert Replay.from_bytes(replay.to_bytes()).moves == []
+
+
+@pytest.mark.parametrize("data", [b"", b"XYZ" + bytes(30)])
+def test_invalid_data(data):
+    with pytest.raises(ReplayFormatException):
+        Replay.from_bytes(data)
+
+
+def test_truncated():
+    data = Replay(game_id=uuid4(), moves=[1, 2, 3]).to_bytes()
+    with pytest.raises(ReplayFormatException):
+        Replay.from_bytes(data[:-1])
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from botbattle import Replay, Side, State
+from common.database import Base, SessionLocal, engine
+from common.models import Game, StateModel
+from common.replays import load_replay
+from common.retention import compact_states
+
+NOW = datetime(2024, 6, 1)
+
+
+def add_game(db, created_at: datetime, moves: list[int], win_length: int = 4):
+    game_id = uuid4()
+    db.add(Game(id=game_id, win_length=win_length))
+    state = State(next_side=Side.BLUE, win_length=win_length)
+
+    for i in range(len(moves) + 1):
+        row = StateModel(game_id, i, state.copy(deep=True).board, state.next_side.value)
+        row.created_at = created_at
+        db.add(row)
+        if i < len(moves):
+            state.drop_token(moves[i])
+
+    return game_id
+
+
+def count_states(db, game_id) -> int:
+    return db.query(StateModel).filter_by(game_id=game_id).count()
+
+
+def test_compact_states():
+    Base.metadata.create_all(engine)
+
+    with SessionLocal.begin() as db:
+        old_games = [
+            add_game(db, NOW - timedelta(days=days), [3, 4, 3])
+            for days in [40, 35, 35, 31]
+        ]
+        new_game = add_game(db, NOW - timedelta(days=1), [0, 1])
+
+    assert compact_states(30, now=NOW, batch_size=2) >= len(old_games)
+
+    with SessionLocal() as db:
+        assert count_states(db, new_game) == 3
+
+        for game_id in old_games:
+            assert count_states(db, game_id) == 0
+            assert Replay.from_bytes(load_replay(db, game_id)).moves == [3, 4, 3]
+
+
+def test_compacted_replay_keeps_variant():
+    Base.metadata.create_all(engine)
+
+    with SessionLocal.begin() as db:
+        # three in a column wins with a win length of three only
+        game_id = add_game(db, NOW - timedelta(days=40), [0, 1, 0, 1, 0], 3)
+
+    compact_states(30, now=NOW)
+
+    with SessionLocal() as db:
+        replay = Replay.from_bytes(load_replay(db, game_id))
+    assert (replay.config.win_length, replay.winner) == (3, Side.BLUE)
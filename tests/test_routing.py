@@ -0,0 +1,45 @@
+import collections
+
+from scheduler.routing import HashRing, RunnerRouter
+
+RUNNERS = [f"http://runner-{i}/" for i in range(4)]
+KEYS = [f"{i:064x}" for i in range(2000)]
+
+
+def test_keys_spread_over_nodes():
+    ring = HashRing(RUNNERS)
+    counts = collections.Counter(ring.lookup(key)[0] for key in KEYS)
+
+    assert set(counts) == set(RUNNERS)
+    assert min(counts.values()) > len(KEYS) / len(RUNNERS) / 2
+    assert all(sorted(ring.lookup(key)) == sorted(RUNNERS) for key in KEYS[:10])
+
+
+def test_joining_node_moves_few_keys():
+    ring = HashRing(RUNNERS)
+    before = {key: ring.lookup(key)[0] for key in KEYS}
+
+    ring.add("http://runner-new/")
+    after = {key: ring.lookup(key)[0] for key in KEYS}
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    # only to the new node, about a fifth of the keys
+    assert {after[key] for key in moved} == {"http://runner-new/"}
+    assert len(moved) < len(KEYS) / 3
+
+    # and back when it leaves
+    ring.remove("http://runner-new/")
+    assert {key: ring.lookup(key)[0] for key in KEYS} == before
+
+
+def test_router_skips_runners_that_are_down():
+    router = RunnerRouter(RUNNERS, retry_seconds=60)
+    first, second, *_ = router.route(KEYS[0])
+
+    router.mark_down(first)
+    route = router.route(KEYS[0])
+    assert (route[0], route[-1]) == (second, first)
+
+    router.retry_seconds = 0
+    router.mark_down(first)
+    assert router.route(KEYS[0])[0] == first
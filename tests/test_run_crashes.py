@@ -1,10 +1,13 @@
 import time
 
 import pytest
-from botbattle import PlayerAbstract
+from botbattle import GameConfig, PlayerAbstract, players, sandbox
 from botbattle.players import make_code
 from runner.runner import (
     ERROR_MESSAGES,
+    BotProcessDiedException,
+    CpuLimitExceededException,
+    MemoryLimitExceededException,
     MoveTookTooLongException,
     InvalidMoveException,
     MoveBrakesRulesException,
@@ -18,7 +21,15 @@ from runner.runner import (
 class Hangs(PlayerAbstract):
     def make_move(self, board):
         import time
-        time.sleep(0.2)
+        time.sleep(1)
+
+
+class BurnsCpu(PlayerAbstract):
+    def make_move(self, board):
+        import time
+        start = time.thread_time()
+        while time.thread_time() - start < 0.3:
+            pass
 
 
 class InvalidMove(PlayerAbstract):
@@ -31,6 +42,11 @@ class Raises(PlayerAbstract):
         raise RuntimeError
 
 
+class RaisesSystemExit(PlayerAbstract):
+    def make_move(self, board):
+        raise SystemExit
+
+
 class MoveBrakesRules(PlayerAbstract):
     def make_move(self, board):
         return 0
@@ -43,7 +59,7 @@ class InitFails(PlayerAbstract):
 class InitHangs(PlayerAbstract):
     def __init__(self, side):
         import time
-        time.sleep(0.2)
+        time.sleep(1)
 
     def make_move(self, board):
         ...
@@ -53,8 +69,10 @@ class InitHangs(PlayerAbstract):
     "player, expected_exception, tb_info, move_info",
     [
         [Hangs, MoveTookTooLongException, False, False],
+        [BurnsCpu, MoveTookTooLongException, False, False],
         [InvalidMove, InvalidMoveException, True, True],
         [Raises, RaisesException, True, False],
+        [RaisesSystemExit, RaisesException, True, False],
         [MoveBrakesRules, MoveBrakesRulesException, True, True],
         [InitFails, FailedToInitializeException, True, False],
         [InitHangs, InitializationTookTooLongException, False, False]
@@ -72,5 +90,127 @@ async def test_run_crashes(player, expected_exception, tb_info, move_info):
     if tb_info:
         assert "\nTraceback" in exc.msg
 
-    if not move_info:
+    if move_info:
+        assert exc.move is not None
+    else:
         assert exc.move is None
+
+
+class SlowStart(PlayerAbstract):
+    def make_move(self, state):
+        import time
+        start = time.thread_time()
+        while time.thread_time() - start < 0.03:
+            pass
+        return next(i for i in range(state.len_x()) if not state.column_full(i))
+
+
+async def test_game_budget_exhausted():
+    config = GameConfig(move_timeout=0.05, game_budget=0.1)
+    log_dict = await get_game_results(
+        make_code(SlowStart), make_code(SlowStart), config
+    )
+
+    assert ERROR_MESSAGES[MoveTookTooLongException] in log_dict["exception"].msg
+    # each side has time for about three moves
+    assert 5 <= len(log_dict["move_times"]) <= 9
+
+
+class EatsMemory(PlayerAbstract):
+    def make_move(self, state):
+        return len(bytearray(2**40))
+
+
+class Exits(PlayerAbstract):
+    def make_move(self, state):
+        import os
+        os._exit(0)
+
+
+class BurnsCpuInInit(PlayerAbstract):
+    def __init__(self, side):
+        import time
+        start = time.process_time()
+        while time.process_time() - start < 3:
+            pass
+
+    def make_move(self, state):
+        ...
+
+
+class HoldsGil(PlayerAbstract):
+    def make_move(self, state):
+        # a loop in C, the other threads of the bot's process don't get to run
+        return sum(range(10**12))
+
+
+@pytest.mark.skipif(sandbox.BOT_SANDBOX != "process", reason="needs bot processes")
+async def test_bot_holding_gil_times_out():
+    start = time.monotonic()
+    log_dict = await get_game_results(make_code(HoldsGil), make_code(HoldsGil))
+
+    assert ERROR_MESSAGES[MoveTookTooLongException] in log_dict["exception"].msg
+    # given up on after the move's wall time, not after PROCESS_GRACE_SECONDS
+    assert time.monotonic() - start < sandbox.PROCESS_GRACE_SECONDS
+
+
+@pytest.mark.parametrize(
+    "player, expected_exception",
+    [
+        [EatsMemory, MemoryLimitExceededException],
+        [Exits, BotProcessDiedException],
+    ],
+)
+async def test_limits(player, expected_exception):
+    log_dict = await get_game_results(make_code(player), make_code(player))
+
+    assert ERROR_MESSAGES[expected_exception] in log_dict["exception"].msg
+
+
+async def test_cpu_limit(monkeypatch):
+    monkeypatch.setattr(sandbox, "BOT_CPU_SECONDS", 1)
+    config = GameConfig(init_timeout=5)
+
+    log_dict = await get_game_results(
+        make_code(BurnsCpuInInit), make_code(BurnsCpuInInit), config
+    )
+
+    assert ERROR_MESSAGES[CpuLimitExceededException] in log_dict["exception"].msg
+
+
+class ReadsEnvironment(PlayerAbstract):
+    def make_move(self, state):
+        import os
+
+        names = set(os.environ) - {"PATH", "HOME", "LANG", "LC_ALL", "TZ"}
+        if names - {"BOTBATTLE_BOOK"}:
+            raise RuntimeError(f"sees {sorted(names)}")
+        return 0
+
+
+@pytest.mark.skipif(sandbox.BOT_SANDBOX != "process", reason="needs bot processes")
+async def test_bot_process_environment(monkeypatch):
+    monkeypatch.setenv("INTERNAL_TOKEN", "secret")
+    sandbox.warm_up()  # the fork server has the secret too, if it starts now
+
+    log_dict = await get_game_results(
+        make_code(ReadsEnvironment), make_code(ReadsEnvironment)
+    )
+
+    # until column 0 is full and the move breaks the rules
+    assert "sees" not in log_dict["exception"].msg
+    assert ERROR_MESSAGES[MoveBrakesRulesException] in log_dict["exception"].msg
+
+
+class Overwrites(PlayerAbstract):
+    def make_move(self, state):
+        global PlayerAbstract
+        PlayerAbstract = None
+        return 0
+
+
+async def test_bots_have_own_namespaces(monkeypatch):
+    monkeypatch.setattr(sandbox, "BOT_SANDBOX", "thread")
+    await get_game_results(make_code(Overwrites), make_code(Overwrites))
+
+    assert players.PlayerAbstract is PlayerAbstract
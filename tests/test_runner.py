@@ -1,7 +1,10 @@
 from uuid import uuid4
 
-from botbattle import make_code, RunGameTask
+import pytest
 
+from botbattle import GameConfig, make_code, RunGameTask, Side
+
+from runner.benchmark import run_direct
 from runner.runner import get_game_results, accept_task
 from sample_bots.random_player import RandomPlayer
 
@@ -17,7 +20,103 @@ async def test_accept_task():
     code = make_code(RandomPlayer)
 
     task = RunGameTask(
-        game_id=uuid4(), callback="https://test.com/", blue_code=code, red_code=code
+        game_id=uuid4(),
+        callback="https://test.com/",
+        code_url="https://test.com/code",
+        blue_code=code.digest(),
+        red_code=code.digest(),
     )
 
     await accept_task(task, BackgroundTasks())
+
+
+async def test_get_game_results_with_config():
+    code = make_code(RandomPlayer)
+    config = GameConfig(
+        board_width=5, board_height=4, win_length=3, first_side=Side.RED
+    )
+
+    results = await get_game_results(code, code, config)
+
+    first, last = results["states"][0], results["states"][-1]
+    assert first.next_side == Side.RED
+    assert (last.len_x(), last.len_y()) == (5, 4)
+    assert results["winners"]
+
+
+async def test_move_times():
+    code = make_code(RandomPlayer)
+
+    results = await get_game_results(code, code)
+
+    assert len(results["move_times"]) == len(results["states"]) - 1
+    assert all(0 <= move_time < 0.1 for move_time in results["move_times"])
+
+
+def test_benchmark_direct():
+    report = run_direct("first_free", games=4, concurrency=2)
+
+    assert report["games"] == 4
+    assert report["games_per_second"] > 0
+    assert report["timeout_rate"] == 0
+
+
+async def test_run_game_skips_unparsable_code(monkeypatch):
+    import httpx
+    from runner import runner
+    from runner.code_cache import CodeCache
+
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json={"unexpected": "reply"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(runner, "code_cache", CodeCache(http_client=client))
+    put = []
+    monkeypatch.setattr(runner.outbox, "put", lambda *args: put.append(args))
+
+    task = RunGameTask(
+        game_id=uuid4(),
+        callback="https://test.com/",
+        code_url="https://test.com/code",
+        blue_code="a" * 64,
+        red_code="b" * 64,
+    )
+    await runner.run_game(task)
+
+    assert put == []
+
+
+async def test_run_game_reports_refused_code(monkeypatch, caplog):
+    import httpx
+    from runner import runner
+    from runner.code_cache import CodeCache
+
+    def handler(request: httpx.Request):
+        return httpx.Response(403)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(runner, "code_cache", CodeCache(http_client=client))
+    put = []
+    monkeypatch.setattr(runner.outbox, "put", lambda *args: put.append(args))
+
+    task = RunGameTask(
+        game_id=uuid4(),
+        callback="https://test.com/",
+        code_url="https://test.com/code",
+        blue_code="a" * 64,
+        red_code="b" * 64,
+    )
+    await runner.run_game(task)
+
+    assert put == []
+    assert [r.levelname for r in caplog.records if "INTERNAL_TOKEN" in r.message] == [
+        "ERROR"
+    ]
+
+
+def test_runner_needs_internal_token(monkeypatch):
+    from runner import runner
+
+    monkeypatch.delenv("INTERNAL_TOKEN", raising=False)
+    with pytest.raises(RuntimeError, match="INTERNAL_TOKEN"):
+        runner.check_internal_token()
@@ -0,0 +1,226 @@
+import asyncio
+import os
+from uuid import uuid4
+
+import httpx
+import pytest
+
+os.environ.setdefault("RUNNER_URL", "http://runner/")
+os.environ.setdefault("DISPATCHER_URL", "http://dispatcher")
+
+from scheduler import scheduler  # noqa: E402
+
+
+async def test_scheduling_requests_coalesce(monkeypatch):
+    rounds = []
+
+    async def run_round():
+        rounds.append(len(rounds))
+        await asyncio.sleep(0.05)
+        # a request during a round starts one more round
+        if len(rounds) == 1:
+            await scheduler.scheduling_requested()
+        return 0
+
+    monkeypatch.setattr(scheduler, "run_round", run_round)
+    monkeypatch.setattr(scheduler, "ROUND_DEBOUNCE_SECONDS", 0.05)
+    monkeypatch.setattr(scheduler, "round_requested", asyncio.Event())
+
+    loop = asyncio.create_task(scheduler.run_scheduling_loop())
+    try:
+        for _ in range(10):
+            await scheduler.scheduling_requested()
+        await asyncio.sleep(0.5)
+    finally:
+        loop.cancel()
+
+    assert rounds == [0, 1]
+
+
+def test_create_games():
+    from botbattle import make_code
+    from common.database import Base, SessionLocal, engine
+    from common.models import Bot, Game, Participant, save_code
+    from sample_bots.random_player import RandomPlayer
+
+    Base.metadata.create_all(engine)
+    code = make_code(RandomPlayer)
+
+    with SessionLocal.begin() as db:
+        bots = [Bot(token="create_games", suspended=False) for _ in range(3)]
+        db.add_all(bots)
+        db.flush()
+        for bot in bots:
+            bot.add_version(db, save_code(db, code))
+
+        pairings = [(bots[0], bots[1]), (bots[1], bots[2]), (bots[2], bots[0])]
+        tasks = scheduler.create_games(db, pairings)
+        pairings = [(blue.id, red.id) for blue, red in pairings]
+
+    assert [task.blue_code for task in tasks] == [code.digest()] * 3
+
+    with SessionLocal() as db:
+        for task, (blue, red) in zip(tasks, pairings):
+            assert db.get(Game, task.game_id).pending_since is not None
+            sides = dict(
+                db.query(Participant.side, Participant.bot_id).filter_by(
+                    game_id=task.game_id
+                )
+            )
+            assert sides == {1: blue, 0: red}
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [
+        lambda request: httpx.ConnectError("refused", request=request),
+        lambda request: httpx.ReadTimeout("timed out", request=request),
+        lambda request: httpx.Response(500),
+        lambda request: httpx.Response(503),
+    ],
+)
+async def test_submit_task_falls_back_to_next_runner(monkeypatch, failure):
+    from botbattle import RunGameTask
+    from scheduler.routing import RunnerRouter
+
+    urls = ["http://runner-1/", "http://runner-2/"]
+    router = RunnerRouter(urls)
+    monkeypatch.setattr(scheduler, "router", router)
+    monkeypatch.setattr(
+        scheduler,
+        "rate_limiters",
+        {url: scheduler.AdaptiveRateLimiter(6000) for url in urls},
+    )
+
+    task = scheduler.build_task(uuid4(), "a" * 64, "b" * 64)
+    down, up = router.route(task.blue_code)
+    posted = []
+
+    def handler(request: httpx.Request):
+        if str(request.url) == down:
+            response = failure(request)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        posted.append(RunGameTask.parse_raw(request.content))
+        return httpx.Response(200)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        assert await scheduler.submit_task(client, task)
+
+    assert [t.game_id for t in posted] == [task.game_id]
+    assert router.route(task.blue_code) == [up, down]
+
+
+async def test_round_outlives_a_failed_runner(monkeypatch):
+    from common.models import Bot
+    from scheduler.routing import RunnerRouter
+
+    urls = ["http://runner-1/", "http://runner-2/"]
+    router = RunnerRouter(urls)
+    monkeypatch.setattr(scheduler, "router", router)
+
+    pairings = [(Bot(id=i, token=str(i)), Bot(id=100 + i)) for i in range(8)]
+    tasks = [scheduler.build_task(uuid4(), f"{i:064x}", "b" * 64) for i in range(8)]
+    failing = router.route(tasks[0].blue_code)[0]
+    deadlines = []
+
+    async def submit_task(client, task):
+        await asyncio.sleep(0)
+        if router.route(task.blue_code)[0] == failing:
+            raise RuntimeError("oops")
+        # the client is still open while any runner's games are submitted
+        assert not client.is_closed
+        return True
+
+    monkeypatch.setattr(scheduler, "schedule_games", lambda db: pairings)
+    monkeypatch.setattr(scheduler, "create_games", lambda db, pairings: tasks)
+    monkeypatch.setattr(scheduler, "submit_task", submit_task)
+    monkeypatch.setattr(scheduler, "restart_deadlines", deadlines.extend)
+
+    assert await scheduler.run_round() == len(pairings)
+
+    submitted = {
+        task.game_id for task in tasks if router.route(task.blue_code)[0] != failing
+    }
+    assert submitted and set(deadlines) == submitted
+    assert not scheduler.unsubmitted
+
+
+async def test_resubmit_plays_the_scheduled_versions(monkeypatch):
+    import httpx
+    from botbattle import Code, RunGameTask, make_code
+    from common.database import Base, SessionLocal, engine
+    from common.models import Bot, save_code
+    from sample_bots.random_player import RandomPlayer
+    from scheduler.routing import RunnerRouter
+
+    Base.metadata.create_all(engine)
+    old_code = make_code(RandomPlayer)
+    new_code = Code(source=old_code.source + "\n", cls_name=old_code.cls_name)
+
+    with SessionLocal.begin() as db:
+        bots = [Bot(token="resubmit", suspended=False) for _ in range(2)]
+        db.add_all(bots)
+        db.flush()
+        for bot in bots:
+            bot.add_version(db, save_code(db, old_code))
+        task = scheduler.create_games(db, [bots])[0]
+
+        # a new version uploaded before the game is reaped
+        for bot in bots:
+            bot.add_version(db, save_code(db, new_code))
+
+    url = "http://runner/"
+    monkeypatch.setattr(scheduler, "router", RunnerRouter([url]))
+    monkeypatch.setattr(
+        scheduler, "rate_limiters", {url: scheduler.AdaptiveRateLimiter(6000)}
+    )
+    posted = []
+
+    def handler(request: httpx.Request):
+        posted.append(RunGameTask.parse_raw(request.content))
+        return httpx.Response(200)
+
+    client = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx,
+        "AsyncClient",
+        lambda **kwargs: client(transport=httpx.MockTransport(handler)),
+    )
+    await scheduler.resubmit_games([task.game_id])
+
+    assert [(t.blue_code, t.red_code) for t in posted] == [
+        (old_code.digest(), old_code.digest())
+    ]
+
+
+async def test_capacity_frees_up(monkeypatch):
+    import httpx
+
+    capacities = iter([0, 0, 2])
+    requested = []
+
+    def handler(request: httpx.Request):
+        assert request.url.path == "/capacity"
+        requested.append(scheduler.round_requested.is_set())
+        return httpx.Response(200, json={"free": next(capacities, 2)})
+
+    client = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx,
+        "AsyncClient",
+        lambda **kwargs: client(transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(scheduler, "RUNNER_URLS", ["http://runner/"])
+    monkeypatch.setattr(scheduler, "CAPACITY_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(scheduler, "round_requested", asyncio.Event())
+
+    loop = asyncio.create_task(scheduler.run_capacity_loop())
+    try:
+        await asyncio.wait_for(scheduler.round_requested.wait(), 1)
+    finally:
+        loop.cancel()
+
+    # requested once the runner had room, not while it was full
+    assert requested[:3] == [False, False, False]
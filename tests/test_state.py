@@ -1,5 +1,5 @@
 import pytest
-from botbattle import Side, State, Vector
+from botbattle import GameConfig, Side, State, Vector
 
 
 def test_lines():
@@ -192,3 +192,33 @@ def test_drop_token():
 
     with pytest.raises(Exception):
         state.drop_token(0, Side.RED)
+
+
+def test_win_length():
+    board = [
+        [None, None, None, None, None],
+        [None, None, None, None, None],
+        [None, None, None, None, None],
+        [None, None, Side.BLUE, None, None],
+        [Side.RED, Side.RED, Side.RED, Side.BLUE, None],
+    ]
+
+    assert State(board=board, next_side=Side.BLUE).winners() == []
+    assert State(board=board, next_side=Side.BLUE, win_length=3).winners() == [
+        Side.RED
+    ]
+    assert State(board=board, next_side=Side.BLUE, win_length=2).winners() == [
+        Side.RED,
+        Side.BLUE,
+    ]
+
+
+def test_game_config_initial_state():
+    state = GameConfig(
+        board_width=8, board_height=6, win_length=5, first_side=Side.RED
+    ).initial_state()
+
+    assert state.len_x() == 8
+    assert state.len_y() == 6
+    assert state.win_length == 5
+    assert state.next_side == Side.RED
@@ -0,0 +1,50 @@
+from uuid import uuid4
+
+from botbattle import Span
+from common.tracing import TraceCollector, load_traces, report, span, stage_durations
+
+
+def sample_trace(offset: float = 0) -> list[Span]:
+    return [
+        Span(name="scheduler.rate_limit", start=offset, end=offset + 1),
+        Span(name="runner.play", start=offset + 1.5, end=offset + 3.5),
+        Span(name="dispatcher.save", start=offset + 4, end=offset + 4.25),
+    ]
+
+
+def test_span():
+    trace = []
+    with span(trace, "stage"):
+        pass
+
+    assert trace[0].name == "stage"
+    assert trace[0].start <= trace[0].end
+
+
+def test_stage_durations():
+    durations = stage_durations(sample_trace())
+
+    assert durations["runner.play"] == 2
+    assert durations["gap before runner.play"] == 0.5
+    assert durations["gap before dispatcher.save"] == 0.5
+    assert durations["total"] == 4.25
+
+
+def test_collect_and_report(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    collector = TraceCollector(path)
+    for i in range(3):
+        collector.collect(uuid4(), sample_trace(i * 10))
+
+    traces = load_traces(path)
+    assert traces == [sample_trace(i * 10) for i in range(3)]
+
+    lines = report(traces).splitlines()
+    assert lines[0] == "3 games"
+    assert lines[-1].split()[0] == "total"
+    assert any(line.split()[:1] == ["runner.play"] for line in lines)
+
+
+def test_collector_disabled(tmp_path, monkeypatch):
+    monkeypatch.delenv("TRACE_FILE", raising=False)
+    TraceCollector().collect(uuid4(), sample_trace())
@@ -0,0 +1,60 @@
+from uuid import uuid4
+
+import pytest
+from botbattle import ExceptionInfo, GameLog, Side, Span, State, wire
+
+
+def sample_log(**kwargs) -> GameLog:
+    state = State(next_side=Side.BLUE)
+    states = [state.copy(deep=True)]
+    for col in [3, 3, 4]:
+        state.drop_token(col)
+        states.append(state.copy(deep=True))
+    return GameLog(game_id=uuid4(), states=states, move_times=[0.1] * 3, **kwargs)
+
+
+@pytest.mark.parametrize("media_type", wire.supported_media_types())
+@pytest.mark.parametrize(
+    "log",
+    [
+        sample_log(winner=Side.RED),
+        sample_log(trace=[Span(name="runner.play", start=1.5, end=2.25)]),
+        sample_log(
+            exception=ExceptionInfo(msg="boom", caused_by_side=Side.BLUE, move=9)
+        ),
+        GameLog(game_id=uuid4(), states=[]),
+    ],
+)
+def test_roundtrip(media_type, log):
+    data = wire.encode_game_log(log, media_type)
+    decoded = wire.decode_game_log(data, media_type)
+
+    assert decoded.json() == log.json()
+
+
+def test_msgpack_is_compact():
+    if wire.MSGPACK not in wire.supported_media_types():
+        pytest.skip("msgpack is not installed")
+
+    log = sample_log()
+    assert len(wire.encode_game_log(log, wire.MSGPACK)) * 3 < len(log.json())
+
+
+def test_malformed():
+    with pytest.raises(wire.WireFormatException):
+        wire.decode_game_log(b"{}", "text/plain")
+
+    if wire.MSGPACK in wire.supported_media_types():
+        data = bytearray(wire.encode_game_log(sample_log(), wire.MSGPACK))
+        with pytest.raises(wire.WireFormatException):
+            wire.decode_game_log(bytes(data[:-20]), wire.MSGPACK)
+
+
+def test_negotiate():
+    assert wire.negotiate("text/plain") == wire.JSON
+    assert wire.negotiate(None) == wire.JSON
+    assert wire.negotiate("application/json; charset=utf-8") == wire.JSON
+    assert (
+        wire.negotiate(", ".join(wire.supported_media_types()))
+        == wire.supported_media_types()[0]
+    )